@@ -0,0 +1,492 @@
+# -*- coding: utf-8 -*-
+
+"""pythtml benchmarks.
+
+Each scenario builds documents of several sizes and times one operation on them:
+construction, rendering, encoding, or lookup.  Results report the best time of several
+repeats, throughput in nodes and characters (or bytes) per second, and peak memory
+allocated during one run of the operation, as measured by tracemalloc.
+
+From the root of the repository:
+
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py --output new.json --compare results.json
+
+Use --scenario (repeatable) to select scenarios, and --sizes to choose document sizes.
+"""
+
+import argparse
+import gc
+import itertools
+import json
+import pickle
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from pythtml import *  # pylint: disable=wildcard-import,unused-wildcard-import
+from pythtml.compress import iter_compressed
+from pythtml.serialize import dumps, loads
+
+DEFAULT_SIZES = [100, 1000, 10000]
+
+
+class Scenario(NamedTuple):
+    """A benchmark: setup(size) returns the argument of operation; nodes(size) returns the
+    number of nodes processed by one run of operation."""
+
+    name: str
+    description: str
+    setup: Callable[[int], Any]
+    operation: Callable[[Any], Any]
+    nodes: Callable[[int], int]
+
+
+def _table(rows: int) -> Table:
+    return Table(
+        Thead(Tr(*(Th("column %d" % i) for i in range(8)))),
+        Tbody(
+            *(
+                Tr(*(Td("%d.%d" % (row, i), class_="cell") for i in range(8)))
+                for row in range(rows)
+            )
+        ),
+    )
+
+
+def _table_rows(rows: int) -> Table:
+    return Table.from_rows(
+        (tuple("%d.%d" % (row, i) for i in range(8)) for row in range(rows)),
+        columns=["column %d" % i for i in range(8)],
+    )
+
+
+def _rendered_table(rows: int) -> Table:
+    table = _table(rows)
+    str(table)
+    str(table)
+    return table
+
+
+def _compressed_table(rows: int) -> Table:
+    table = _rendered_table(rows)
+    b"".join(iter_compressed(table))
+    return table
+
+
+def _status_table(rows: int, first: int = 0) -> Table:
+    return Table(
+        Tbody(
+            *(
+                Tr(
+                    Td(first + row),
+                    Td(Span(class_="icon icon-ok"), " ok"),
+                    Td("\u2014"),
+                    Td(Br()),
+                    Td("\u2014", class_="empty"),
+                )
+                for row in range(rows)
+            )
+        ),
+    )
+
+
+# first row numbers of the tables interned by _interned_status_table, which differ so that
+# they do not share the cached markup of the previous ones.
+_first_rows = itertools.count(0, 1 << 32)
+
+
+def _interned_status_table(rows: int) -> Table:
+    return intern(_status_table(rows, next(_first_rows)))
+
+
+def _nested(depth: int) -> Div:
+    root = element = Div()
+    for i in range(depth):
+        child = Div(Span("level %d" % i), class_="level")
+        element.append(child)
+        element = child
+    return root
+
+
+def _form(fields: int) -> Form:
+    return Form(
+        *(
+            Div(
+                Label("Field %d" % i, for_="field-%d" % i),
+                Input(
+                    type="text",
+                    id="field-%d" % i,
+                    name="field_%d" % i,
+                    value='value "%d" & <more>' % i,
+                    placeholder="enter field %d" % i,
+                    required=True,
+                    data_index=i,
+                ),
+                class_="form-group",
+            )
+            for i in range(fields)
+        ),
+        action="/submit",
+        method="post",
+    )
+
+
+_RAW_BLOCK = "<section><h2>Section</h2><p>%s</p></section>" % ("lorem ipsum " * 40)
+
+
+def _raw_page(blocks: int) -> Body:
+    return Body(
+        *(Div(Raw(_RAW_BLOCK), Script(Raw("var x = %d;" % i))) for i in range(blocks))
+    )
+
+
+def _comments(count: int) -> AutoEscape:
+    return AutoEscape(
+        Div(
+            *(
+                Article(H2("Comment %d" % i), P("I <3 this & that, %d times" % i))
+                for i in range(count)
+            )
+        )
+    )
+
+
+def _html(paragraphs: int, encoding: str, text: str) -> Html:
+    return Html(
+        Head(Title(text)),
+        Body(*(P(text, " ", i, class_="para") for i in range(paragraphs))),
+        encoding=encoding,
+    )
+
+
+def _render_into(element: Html) -> bytearray:
+    buffer = bytearray(element.byte_length())
+    element.render_into(buffer)
+    return buffer
+
+
+def _find_ids(tree: Any) -> List[Any]:
+    root, size = tree
+    return [root.find_by_id("cell-%d" % i) for i in range(0, size, max(1, size // 50))]
+
+
+def _id_tree(size: int):
+    rows = max(1, size // 4)
+    root = Tbody(
+        *(
+            Tr(*(Td(i, id="cell-%d" % (row * 4 + i)) for i in range(4)))
+            for row in range(rows)
+        )
+    )
+    return (root, size)
+
+
+def _layout(links: int) -> Html:
+    layout = Html(
+        Head(Title("layout")),
+        Body(
+            Header(Ul(*(Li(A(i, href="/%d" % i)) for i in range(links)))),
+            Div(id="main"),
+            Footer(P("footer")),
+        ),
+    )
+    str(layout)
+    str(layout)
+    # the first request builds the index of the layout, which later ones reuse.
+    _fill_clone(layout)
+    return layout
+
+
+def _fill_clone(layout: Html) -> str:
+    page = layout.clone()
+    page.find_by_id("main").append(P("content"))
+    return str(page)
+
+
+SCENARIOS = [
+    Scenario(
+        "table-build",
+        "construct a table of size rows and 8 columns",
+        lambda size: size,
+        _table,
+        lambda size: size * 9,
+    ),
+    Scenario(
+        "table-render",
+        "render a table of size rows and 8 columns",
+        _table,
+        str,
+        lambda size: size * 9,
+    ),
+    Scenario(
+        "table-render-minified",
+        "render a table of size rows and 8 columns with minify=True",
+        _table,
+        lambda table: table.render(minify=True),
+        lambda size: size * 9,
+    ),
+    Scenario(
+        "table-from-rows",
+        "build and render a table of size rows and 8 columns with Table.from_rows",
+        lambda size: size,
+        lambda size: str(_table_rows(size)),
+        lambda size: size * 9,
+    ),
+    Scenario(
+        "table-render-cached",
+        "render a table of size rows again after two renders",
+        _rendered_table,
+        str,
+        lambda size: size * 9,
+    ),
+    Scenario(
+        "table-gzip",
+        "render a table of size rows and 8 columns compressed by iter_compressed",
+        _table,
+        lambda table: b"".join(iter_compressed(table)),
+        lambda size: size * 9,
+    ),
+    Scenario(
+        "table-gzip-cached",
+        "render a table of size rows compressed after two renders and a compressed one",
+        _compressed_table,
+        lambda table: b"".join(iter_compressed(table)),
+        lambda size: size * 9,
+    ),
+    Scenario(
+        "repetitive-render",
+        "render a table of size rows of mostly identical cells",
+        _status_table,
+        str,
+        lambda size: size * 9,
+    ),
+    Scenario(
+        "repetitive-render-interned",
+        "render a table of size rows of mostly identical cells, interned",
+        _interned_status_table,
+        str,
+        lambda size: size * 9,
+    ),
+    Scenario(
+        "table-loads",
+        "rebuild a table of size rows and 8 columns serialized by pythtml.serialize",
+        lambda size: dumps(_table(size)),
+        loads,
+        lambda size: size * 9,
+    ),
+    Scenario(
+        "table-unpickle",
+        "rebuild a table of size rows and 8 columns from a pickle, for comparison",
+        lambda size: pickle.dumps(_table(size), pickle.HIGHEST_PROTOCOL),
+        pickle.loads,
+        lambda size: size * 9,
+    ),
+    Scenario(
+        "deep-render",
+        "render divs nested size levels deep",
+        _nested,
+        str,
+        lambda size: size * 2,
+    ),
+    Scenario(
+        "form-render",
+        "render a form of size fields with many attributes",
+        _form,
+        str,
+        lambda size: size * 3,
+    ),
+    Scenario(
+        "escape-render",
+        "render size comments with text escaped by AutoEscape",
+        _comments,
+        str,
+        lambda size: size * 3,
+    ),
+    Scenario(
+        "raw-render",
+        "render a page of size blocks of raw markup",
+        _raw_page,
+        str,
+        lambda size: size * 4,
+    ),
+    Scenario(
+        "layout-clone",
+        "clone a layout of size links, fill in one element, and render it, once warm",
+        _layout,
+        _fill_clone,
+        lambda size: size * 3,
+    ),
+    Scenario(
+        "find-by-id",
+        "build the id index of a tree of size cells and look up 50 ids",
+        _id_tree,
+        _find_ids,
+        lambda size: size,
+    ),
+    Scenario(
+        "bytes-utf-8",
+        "encode a document of size paragraphs in utf-8",
+        lambda size: _html(size, "utf-8", "испытание текста"),
+        bytes,
+        lambda size: size * 2,
+    ),
+    Scenario(
+        "bytes-render-into",
+        "measure a document of size paragraphs in utf-8, and render it into a buffer",
+        lambda size: _html(size, "utf-8", "испытание текста"),
+        _render_into,
+        lambda size: size * 2,
+    ),
+    Scenario(
+        "bytes-iso-8859-1",
+        "encode a document of size paragraphs in iso-8859-1",
+        lambda size: _html(size, "iso-8859-1", "Málaga à la carte"),
+        bytes,
+        lambda size: size * 2,
+    ),
+    Scenario(
+        "bytes-shift_jis",
+        "encode a document of size paragraphs in shift_jis",
+        lambda size: _html(size, "shift_jis", "日本語のテキスト"),
+        bytes,
+        lambda size: size * 2,
+    ),
+]
+
+
+def run_scenario(scenario: Scenario, size: int, repeat: int) -> Dict[str, Any]:
+    """Runs scenario at size, and returns its results."""
+
+    times = []
+    result = None
+    for _ in range(repeat):
+        argument = scenario.setup(size)
+        gc.collect()
+        start = time.perf_counter()
+        result = scenario.operation(argument)
+        times.append(time.perf_counter() - start)
+
+    argument = scenario.setup(size)
+    gc.collect()
+    tracemalloc.start()
+    scenario.operation(argument)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    best = min(times)
+    output = len(result) if isinstance(result, (str, bytes, bytearray)) else 0
+    return {
+        "scenario": scenario.name,
+        "size": size,
+        "best_seconds": best,
+        "mean_seconds": sum(times) / len(times),
+        "nodes_per_second": scenario.nodes(size) / best if best else None,
+        "output_length": output,
+        "output_per_second": output / best if best and output else None,
+        "peak_memory_bytes": peak,
+    }
+
+
+def run(names: Optional[List[str]], sizes: List[int], repeat: int) -> Dict[str, Any]:
+    """Runs the scenarios named (all if names is None) at each size."""
+
+    scenarios = [x for x in SCENARIOS if names is None or x.name in names]
+    unknown = set(names or ()) - {x.name for x in scenarios}
+    if unknown:
+        raise ValueError("unknown scenarios: %s" % ", ".join(sorted(unknown)))
+    return {
+        "python": sys.version,
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "repeat": repeat,
+        "results": [
+            run_scenario(scenario, size, repeat)
+            for scenario in scenarios
+            for size in sizes
+        ],
+    }
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """Returns report lines comparing the best times of results with baseline."""
+
+    previous = {(x["scenario"], x["size"]): x for x in baseline["results"]}
+    lines = []
+    for result in results["results"]:
+        old = previous.get((result["scenario"], result["size"]))
+        if old is None:
+            continue
+        ratio = result["best_seconds"] / old["best_seconds"]
+        memory = result["peak_memory_bytes"] / max(1, old["peak_memory_bytes"])
+        lines.append(
+            "%-22s %8d  time x%.2f  peak memory x%.2f"
+            % (result["scenario"], result["size"], ratio, memory)
+        )
+    return lines
+
+
+def report(results: Dict[str, Any]) -> List[str]:
+    """Returns report lines for results."""
+
+    lines = [
+        "%-22s %8s %12s %14s %14s %12s"
+        % ("scenario", "size", "best ms", "nodes/s", "output/s", "peak KiB")
+    ]
+    for result in results["results"]:
+        lines.append(
+            "%-22s %8d %12.3f %14.0f %14s %12.1f"
+            % (
+                result["scenario"],
+                result["size"],
+                result["best_seconds"] * 1000,
+                result["nodes_per_second"] or 0,
+                (
+                    "%.0f" % result["output_per_second"]
+                    if result["output_per_second"]
+                    else "-"
+                ),
+                result["peak_memory_bytes"] / 1024,
+            )
+        )
+    return lines
+
+
+def main(argv: Optional[List[str]] = None):
+    """Command line entry point."""
+
+    parser = argparse.ArgumentParser(description="Run pythtml benchmarks.")
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=[x.name for x in SCENARIOS],
+        help="scenario to run; may be repeated; default all",
+    )
+    parser.add_argument(
+        "--sizes",
+        type=lambda x: [int(y) for y in x.split(",")],
+        default=DEFAULT_SIZES,
+        help="comma-separated document sizes; default %s"
+        % ",".join(map(str, DEFAULT_SIZES)),
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement")
+    parser.add_argument("--output", help="file to which to write results as JSON")
+    parser.add_argument("--compare", help="JSON results file to compare with")
+    args = parser.parse_args(argv)
+
+    results = run(args.scenario, args.sizes, args.repeat)
+    print("\n".join(report(results)))
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fp:
+            baseline = json.load(fp)
+        print()
+        print("\n".join(compare(results, baseline)))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fp:
+            json.dump(results, fp, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,11 +5,26 @@ pythtml is an alternative to templates that implements HTML 5 documents in Pytho
 It is not an HTML parser/validator; it assumes that user has some knowledge of HTML.
 """
 
-try:
-    from importlib.metadata import metadata  # type: ignore
-except ImportError:
-    from importlib_metadata import metadata  # type: ignore
-
 from .elements import *
+from .elements import (
+    DuplicateIdError,
+    Markup,
+    escape_text,
+    render_cache_clear,
+    render_cache_info,
+)
+from .sharing import intern
+
+
+def __getattr__(name: str):
+    # __version__ is read from the package metadata on first access, as importing
+    # importlib.metadata and finding the distribution is slow.
+    if name == "__version__":
+        try:
+            from importlib.metadata import metadata  # type: ignore
+        except ImportError:
+            from importlib_metadata import metadata  # type: ignore
 
-__version__: str = metadata(__name__)["version"]
+        version = globals()["__version__"] = metadata(__name__)["version"]
+        return version
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+"""Streaming of elements as ASGI HTTP responses.
+
+async def app(scope, receive, send):
+    await send_response(send, Html(Head(), Body(Div(fetch_comments(post_id)))))
+"""
+
+from typing import Any, Awaitable, Callable, Dict, Iterable, Tuple
+
+from .elements import DEFAULT_CHUNK_SIZE, _Element, _segment_encoder
+
+__all__ = ["send_response"]
+
+
+async def send_response(
+    send: Callable[[Dict[str, Any]], Awaitable[None]],
+    element: _Element,
+    *,
+    status: int = 200,
+    headers: Iterable[Tuple[bytes, bytes]] = (),
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+):
+    """Sends element as an HTTP response through the ASGI send callable.  The body is
+    rendered with element.render_async, and each chunk is sent as soon as it is rendered,
+    encoded in the document encoding for Html, and UTF-8 otherwise.  A content-type header
+    is added unless headers has one."""
+
+    encoding = element._output_encoding()  # pylint: disable=protected-access
+    headers = list(headers)
+    if not any(name.lower() == b"content-type" for name, _ in headers):
+        headers.append(
+            (b"content-type", ("text/html; charset=%s" % encoding).encode("ascii"))
+        )
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+
+    encode, flush = _segment_encoder(encoding)
+
+    async def send_body(chunk: str):
+        await send(
+            {"type": "http.response.body", "body": encode(chunk), "more_body": True}
+        )
+
+    await element.render_async(send_body, chunk_size)
+    await send({"type": "http.response.body", "body": flush(), "more_body": False})
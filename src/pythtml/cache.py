@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+
+"""Backends storing the markup of Cached elements.
+
+A backend maps string keys to markup, with an optional time to live.  LRUCache keeps
+markup in the process; FileCache keeps it in files in a directory, shared by all the
+processes using that directory, e.g. the workers of a web server.  Cached elements
+without a backend use default_backend.
+"""
+
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+__all__ = ["CacheBackend", "FileCache", "LRUCache", "default_backend"]
+
+
+class CacheBackend(ABC):
+    """The interface of Cached element backends."""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        """Returns the markup stored under key, or None if there is none, or it has
+        expired."""
+
+        raise NotImplementedError
+
+    @abstractmethod
+    def set(self, key: str, markup: str, ttl: Optional[float] = None):
+        """Stores markup under key, for ttl seconds, or until evicted if ttl is None."""
+
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, key: str):
+        """Removes the markup stored under key, if any."""
+
+        raise NotImplementedError
+
+    @abstractmethod
+    def clear(self):
+        """Removes all markup."""
+
+        raise NotImplementedError
+
+
+class LRUCache(CacheBackend):
+    """In-process backend.  When it holds more than max_entries entries, or more than
+    max_size characters of markup if max_size is not None, the least recently used
+    entries are evicted.  It is thread-safe."""
+
+    def __init__(self, max_entries: int = 1024, max_size: Optional[int] = None):
+        if max_entries < 1:
+            raise ValueError("max_entries must be positive.")
+        self.max_entries = max_entries
+        self.max_size = max_size
+        # (expiry time or None, markup) by key, least recently used first.
+        self._entries: "OrderedDict[str, Tuple[Optional[float], str]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size(self) -> int:
+        """Returns the number of characters of markup held."""
+
+        return self._size
+
+    def get(self, key: str) -> Optional[str]:
+        """Returns the markup stored under key, and marks it as the most recently used,
+        or None if there is none, or it has expired."""
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, markup = entry
+            if expires is not None and time.monotonic() >= expires:
+                del self._entries[key]
+                self._size -= len(markup)
+                return None
+            self._entries.move_to_end(key)
+            return markup
+
+    def set(self, key: str, markup: str, ttl: Optional[float] = None):
+        """Stores markup under key, for ttl seconds, or until evicted if ttl is None.
+        Markup longer than max_size is not stored."""
+
+        expires = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous[1])
+            if self.max_size is not None and len(markup) > self.max_size:
+                return
+            self._entries[key] = (expires, markup)
+            self._size += len(markup)
+            while len(self._entries) > self.max_entries or (
+                self.max_size is not None and self._size > self.max_size
+            ):
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def delete(self, key: str):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._size -= len(entry[1])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+class FileCache(CacheBackend):
+    """Backend keeping each entry in a file in directory, which is created if necessary.
+    Entries are replaced atomically, so processes sharing the directory never read a
+    partly written entry.  Expired entries are removed when read."""
+
+    _SUFFIX = ".html"
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        """Returns the path of the file of the entry stored under key."""
+
+        from hashlib import sha256  # pylint: disable=import-outside-toplevel
+
+        return os.path.join(
+            self.directory, sha256(key.encode("utf-8")).hexdigest() + self._SUFFIX
+        )
+
+    def get(self, key: str) -> Optional[str]:
+        """Returns the markup stored under key, or None if there is none, or it has
+        expired, in which case its file is removed."""
+
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8", newline="") as fp:
+                expires = float(fp.readline())
+                markup = fp.read()
+        except FileNotFoundError:
+            return None
+        if expires and time.time() >= expires:
+            self._remove(path)
+            return None
+        return markup
+
+    def set(self, key: str, markup: str, ttl: Optional[float] = None):
+        """Stores markup under key, for ttl seconds, or until deleted if ttl is None.  The
+        entry is written to a temporary file, which then replaces the file of key."""
+
+        import tempfile  # pylint: disable=import-outside-toplevel
+
+        expires = 0.0 if ttl is None else time.time() + ttl
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "w", encoding="utf-8", newline="") as fp:
+                fp.write("%r\n" % expires)
+                fp.write(markup)
+            os.replace(temporary, self._path(key))
+        except BaseException:
+            self._remove(temporary)
+            raise
+
+    def delete(self, key: str):
+        self._remove(self._path(key))
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(self._SUFFIX):
+                self._remove(os.path.join(self.directory, name))
+
+    @staticmethod
+    def _remove(path: str):
+        """Removes the file at path, if any."""
+
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+# The backend of Cached elements created without one.
+default_backend: CacheBackend = LRUCache()
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+"""Streaming of elements compressed with gzip or deflate, e.g. as HTTP responses with a
+Content-Encoding.
+
+iter_compressed renders an element, encodes it as iter_bytes does, and feeds the markup
+to a zlib compressor as it is rendered, so the uncompressed document is never held in
+memory:
+
+    for block in iter_compressed(doc, coding="gzip"):
+        response.write(block)
+
+Compressed data is generated in blocks of about chunk_size bytes.  The compressor is
+also flushed after the markup strings in flush_after, by default "</head>", so a browser
+can decode the head of a document, and start fetching its stylesheets and scripts, while
+the body is still being rendered.
+
+Markup segments of at least PRECOMPRESSED_MIN_LENGTH characters, i.e. the cached markup of
+subtrees, Raw data, and the markup of Cached elements, are compressed on their own once
+and kept with the elements generating them until they change, and their compressed data
+is spliced into the output on later renders, which saves most of the cost of compressing
+the static parts of pages.
+"""
+
+import re
+import struct
+import zlib
+from typing import IO, Any, Iterable, Iterator, Optional
+
+from .elements import (
+    DEFAULT_CHUNK_SIZE,
+    _Element,
+    _is_stateless_codec,
+    _segment_encoder,
+    _SegmentOwners,
+)
+
+__all__ = ["PRECOMPRESSED_MIN_LENGTH", "iter_compressed", "write_compressed_to"]
+
+# minimum length, in characters, of the markup segments compressed on their own.
+PRECOMPRESSED_MIN_LENGTH = 4096
+
+
+def _header(coding: str, level: int) -> bytes:
+    """Returns the header of a gzip member or of a zlib stream compressed at level."""
+
+    if coding == "gzip":
+        # no file name or modification time; the OS is unknown.
+        extra_flags = 2 if level == 9 else 4 if level == 1 else 0
+        return b"\x1f\x8b\x08\x00\x00\x00\x00\x00" + bytes((extra_flags, 255))
+    # deflate with a 32 KiB window, and the compression level as zlib reports it.
+    level_flags = (
+        0 if 0 <= level < 2 else 1 if 2 <= level < 6 else 3 if level > 6 else 2
+    )
+    flags = level_flags << 6
+    return bytes((0x78, flags + 31 - (0x7800 + flags) % 31))
+
+
+def _compressed_segment(
+    owners: _SegmentOwners, segment: str, data: bytes, encoding: str, level: int
+) -> bytes:
+    """Returns data, segment encoded in encoding, compressed on its own as raw deflate
+    blocks ending at a byte boundary, as kept by owners if possible."""
+
+    key = ("deflate", encoding, level)
+    compressed = owners.get(segment, key)
+    if compressed is None:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        compressed = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        owners.keep(segment, key, compressed)
+    return compressed
+
+
+def iter_compressed(  # pylint: disable=too-many-arguments,too-many-locals
+    element: _Element,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    encoding: Optional[str] = None,
+    *,
+    coding: str = "gzip",
+    level: int = 6,
+    flush_after: Iterable[str] = ("</head>",),
+    minify: bool = False,
+) -> Iterator[bytes]:
+    """Renders element encoded as by element.iter_bytes, and compressed at level as
+    coding, "gzip" or "deflate" (the zlib format, as the HTTP content coding).  Blocks of
+    compressed data are generated as soon as at least chunk_size bytes are available, and
+    after each markup segment containing one of the strings of flush_after, after a sync
+    flush of the compressor.  Joined, the blocks decompress to
+    element.render(minify=minify).encode(encoding)."""
+
+    # pylint: disable=protected-access
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be positive.")
+    if coding not in ("gzip", "deflate"):
+        raise ValueError("coding must be 'gzip' or 'deflate'.")
+    if not -1 <= level <= 9:
+        raise ValueError("level must be between -1 and 9.")
+
+    encoding = encoding or element._output_encoding()
+    encode, flush = _segment_encoder(encoding)
+    # segments can be compressed on their own only if they are encoded on their own.
+    min_length = PRECOMPRESSED_MIN_LENGTH if _is_stateless_codec(encoding) else -1
+    flush_after = tuple(flush_after)
+    # a single string is found with "in", which is much faster than a regular expression;
+    # without strings, the expression matches nothing.
+    marker = flush_after[0] if len(flush_after) == 1 else None
+    search = re.compile("|".join(map(re.escape, flush_after)) or "(?!)").search
+    checksum = zlib.crc32 if coding == "gzip" else zlib.adler32
+    check = checksum(b"")
+    size = 0
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    buffer = bytearray(_header(coding, level))
+    # small segments are compressed together, as compressing each one costs more than
+    # compressing its characters.
+    pending = []
+    pending_size = 0
+    owners = _SegmentOwners()
+    for segment in owners.iter_segments(element, minify):
+        length = len(segment)
+        precompressed = 0 <= min_length <= length
+        if not precompressed:
+            pending.append(segment)
+            pending_size += length
+            if pending_size < chunk_size:
+                if marker is not None:
+                    if marker not in segment:
+                        continue
+                elif search(segment) is None:
+                    continue
+        if pending:
+            data = encode("".join(pending))
+            check = checksum(data, check)
+            size += len(data)
+            buffer += compressor.compress(data)
+            pending = []
+            pending_size = 0
+        if precompressed:
+            data = encode(segment)
+            check = checksum(data, check)
+            size += len(data)
+            # a full flush ends the preceding data at a byte boundary, and keeps the
+            # compressor from referring to it, as it would refer to the spliced data once
+            # decompressed.
+            buffer += compressor.flush(zlib.Z_FULL_FLUSH)
+            buffer += _compressed_segment(owners, segment, data, encoding, level)
+        if marker in segment if marker is not None else search(segment) is not None:
+            buffer += compressor.flush(zlib.Z_SYNC_FLUSH)
+        elif len(buffer) < chunk_size:
+            continue
+        yield bytes(buffer)
+        buffer.clear()
+
+    data = encode("".join(pending)) + flush()
+    check = checksum(data, check)
+    size += len(data)
+    buffer += compressor.compress(data)
+    buffer += compressor.flush()
+    if coding == "gzip":
+        buffer += struct.pack("<II", check, size & 0xFFFFFFFF)
+    else:
+        buffer += struct.pack(">I", check)
+    yield bytes(buffer)
+
+
+def write_compressed_to(
+    element: _Element,
+    fp: IO[bytes],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    **options: Any,
+) -> int:
+    """Writes element compressed as by iter_compressed, which takes options, to the
+    binary file fp, and returns the number of bytes written."""
+
+    count = 0
+    for block in iter_compressed(element, chunk_size, **options):
+        fp.write(block)
+        count += len(block)
+    return count
@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+
+"""Differences between element trees, as patches for partial page updates.
+
+diff(old, new) returns the operations that turn the markup of old into that of new,
+e.g. to update a page already displayed by a browser with fragments of HTML:
+
+    for patch in diff(old_table, new_table):
+        send(patch._asdict())
+
+Paths count children as pythtml does, which differs from the DOM where pseudo-elements
+such as AutoEscape, or Raw data, or adjacent text children are involved.  Each patch
+therefore also names its target, the closest element with a key containing the node it
+applies to, or that node itself, and the path from the target, so that a client can find
+the target by id, as in the out-of-band swaps of htmx, and apply the patch there; keyed
+elements replaced or removed are targets themselves, with an empty path.
+
+Children are matched by their key attribute, id by default, where they have one, and
+otherwise by their order among the children without one.  Matched children are diffed in
+turn; the others are removed or inserted with their markup.  Walking both trees costs
+about as much as rendering one, but only the inserted and replaced content is rendered,
+and subtrees that are the same object in both trees, or whose cached markup is the same,
+are skipped.
+"""
+
+from bisect import bisect_left
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from .elements import (
+    _AUTO_ESCAPE_END,
+    Markup,
+    Raw,
+    Slot,
+    _Element,
+    _attribute_key,
+    _render_value,
+)
+
+__all__ = ["Patch", "diff"]
+
+# values of Patch.op.
+REPLACE = "replace"
+INSERT = "insert"
+REMOVE = "remove"
+SET_ATTRIBUTE = "set_attribute"
+REMOVE_ATTRIBUTE = "remove_attribute"
+
+
+class Patch(NamedTuple):
+    """An operation of a diff.  path lists child offsets from the root of the tree, as it
+    is once the preceding operations are applied; children are counted as in
+    element.children(), i.e. text children count, and adjacent ones are not merged as
+    in the DOM.  target is the key of the closest element with a key that contains the
+    node at path, or is that node unless it is inserted, or None for the root, and
+    target_path lists child offsets from the target to the node at path.
+
+    - replace: the node at path is replaced with html, the markup of node.
+    - insert: html, the markup of node, is inserted as the child at path.
+    - remove: the node at path is removed.
+    - set_attribute: attribute name of the element at path is set to value; value is ""
+      for attributes without a value, e.g. checked.
+    - remove_attribute: attribute name of the element at path is removed."""
+
+    op: str
+    path: Tuple[int, ...]
+    html: Optional[str] = None
+    name: Optional[str] = None
+    value: Optional[str] = None
+    node: Any = None
+    target: Any = None
+    target_path: Tuple[int, ...] = ()
+
+
+# classes of text children that render alike when equal.
+_TEXT_CLASSES = frozenset((str, Markup, int, float))
+
+
+def _attribute_value(value: Any) -> str:
+    """Returns the value of an attribute as rendered, or "" if it has none."""
+
+    return "" if isinstance(value, bool) else str(value)
+
+
+def _same_markup(old: _Element, new: _Element) -> bool:
+    """Returns True if old and new have the same cached markup."""
+
+    # pylint: disable=protected-access
+    markup = old._rendered
+    return (
+        isinstance(markup, str)
+        and markup.__class__ is new._rendered.__class__
+        and markup == new._rendered
+    )
+
+
+def _comparable(old: Any, new: Any) -> bool:
+    """Returns True if new can be obtained by patching old, rather than replacing it."""
+
+    if not isinstance(old, _Element):
+        return False
+    if old.__class__ is not new.__class__:
+        return False
+    # pylint: disable=protected-access
+    if not old._cacheable:
+        # e.g. Lazy and Cached elements, whose content is known only when rendered.
+        return False
+    if isinstance(old, Raw):
+        return old.data == new.data
+    if isinstance(old, Slot):
+        return old.name == new.name and old.escape_data == new.escape_data
+    return True
+
+
+def _patch(
+    op: str, path: Tuple[int, ...], target: Tuple[Any, int], **fields: Any
+) -> Patch:
+    """Returns a patch at path, whose target is (key, length of its path)."""
+
+    return Patch(op, path, target=target[0], target_path=path[target[1] :], **fields)
+
+
+def _own_target(
+    node: Any, path: Tuple[int, ...], key: str, target: Tuple[Any, int]
+) -> Tuple[Any, int]:
+    """Returns the target of the patches of node at path, itself if it has a key,
+    otherwise target, that of its parent."""
+
+    # pylint: disable=protected-access
+    if isinstance(node, _Element) and node._attributes is not None:
+        node_key = node._attributes.get(key)
+        if node_key is not None:
+            return (node_key, len(path))
+    return target
+
+
+def _kept(matches: List[int]) -> List[bool]:
+    """matches holds, for each new child, the offset of the old child it matches, or -1.
+    Returns, for each new child, whether its match stays in place, i.e. belongs to a
+    longest increasing subsequence of matches; the others are removed and inserted."""
+
+    # tails[k] is the offset in matches of the last item of the increasing subsequence of
+    # length k + 1 that ends with the smallest value, and tail_values[k] that value.
+    tails: List[int] = []
+    tail_values: List[int] = []
+    previous = [-1] * len(matches)
+    for offset, value in enumerate(matches):
+        if value < 0:
+            continue
+        length = bisect_left(tail_values, value)
+        if length:
+            previous[offset] = tails[length - 1]
+        if length == len(tails):
+            tails.append(offset)
+            tail_values.append(value)
+        else:
+            tails[length] = offset
+            tail_values[length] = value
+    kept = [False] * len(matches)
+    offset = tails[-1] if tails else -1
+    while offset >= 0:
+        kept[offset] = True
+        offset = previous[offset]
+    return kept
+
+
+def diff(old: _Element, new: _Element, key: str = "id") -> List[Patch]:
+    """Returns the patches that turn the markup of old into that of new.  Children are
+    matched by their key attribute where they have one.  Neither tree is changed."""
+
+    # pylint: disable=protected-access
+    patches: List[Patch] = []
+    # (old node, new node, path, escape, escape_text, target of the parent), see
+    # elements._render_value and _patch.
+    pending: List[Tuple[Any, Any, Tuple[int, ...], bool, bool, Tuple[Any, int]]] = [
+        (old, new, (), False, False, (None, 0))
+    ]
+    while pending:
+        old_node, new_node, path, escape, escape_text, parent_target = pending.pop()
+        if old_node is new_node:
+            continue
+        target = _own_target(old_node, path, key, parent_target)
+        if not isinstance(new_node, _Element):
+            if (
+                old_node.__class__ is not new_node.__class__
+                or old_node != new_node
+                and _render_value(old_node, escape_text)
+                != _render_value(new_node, escape_text)
+            ):
+                patches.append(
+                    _patch(
+                        REPLACE,
+                        path,
+                        target,
+                        html=_render_value(new_node, escape_text),
+                        node=new_node,
+                    )
+                )
+            continue
+        if not _comparable(old_node, new_node):
+            patches.append(
+                _patch(
+                    REPLACE,
+                    path,
+                    target,
+                    html=_render_value(new_node, escape),
+                    node=new_node,
+                )
+            )
+            continue
+        if _same_markup(old_node, new_node):
+            continue
+
+        old_attributes = old_node._attributes or {}
+        new_attributes = new_node._attributes or {}
+        if _attribute_key(old_attributes) != _attribute_key(new_attributes):
+            _diff_attributes(old_attributes, new_attributes, key, path, target, patches)
+            # the children are below the element as patched.
+            target = _own_target(new_node, path, key, parent_target)
+
+        escape = escape or new_node._close_markup() is _AUTO_ESCAPE_END
+        escape_text = escape and new_node._escapes_text
+        children = _diff_children(
+            old_node._children,
+            new_node._children,
+            key,
+            path,
+            target,
+            escape,
+            escape_text,
+            patches,
+        )
+        pending.extend(
+            (old_child, new_child, path + (offset,), escape, escape_text, target)
+            for offset, old_child, new_child in reversed(children)
+        )
+    return patches
+
+
+def _diff_attributes(  # pylint: disable=too-many-arguments
+    old_attributes: Dict[str, Any],
+    new_attributes: Dict[str, Any],
+    key: str,
+    path: Tuple[int, ...],
+    target: Tuple[Any, int],
+    patches: List[Patch],
+):
+    """Appends to patches the changes that turn old_attributes into new_attributes.  The
+    key attribute is changed last, as the other patches may target the element by it."""
+
+    key_patch = None
+    for name, value in new_attributes.items():
+        value = _attribute_value(value)
+        if (
+            name not in old_attributes
+            or _attribute_value(old_attributes[name]) != value
+        ):
+            patch = _patch(SET_ATTRIBUTE, path, target, name=name, value=value)
+            if name == key:
+                key_patch = patch
+            else:
+                patches.append(patch)
+    for name in old_attributes:
+        if name not in new_attributes:
+            patch = _patch(REMOVE_ATTRIBUTE, path, target, name=name)
+            if name == key:
+                key_patch = patch
+            else:
+                patches.append(patch)
+    if key_patch is not None:
+        patches.append(key_patch)
+
+
+def _keys(children: List[Any], key: str) -> List[Any]:
+    """Returns the keys of children, None for those without one."""
+
+    # pylint: disable=protected-access
+    return [
+        (
+            x._attributes.get(key)
+            if isinstance(x, _Element) and x._attributes is not None
+            else None
+        )
+        for x in children
+    ]
+
+
+def _diff_children(  # pylint: disable=too-many-arguments,too-many-locals
+    old_children: List[Any],
+    new_children: List[Any],
+    key: str,
+    path: Tuple[int, ...],
+    target: Tuple[Any, int],
+    escape: bool,
+    escape_text: bool,
+    patches: List[Patch],
+) -> List[Tuple[int, Any, Any]]:
+    """Appends to patches the removals and insertions that turn old_children into
+    new_children, children of the element at path with target, and returns (offset, old
+    child, new child) for the children to diff."""
+
+    old_keys = _keys(old_children, key)
+    new_keys = _keys(new_children, key)
+    if old_keys == new_keys:
+        # the usual case: children match in order.  Equal text is skipped here, as it is
+        # cheaper than in diff.
+        return [
+            (offset, old_child, new_child)
+            for offset, (old_child, new_child) in enumerate(
+                zip(old_children, new_children)
+            )
+            if old_child is not new_child
+            and not (
+                old_child.__class__ is new_child.__class__
+                and old_child.__class__ in _TEXT_CLASSES
+                and old_child == new_child
+            )
+        ]
+
+    # offsets in old_children of the children with a key, by key, and of the others.
+    keyed: Dict[Any, int] = {}
+    unkeyed: List[int] = []
+    for offset, child_key in enumerate(old_keys):
+        if child_key is None:
+            unkeyed.append(offset)
+        else:
+            keyed.setdefault(child_key, offset)
+
+    # offset in old_children of the child matched by each new child, or -1.
+    matches: List[int] = []
+    unkeyed_offsets = iter(unkeyed)
+    for child_key in new_keys:
+        if child_key is None:
+            matches.append(next(unkeyed_offsets, -1))
+        else:
+            matches.append(keyed.pop(child_key, -1))
+    kept = _kept(matches)
+
+    kept_offsets = {x for x, y in zip(matches, kept) if y}
+    for offset in reversed(range(len(old_children))):
+        if offset not in kept_offsets:
+            child_path = path + (offset,)
+            child_key = old_keys[offset]
+            patches.append(
+                _patch(
+                    REMOVE,
+                    child_path,
+                    target if child_key is None else (child_key, len(child_path)),
+                )
+            )
+
+    children = []
+    for offset, (child, match, keep) in enumerate(zip(new_children, matches, kept)):
+        if keep:
+            children.append((offset, old_children[match], child))
+        else:
+            patches.append(
+                _patch(
+                    INSERT,
+                    path + (offset,),
+                    target,
+                    html=_render_value(
+                        child, escape if isinstance(child, _Element) else escape_text
+                    ),
+                    node=child,
+                )
+            )
+    return children
@@ -1,13 +1,43 @@
 # -*- coding: utf-8 -*-
 
 """pythtml elements."""
-from html import escape
+import codecs
+import re
+from collections.abc import Awaitable as _Awaitable
+from itertools import accumulate, chain
 from keyword import kwlist
-from typing import Any, Optional
-from xml.sax.saxutils import quoteattr
+from types import AsyncGeneratorType, CoroutineType, GeneratorType
+from typing import (
+    IO,
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+from weakref import WeakKeyDictionary, ref
+
+from . import cache as _cache
+
+# Modules that are slow to import, i.e. asyncio, xml.sax.saxutils and pythtml.query, are
+# imported where they are used, so that importing pythtml stays fast.
+
+# default maximum size, in characters, of chunks produced by iter_render.
+DEFAULT_CHUNK_SIZE = 8192
 
 __all__ = [
     "Raw",
+    "Slot",
+    "Lazy",
+    "AutoEscape",
+    "Cached",
     "A",
     "Abbr",
     "Acronym",
@@ -116,13 +146,705 @@ __all__ = [
 ]
 
 
-class _Element:
-    """Base class for HTML elements."""
+# Shared, immutable stand-in for the children of an element that has none.  Lists are
+# only allocated once an element actually has children.
+_NO_CHILDREN: tuple = ()
+
+# Names of the slots of each element class other than those of _Element; see
+# _extra_slots.
+_slot_names: Dict[type, Tuple[str, ...]] = {}
+
+# Values of _Element._rendered for an element whose markup has not been cached, and that
+# has been rendered once (_SEEN), or that has not been rendered but is part of an indexed
+# tree (_TRACKED).
+_SEEN = object()
+_TRACKED = object()
+
+# The active pythtml.profiling.RenderProfiler, or None.
+_profiler: Optional[Any] = None
+
+
+class DuplicateIdError(ValueError):
+    """Raised by find_by_id when more than one element has the id."""
+
+
+class _TreeIndex:
+    """Elements of a tree in document order, by id, by id text, by tag, and by class.
+    The id text, tag, and class indexes are built when first needed."""
+
+    __slots__ = (
+        "root",
+        "elements",
+        "parents",
+        "ids",
+        "shares",
+        "_text_ids",
+        "_tags",
+        "_classes",
+        "_order",
+    )
+
+    def __init__(self, root: "_Element"):
+        self.root = root
+        self.elements: List[_Element] = []
+        # parent of each element in the tree, except root.
+        self.parents: Dict[_Element, _Element] = {}
+        ids: Dict[Any, Any] = {}
+        # True if elements of the tree share their children with the elements they were
+        # copied from by clone.
+        self.shares = False
+        # pylint: disable=protected-access
+        for element, parent in root._walk_tracked():
+            self.elements.append(element)
+            if parent is not None:
+                self.parents.setdefault(element, parent)
+            if element._children.__class__ is _SharedChildren:
+                self.shares = True
+            attributes = element._attributes
+            if not attributes or "id" not in attributes:
+                continue
+            value = attributes["id"]
+            try:
+                found = ids.setdefault(value, element)
+            except TypeError:
+                continue
+            if found is not element:
+                if isinstance(found, list):
+                    found.append(element)
+                else:
+                    ids[value] = [found, element]
+        self.ids = ids
+        self._text_ids: Optional[Dict[str, List[_Element]]] = None
+        self._tags: Optional[Dict[str, List[_Element]]] = None
+        self._classes: Optional[Dict[str, List[_Element]]] = None
+        self._order: Optional[Dict[_Element, int]] = None
+
+    @property
+    def text_ids(self) -> Dict[str, List["_Element"]]:
+        """Returns lists of elements in document order by the str of their id, which
+        selectors match."""
+
+        if self._text_ids is None:
+            text_ids: Dict[str, List[_Element]] = {}
+            for element in self.elements:
+                attributes = element._attributes  # pylint: disable=protected-access
+                if attributes and "id" in attributes:
+                    text_ids.setdefault(str(attributes["id"]), []).append(element)
+            self._text_ids = text_ids
+        return self._text_ids
+
+    @property
+    def tags(self) -> Dict[str, List["_Element"]]:
+        """Returns lists of elements in document order by tag."""
+
+        if self._tags is None:
+            tags: Dict[str, List[_Element]] = {}
+            for element in self.elements:
+                tag = getattr(element, "tag", None)
+                if tag is not None:
+                    tags.setdefault(tag, []).append(element)
+            self._tags = tags
+        return self._tags
+
+    @property
+    def classes(self) -> Dict[str, List["_Element"]]:
+        """Returns lists of elements in document order by class."""
+
+        if self._classes is None:
+            classes: Dict[str, List[_Element]] = {}
+            for element in self.elements:
+                attributes = element._attributes  # pylint: disable=protected-access
+                if attributes and "class" in attributes:
+                    for name in dict.fromkeys(str(attributes["class"]).split()):
+                        classes.setdefault(name, []).append(element)
+            self._classes = classes
+        return self._classes
+
+    @property
+    def order(self) -> Dict["_Element", int]:
+        """Returns the position of each element in document order."""
+
+        if self._order is None:
+            self._order = {}
+            for position, element in enumerate(self.elements):
+                self._order.setdefault(element, position)
+        return self._order
+
+    def path(self, element: "_Element") -> List["_Element"]:
+        """Returns the elements from root down to element."""
+
+        path = [element]
+        while path[-1] is not self.root:
+            path.append(self.parents[path[-1]])
+        path.reverse()
+        return path
+
+
+# Stateless codecs that encode ASCII characters as the same bytes.
+_ASCII_COMPATIBLE_CODECS = frozenset(
+    [
+        "ascii",
+        "big5",
+        "cp932",
+        "euc_jp",
+        "euc_kr",
+        "gb2312",
+        "gbk",
+        "koi8-r",
+        "koi8-u",
+        "shift_jis",
+        "utf-8",
+    ]
+)
+
+
+def _is_stateless_codec(encoding: str) -> bool:
+    """Returns True if strings encoded in encoding can be encoded independently, i.e.
+    if the codec is stateless and ASCII-compatible."""
+
+    name = codecs.lookup(encoding).name
+    return name in _ASCII_COMPATIBLE_CODECS or name.startswith(("iso8859-", "cp125"))
+
+
+def _segment_encoder(
+    encoding: str,
+) -> Tuple[Callable[[str], bytes], Callable[[], bytes]]:
+    """Returns (encode, flush) functions that encode a sequence of strings in encoding.
+    Strings encoded by stateless ASCII-compatible codecs are encoded independently, with a
+    fast path for ASCII strings; other codecs use an incremental encoder."""
+
+    if codecs.lookup(encoding).name == "utf-8":
+        return (str.encode, lambda: b"")
+    if _is_stateless_codec(encoding):
+
+        def encode(segment: str) -> bytes:
+            return (
+                segment.encode("ascii")
+                if segment.isascii()
+                else segment.encode(encoding)
+            )
+
+        return (encode, lambda: b"")
+
+    encoder = codecs.getincrementalencoder(encoding)()
+    return (encoder.encode, lambda: encoder.encode("", final=True))
+
+
+# minimum length of the non-ASCII markup segments whose encoded length is kept; see
+# _Element.byte_length.
+_BYTE_LENGTH_MIN_SEGMENT = 256
+
+# Values derived from long markup segments, e.g. their encoded length, by the element
+# that generated them, then by a key such as a codec name: (segment, value).  Entries are
+# dropped with the element, or when it changes; see _SegmentOwners.
+_segment_values: "WeakKeyDictionary[_Element, Dict[Any, Tuple[str, Any]]]" = (
+    WeakKeyDictionary()
+)
+
+
+class _SegmentOwners:
+    """Tracks the element that generates each segment of a render, the innermost element
+    open, from the enter and exit calls that the walk makes to a profile, and keeps
+    values derived from segments with that element, so that they are not computed again
+    on later renders.  The calls are passed on to the profile of the active
+    RenderProfiler, if any."""
+
+    __slots__ = ("nodes", "profile")
+
+    def __init__(self):
+        self.nodes: List[_Element] = []
+        self.profile: Optional[Any] = None
+
+    def iter_segments(
+        self, element: "_Element", minify: bool, memoize: bool = True
+    ) -> Iterator[str]:
+        """Generates the markup of element as _iter_minified does if minify is True,
+        otherwise as _iter_segments(memoize) does, tracking the elements generating
+        it."""
+
+        # pylint: disable=protected-access
+        profiler = _profiler
+        if profiler is not None:
+            self.profile = profiler._start()
+        segments = (
+            element._walk_minified(False, self)
+            if minify
+            else element._walk_segments(memoize, False, False, self)
+        )
+        return segments if self.profile is None else self.profile.count(segments)
+
+    def enter(self, node: "_Element"):
+        """Records the start of the rendering of node."""
+
+        self.nodes.append(node)
+        if self.profile is not None:
+            self.profile.enter(node)
+
+    def exit(self, hit: bool):
+        """Records the end of the rendering of the innermost open element."""
+
+        self.nodes.pop()
+        if self.profile is not None:
+            self.profile.exit(hit)
+
+    def get(self, segment: str, key: Any) -> Optional[Any]:
+        """Returns the value kept for segment, the last one generated, under key, or
+        None."""
+
+        if self.nodes:
+            values = _segment_values.get(self.nodes[-1])
+            if values is not None:
+                entry = values.get(key)
+                # the segment is compared as the element may generate several.
+                if entry is not None and entry[0] == segment:
+                    return entry[1]
+        return None
+
+    def keep(self, segment: str, key: Any, value: Any):
+        """Keeps value for segment, the last one generated, under key."""
+
+        # pylint: disable=protected-access
+        if self.nodes:
+            node = self.nodes[-1]
+            # changes to elements without cached markup do not reach _invalidate.
+            if node._rendered is not None:
+                values = _segment_values.get(node)
+                if values is None:
+                    values = _segment_values[node] = {}
+                values[key] = (segment, value)
+
+
+# inspect.CO_ITERABLE_COROUTINE, the flag of generator-based coroutines.
+_CO_ITERABLE_COROUTINE = 0x100
+
+
+def _is_async_child(child: Any) -> bool:
+    """Returns True if child is an awaitable or an async generator, like
+    inspect.isawaitable(child) or inspect.isasyncgen(child)."""
+
+    return isinstance(child, (CoroutineType, AsyncGeneratorType, _Awaitable)) or (
+        isinstance(child, GeneratorType)
+        and bool(child.gi_code.co_flags & _CO_ITERABLE_COROUTINE)
+    )
+
+
+# marks the end of the items of an async generator child.
+_END_OF_STREAM = object()
+
+
+class _AsyncStream:  # pylint: disable=too-few-public-methods
+    """Collects the items of an async generator child in a queue, concurrently with
+    rendering."""
+
+    __slots__ = ("queue", "task")
+
+    def __init__(self, agen):
+        import asyncio  # pylint: disable=import-outside-toplevel
+
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.task = asyncio.ensure_future(self._pump(agen))
+
+    async def _pump(self, agen):
+        try:
+            async for item in agen:
+                await self.queue.put(item)
+        finally:
+            await self.queue.put(_END_OF_STREAM)
+
+
+def _start_async_child(child: Any) -> Any:
+    """Schedules the async child to run; returns a task, or an _AsyncStream for an async
+    generator."""
+
+    import asyncio  # pylint: disable=import-outside-toplevel
+
+    if isinstance(child, AsyncGeneratorType):
+        return _AsyncStream(child)
+    return asyncio.ensure_future(child)
+
+
+class _EscapedAsyncChild:  # pylint: disable=too-few-public-methods
+    """An async child generated by _Element._iter_segments below an AutoEscape element,
+    whose text values must be escaped."""
+
+    __slots__ = ("child",)
+
+    def __init__(self, child: Any):
+        self.child = child
+
 
-    # tag must be set in subclasses.
-    tag: str
+async def _render_async_value(
+    value: Any,
+    send: Callable[[str], Awaitable[Any]],
+    chunk_size: int,
+    escape_value: bool = False,
+):
+    """Renders the value of an async child for _Element.render_async; text is escaped
+    if escape_value is True."""
+
+    if value is None:
+        return
+    if isinstance(value, (list, tuple)):
+        for item in value:
+            await _render_async_value(item, send, chunk_size, escape_value)
+    elif isinstance(value, _Element):
+        if escape_value:
+            value = AutoEscape(value)
+        await value.render_async(send, chunk_size)
+    elif escape_value and not isinstance(value, Markup):
+        await send(_escape_text(str(value)))
+    else:
+        await send(str(value))
+
+
+class RenderCacheInfo(NamedTuple):
+    """Render cache statistics returned by render_cache_info."""
+
+    hits: int
+    misses: int
+
+
+class _RenderStats:  # pylint: disable=too-few-public-methods
+    """Render cache counters."""
+
+    __slots__ = ("hits", "misses")
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+
+_render_stats = _RenderStats()
+
+
+def render_cache_info() -> RenderCacheInfo:
+    """Returns the number of elements whose cached markup was reused (hits), and the number
+    of elements rendered from scratch (misses), since the last render_cache_clear."""
+
+    return RenderCacheInfo(_render_stats.hits, _render_stats.misses)
+
+
+def render_cache_clear():
+    """Resets the render cache counters."""
+
+    _render_stats.hits = _render_stats.misses = 0
+
+
+# Attribute names by keyword argument name, and attribute strings by attribute items and
+# value types, for normal and minified markup; see _Element.__init__ and
+# _Element._generate_attrs.  Each is cleared when it reaches _ATTR_CACHE_SIZE entries.
+_ATTR_CACHE_SIZE = 4096
+_attr_names: dict = {}
+_attr_strings: dict = {}
+_minified_attr_strings: dict = {}
+
+# Characters that quoteattr replaces or that decide its choice of quotes.
+_needs_quoteattr = re.compile('[&<>"\n\r\t]').search
+
+# Attribute values that must be quoted: empty, or containing characters not allowed in
+# unquoted values, or &, which quoteattr escapes.
+_needs_quotes = re.compile("^$|[\\s\"'=<>`&]").search
+
+
+def _quote_attr_value(value: str) -> str:
+    """Returns the same result as quoteattr(value), but faster for values that need
+    no escaping."""
+
+    if _needs_quoteattr(value) is None:
+        return '"%s"' % value
+    from xml.sax.saxutils import quoteattr  # pylint: disable=import-outside-toplevel
+
+    return quoteattr(value)
+
+
+def _minify_attr_value(value: str) -> str:
+    """Returns value unquoted where HTML allows it, and otherwise quoted by
+    _quote_attr_value."""
+
+    return _quote_attr_value(value) if _needs_quotes(value) else value
+
+
+def _attribute_key(attributes: dict) -> Tuple[Any, ...]:
+    """Returns a hashable key of attributes that tells apart any two attribute dicts
+    rendered differently: the names, classes and values of the attributes, with values
+    other than str converted to str."""
+
+    # value classes are part of the key because e.g. True == 1, and values are converted
+    # because e.g. Decimal('1.0') == Decimal('1.00') and 0.0 == -0.0.
+    return tuple(
+        [
+            (k, v.__class__, v if v.__class__ is str else str(v))
+            for k, v in attributes.items()
+        ]
+    )
+
+
+def _attribute_string(attributes: dict, minify: bool = False) -> str:
+    """Returns the attribute string of a non-empty dict of attributes; values are quoted
+    only where necessary if minify is True.  Strings are cached by _attribute_key."""
+
+    cache = _minified_attr_strings if minify else _attr_strings
+    quote = _minify_attr_value if minify else _quote_attr_value
+    key = _attribute_key(attributes)
+    try:
+        return cache[key]
+    except KeyError:
+        pass
+
+    # if isinstance(attr_value, bool), then I assume that __init__ filtered out attributes.
+    # with value False.
+    attr_string = " ".join(
+        [
+            attr_name
+            if isinstance(attr_value, bool)
+            else "%s=%s" % (attr_name, quote(str(attr_value)))
+            for attr_name, attr_value in attributes.items()
+        ]
+    )
+    if len(cache) >= _ATTR_CACHE_SIZE:
+        cache.clear()
+    cache[key] = attr_string
+    return attr_string
+
+
+# Elements whose end tag may be omitted in minified markup, per the optional tag rules of
+# the HTML standard, by tag: the tags of the parents in which it may be omitted, the tags of
+# the following siblings before which it is omitted, or None for any element, and whether
+# it is omitted at the end of its parent.  Requiring a valid parent keeps trees that do not
+# follow the content models of HTML from being parsed differently once minified.  End tags
+# followed by text or a pseudo-element (e.g. Raw, which may be whitespace or a comment)
+# are kept, as are those of pseudo-elements' children and of the root, except </html>.
+_P_CLOSERS = frozenset(
+    (
+        "address", "article", "aside", "blockquote", "details", "dialog", "div", "dl",
+        "fieldset", "figcaption", "figure", "footer", "form", "h1", "h2", "h3", "h4",
+        "h5", "h6", "header", "hgroup", "hr", "main", "menu", "nav", "ol", "p", "pre",
+        "search", "section", "table", "ul",
+    )
+)  # fmt: skip
+_P_PARENTS = frozenset(
+    (
+        "article", "aside", "blockquote", "body", "caption", "dd", "details", "dialog",
+        "div", "dt", "fieldset", "figcaption", "figure", "footer", "form", "header",
+        "li", "main", "nav", "search", "section", "td", "th",
+    )
+)  # fmt: skip
+_TABLE = frozenset(("table",))
+_TABLE_SECTIONS = frozenset(("tbody", "tfoot"))
+_DEFINITIONS = frozenset(("dd", "dt"))
+_RUBY_TEXTS = frozenset(("rp", "rt"))
+_CELLS = frozenset(("td", "th"))
+_OPTIONAL_END_TAGS: Dict[str, Tuple[frozenset, Optional[frozenset], bool]] = {
+    "body": (frozenset(("html",)), None, True),
+    "caption": (_TABLE, None, True),
+    "colgroup": (_TABLE, None, True),
+    "dd": (frozenset(("div", "dl")), _DEFINITIONS, True),
+    "dt": (frozenset(("div", "dl")), _DEFINITIONS, False),
+    "head": (frozenset(("html",)), None, False),
+    "li": (frozenset(("menu", "ol", "ul")), frozenset(("li",)), True),
+    "optgroup": (frozenset(("select",)), frozenset(("hr", "optgroup")), True),
+    "option": (
+        frozenset(("datalist", "optgroup", "select")),
+        frozenset(("hr", "optgroup", "option")),
+        True,
+    ),
+    "p": (_P_PARENTS, _P_CLOSERS, True),
+    "rp": (frozenset(("ruby",)), _RUBY_TEXTS, True),
+    "rt": (frozenset(("ruby",)), _RUBY_TEXTS, True),
+    "tbody": (_TABLE, _TABLE_SECTIONS, True),
+    "td": (frozenset(("tr",)), _CELLS, True),
+    "tfoot": (_TABLE, frozenset(), True),
+    "th": (frozenset(("tr",)), _CELLS, True),
+    "thead": (_TABLE, _TABLE_SECTIONS, False),
+    "tr": (frozenset(("table", "tbody", "tfoot", "thead")), frozenset(("tr",)), True),
+}
+
+
+class Markup(str):
+    """A string of markup, e.g. text already escaped.  Markup children are never escaped
+    by AutoEscape."""
+
+    __slots__ = ()
+
+
+# Escaped text by text, for text that needed escaping; see escape_text.  It is cleared
+# when it reaches _ATTR_CACHE_SIZE entries.  Longer strings are not cached.
+_ESCAPE_CACHE_MAX_LENGTH = 256
+_escaped_texts: Dict[str, str] = {}
+
+
+def _escape_text(text: str) -> str:
+    """Escapes &, < and > in text.  Text without them is returned as is; only the
+    characters present are replaced, which is faster in CPython than a single pass over
+    text with str.translate or re.sub."""
+
+    if "&" not in text and "<" not in text and ">" not in text:
+        return text
+    escaped = _escaped_texts.get(text)
+    if escaped is not None:
+        return escaped
+    escaped = text
+    if "&" in escaped:
+        escaped = escaped.replace("&", "&amp;")
+    if "<" in escaped:
+        escaped = escaped.replace("<", "&lt;")
+    if ">" in escaped:
+        escaped = escaped.replace(">", "&gt;")
+    if len(text) <= _ESCAPE_CACHE_MAX_LENGTH:
+        if len(_escaped_texts) >= _ATTR_CACHE_SIZE:
+            _escaped_texts.clear()
+        _escaped_texts[text] = escaped
+    return escaped
+
+
+def escape_text(value: Any) -> Markup:
+    """Returns str(value) with &, < and > escaped, as Markup, so that it is not escaped
+    again.  Markup values are returned as is."""
+
+    if isinstance(value, Markup):
+        return value
+    return Markup(_escape_text(str(value)))
+
+
+def _render_value(value: Any, escape: bool) -> str:
+    """Renders value, an element or text, like a child; text is escaped if escape is
+    True, unless it is Markup."""
+
+    if isinstance(value, _Element):
+        return "".join(value._iter_segments(escape=escape))
+    if escape and not isinstance(value, Markup):
+        return _escape_text(str(value))
+    return value if value.__class__ is str else str(value)
+
+
+class _AttributeDict(dict):
+    """Attribute dict that invalidates the cached markup of its element when changed.
+    The owner is set only once the element takes part in render caching."""
+
+    # _owner is left unset until the element takes part in render caching, which keeps
+    # construction at the speed of dict.
+    __slots__ = ("_owner",)
+
+    def _changed(self):
+        owner_ref = getattr(self, "_owner", None)
+        owner = owner_ref() if owner_ref is not None else None
+        if owner is not None:
+            owner._invalidate()  # pylint: disable=protected-access
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._changed()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._changed()
+
+    def __ior__(self, other):
+        super().update(other)
+        self._changed()
+        return self
+
+    def __reduce__(self):
+        return (self.__class__, (dict(self),))
+
+    def clear(self):
+        super().clear()
+        self._changed()
+
+    def pop(self, *args):
+        value = super().pop(*args)
+        self._changed()
+        return value
+
+    def popitem(self):
+        item = super().popitem()
+        self._changed()
+        return item
+
+    def setdefault(self, key, default=None):
+        value = super().setdefault(key, default)
+        self._changed()
+        return value
+
+    def update(self, *args, **kwargs):  # pylint: disable=arguments-differ
+        super().update(*args, **kwargs)
+        self._changed()
+
+
+def _cache_captured(captured: List[list], tape: List[str]):
+    """Caches the markup of the elements captured by _Element._walk_segments, recorded in
+    captured as offsets in tape; see there.  The outermost element is cached, and the
+    elements inside it only if their markup is at most half as long as that of the
+    closest captured element containing them, so that no character is copied more than
+    about log2 of the length of the outermost markup times.  The others stay tracked,
+    and are captured when rendered outside it."""
+
+    # pylint: disable=protected-access
+    ends = [0]
+    ends.extend(accumulate(map(len, tape)))
+    # markup lengths of the elements containing the current one, by depth; elements come
+    # after those containing them in reverse closing order.
+    lengths: List[int] = []
+    for node, start, end, depth, escaping in reversed(captured):
+        length = ends[end] - ends[start]
+        del lengths[depth:]
+        lengths.append(length)
+        if depth and 2 * length > lengths[depth - 1]:
+            continue
+        rendered = "".join(tape[start:end])
+        node._rendered = Markup(rendered) if escaping else rendered
+
+
+def _extra_slots(cls: type) -> Tuple[str, ...]:
+    """Returns the names of the slots of the element class cls other than those of
+    _Element."""
+
+    names = _slot_names.get(cls)
+    if names is None:
+        names = _slot_names[cls] = tuple(
+            name
+            for base in cls.__mro__
+            if base is not _Element
+            for name in base.__dict__.get("__slots__", ())
+            if name != "__weakref__"
+        )
+    return names
+
+
+class _Element:
+    """Base class for HTML elements.
+
+    The markup of an element rendered more than once is cached, and reused until the
+    element or one of its descendants is changed with append, insert, remove, or through
+    the attributes dict.  Children other than elements are assumed to be immutable."""
+
+    # Elements are slotted to keep large trees compact; subclasses must declare
+    # __slots__ too, or instances acquire a __dict__.
+    # _rendered is None, _SEEN, _TRACKED, or the cached markup, which is Markup if it was
+    # rendered below an AutoEscape element; _parents holds weak
+    # references to the elements whose cached markup or index includes this element;
+    # _index is the index of the tree rooted at the element, set by _tree_index.
+    __slots__ = (
+        "_children",
+        "_attributes",
+        "_rendered",
+        "_parents",
+        "_index",
+        "__weakref__",
+    )
+
+    # tag must be set in subclasses, as a class attribute.  The annotation declares its
+    # type, not a slot.
+    tag: str  # pylint: disable=declare-non-slot
     is_empty = False
 
+    # False for elements whose markup must not be cached, nor that of elements containing
+    # them.
+    _cacheable = True
+
+    # False for elements whose text children are not escaped by AutoEscape.
+    _escapes_text = True
+
     # used for attribute names.
     kwmap = {"%s_" % kw: str(kw) for kw in kwlist}
 
@@ -135,15 +857,158 @@ class _Element:
         # names, and so underscores are replaced with dashes.
 
         super(_Element, self).__init__()
-        self._children = [child for child in children if child is not None]
+        self._children = [
+            child for child in children if child is not None
+        ] or _NO_CHILDREN
 
         # strip attributes having value None or False, but allow 0
-        self.attributes = {
-            self._attr_name(k): v
-            for k, v in attributes.items()
-            if v not in (None, False)
+        # attribute dicts are only allocated for elements having attributes; see the
+        # attributes property.
+        self._attributes = (
+            _AttributeDict(
+                {
+                    _attr_names.get(k) or self._cache_attr_name(k): v
+                    for k, v in attributes.items()
+                    if v not in (None, False)
+                }
+            )
+            if attributes
+            else None
+        )
+        self._rendered = None
+        self._parents = None
+
+    @property
+    def attributes(self) -> dict:
+        """Gets/sets the attribute dict of the element.  The setter copies value."""
+
+        if self._children.__class__ is _SharedChildren:
+            self._unshare()
+        if self._attributes is None:
+            self._attributes = _AttributeDict()
+            if self._rendered is not None:
+                self._attributes._owner = ref(self)
+        return self._attributes
+
+    @attributes.setter
+    def attributes(self, value: dict):
+        if self._children.__class__ is _SharedChildren:
+            self._unshare()
+        elif self._children.__class__ is _FrozenChildren:
+            raise TypeError("interned elements cannot be changed.")
+        self._attributes = _AttributeDict(value)
+        self._invalidate()
+        if self._rendered is not None:
+            self._attributes._owner = ref(self)
+
+    def clone(self) -> "_Element":
+        """Returns a copy of the tree rooted at self.  The copy is made lazily: it shares
+        its children and attribute dicts with self, and an element of the copy is copied
+        from the original only when it is changed, or one of its descendants is reached
+        through children, find_by_id, select, or the like.  Filling in one element of a
+        cloned layout thus costs about as much as the path down to it.
+
+        self must not be changed while the copy is in use, as the changes would show
+        through the parts of the copy still shared.  Lazy elements share their iterable,
+        and render once across self and its copies."""
+
+        cls = self.__class__
+        copy = object.__new__(cls)
+        for name in _extra_slots(cls):
+            if hasattr(self, name):
+                setattr(copy, name, getattr(self, name))
+        children = self._children
+        if children.__class__ is not _SharedChildren:
+            children = _SharedChildren(children) if children else _NO_SHARED_CHILDREN
+        copy._children = children
+        copy._attributes = self._attributes
+        copy._rendered = None
+        copy._parents = None
+        return copy
+
+    def _unshare(self):
+        """Gives self, an element copied by clone, its own copies of its children and
+        attribute dict if they are still shared with the element it was copied from."""
+
+        children = self._children
+        if children.__class__ is not _SharedChildren:
+            return
+        # copies of the children are not tracked.
+        self._invalidate()
+        self._replace_children(
+            _CopiedChildren(
+                [x.clone() if isinstance(x, _Element) else x for x in children]
+            )
+            or _NO_CHILDREN
+        )
+        if self._attributes is not None:
+            self._attributes = _AttributeDict(self._attributes)
+
+    def _replace_children(self, children: Sequence[Any]):
+        """Replaces the children of self with children, which take their places one for
+        one, e.g. with copies of them."""
+
+        self._children = children
+
+    def __getstate__(self):
+        # cache state refers to other trees by weak reference, and is not copied.
+        return {
+            name: getattr(self, name)
+            for cls in type(self).__mro__
+            for name in cls.__dict__.get("__slots__", ())
+            if name not in ("_rendered", "_parents", "_index", "__weakref__")
+            and hasattr(self, name)
         }
 
+    def __setstate__(self, state: dict):
+        for name, value in state.items():
+            setattr(self, name, value)
+        self._rendered = None
+        self._parents = None
+
+    def _invalidate(self):
+        """Discards the cached markup and index of self and of the elements that include
+        it."""
+
+        pending = [self]
+        while pending:
+            node = pending.pop()
+            if node._rendered is None:
+                # ancestors of an element that has no cached markup nor index have none
+                # either.
+                continue
+            node._rendered = None
+            node._index = None
+            if _segment_values:
+                _segment_values.pop(node, None)
+            parents = node._parents
+            if parents is None:
+                continue
+            for parent_ref in parents if isinstance(parents, list) else (parents,):
+                parent = parent_ref()
+                if parent is not None:
+                    pending.append(parent)
+
+    def _track(self, parent: Optional["_Element"]):
+        """Arranges for changes to self to invalidate the cached markup or index of
+        parent."""
+
+        attributes = self._attributes
+        if attributes is not None and not hasattr(attributes, "_owner"):
+            attributes._owner = ref(self)
+        if parent is None or self._children.__class__ is _FrozenChildren:
+            # interned elements never change, and may have very many parents.
+            return
+        parents = self._parents
+        if isinstance(parents, list):
+            if not any(x() is parent for x in parents):
+                parents[:] = [x for x in parents if x() is not None]
+                parents.append(ref(parent))
+        elif parents is None or parents() is None:
+            self._parents = ref(parent)
+        elif parents() is not parent:
+            self._parents = [parents, ref(parent)]
+
     def _attr_name(self, name: str):
         """Implements attribute name conventions."""
 
@@ -153,37 +1018,610 @@ class _Element:
             else self.kwmap.get(name, name)
         )
 
+    def _cache_attr_name(self, name: str) -> str:
+        """Returns self._attr_name(name), and caches the result for all elements."""
+
+        if len(_attr_names) >= _ATTR_CACHE_SIZE:
+            _attr_names.clear()
+        attr_name = _attr_names[name] = self._attr_name(name)
+        return attr_name
+
     def _generate_attrs(self):
-        """Generates attribute strings."""
-
-        # if isinstance(attr_value, bool), then I assume that __init__ filtered out attributes.
-        # with value False.
-        return " ".join(
-            [
-                attr_name
-                if isinstance(attr_value, bool)
-                else "%s=%s" % (attr_name, quoteattr(str(attr_value)))
-                for attr_name, attr_value in self.attributes.items()
-            ]
-        )
+        """Generates attribute strings; see _attribute_string."""
 
-    def __str__(self):
-        return (
-            "<!DOCTYPE html>\n<%s%s%s>%s</%s>"
-            if self.tag == "html"
-            else "<%s%s%s>%s</%s>"
-        ) % (
+        attributes = self._attributes
+        if not attributes:
+            return ""
+        return _attribute_string(attributes)
+
+    def _open_markup(self) -> str:
+        """Returns the markup emitted before children, i.e. the start tag."""
+
+        return ("<!DOCTYPE html>\n<%s%s%s>" if self.tag == "html" else "<%s%s%s>") % (
             self.tag,
-            " " if self.attributes else "",
+            " " if self._attributes else "",
             self._generate_attrs(),
-            "".join([str(child) for child in self._children]),
+        )
+
+    def _close_markup(self) -> Optional[str]:
+        """Returns the markup emitted after children, i.e. the end tag.  None means
+        that the element has no content, and its children are not rendered."""
+
+        return "</%s>" % self.tag
+
+    def _minified_open_markup(self) -> str:
+        """Returns the start tag in minified markup, whose attribute values are quoted
+        only where necessary."""
+
+        attributes = self._attributes
+        if not attributes:
+            return self._open_markup()
+        return ("<!DOCTYPE html>\n<%s %s>" if self.tag == "html" else "<%s %s>") % (
             self.tag,
+            _attribute_string(attributes, True),
         )
 
+    def _iter_segments(
+        self, memoize: bool = True, async_children: bool = False, escape: bool = False
+    ) -> Iterator[Any]:
+        """Generates the markup of the tree rooted at self as a sequence of strings.
+        The tree is walked with an explicit stack, so depth is not limited by the
+        recursion limit, and no intermediate strings are built for subtrees.
+
+        If memoize is True, cached markup is used where available, and the markup of
+        elements rendered for the second time is captured and cached.  Only the segments
+        of subtrees being captured are kept.
+
+        Async children (awaitables and async generators) are generated as is if
+        async_children is True, and the markup of the elements containing them is not
+        cached; otherwise they raise TypeError.  Below an AutoEscape element, async
+        children are generated wrapped in _EscapedAsyncChild.
+
+        Text children are escaped below AutoEscape elements, or everywhere if escape is
+        True, except Markup and the children of elements whose _escapes_text is False.
+
+        While a RenderProfiler is active, the elements rendered are reported to it."""
+
+        profiler = _profiler
+        if profiler is None:
+            return self._walk_segments(memoize, async_children, escape, None)
+        profile = profiler._start()  # pylint: disable=protected-access
+        return profile.count(
+            self._walk_segments(memoize, async_children, escape, profile)
+        )
+
+    def _walk_segments(  # pylint: disable=too-many-branches,too-many-statements,too-many-locals
+        self,
+        memoize: bool,
+        async_children: bool,
+        escape: bool,
+        profile: Optional[Any],
+    ) -> Iterator[Any]:
+        """Implements _iter_segments.  profile is None, or receives enter and exit calls
+        for each element rendered; exit is called after the last segment of the element
+        has been generated."""
+
+        # pylint: disable=protected-access
+        stack = [iter((self,))]
+        # (element, end tag, offset in tape of captured markup or -1) for open elements.
+        frames = []
+        tape = []
+        # (element, start, end in tape of its markup, number of elements captured
+        # containing it, escaping) for the elements captured since the outermost one was
+        # opened, in the order they were closed.
+        captured: List[Tuple[_Element, int, int, int, bool]] = []
+        captures = hits = misses = 0
+        # number of open AutoEscape elements, plus 1 if escape is True; markup cached while
+        # escaping is Markup, and is not used otherwise, and vice versa.
+        escaping = int(escape)
+        cached = Markup if escaping else str
+        try:
+            while stack:
+                for node in stack[-1]:
+                    if not isinstance(node, _Element):
+                        if not isinstance(node, str) and _is_async_child(node):
+                            if not async_children:
+                                raise TypeError(
+                                    "element has async children; use render_async."
+                                )
+                            if captures:
+                                frames = [(x, y, -1) for x, y, _ in frames]
+                                captures = 0
+                                tape.clear()
+                                captured.clear()
+                            if escaping and frames[-1][0]._escapes_text:
+                                node = _EscapedAsyncChild(node)
+                            yield node
+                            continue
+                        if (
+                            escaping
+                            and frames[-1][0]._escapes_text
+                            and not isinstance(node, Markup)
+                        ):
+                            segment = _escape_text(str(node))
+                        else:
+                            segment = str(node)
+                        if captures:
+                            tape.append(segment)
+                        yield segment
+                        continue
+                    if profile is not None:
+                        profile.enter(node)
+                    if not memoize:
+                        yield node._open_markup()
+                        end_tag = node._close_markup()
+                        if end_tag is not None:
+                            if end_tag is _AUTO_ESCAPE_END:
+                                escaping += 1
+                            stack.append(
+                                node._iter_escaped_children()
+                                if escaping
+                                else node._iter_children()
+                            )
+                            frames.append((node, end_tag, -1))
+                            break
+                        if profile is not None:
+                            profile.exit(False)
+                        continue
+                    if captures:
+                        if not node._cacheable:
+                            # nothing containing node can be cached.
+                            frames = [(x, y, -1) for x, y, _ in frames]
+                            captures = 0
+                            tape.clear()
+                            captured.clear()
+                        else:
+                            node._track(frames[-1][0] if frames else None)
+                    rendered = node._rendered
+                    if rendered.__class__ is cached:
+                        hits += 1
+                        if captures:
+                            tape.append(rendered)
+                        yield rendered
+                        if profile is not None:
+                            profile.exit(True)
+                        continue
+                    misses += 1
+                    capture = rendered is _SEEN and node._cacheable
+                    if capture:
+                        node._track(None)
+                    else:
+                        node._rendered = _SEEN
+                    segment = node._open_markup()
+                    end_tag = node._close_markup()
+                    if end_tag is None:
+                        if capture:
+                            node._rendered = Markup(segment) if escaping else segment
+                        if captures:
+                            tape.append(segment)
+                        yield segment
+                        if profile is not None:
+                            profile.exit(False)
+                        continue
+                    if end_tag is _AUTO_ESCAPE_END:
+                        escaping += 1
+                        cached = Markup
+                    if capture:
+                        frames.append((node, end_tag, len(tape)))
+                        captures += 1
+                    else:
+                        frames.append((node, end_tag, -1))
+                    if captures:
+                        tape.append(segment)
+                    yield segment
+                    stack.append(
+                        node._iter_escaped_children()
+                        if escaping
+                        else node._iter_children()
+                    )
+                    break
+                else:
+                    stack.pop()
+                    if not frames:
+                        continue
+                    node, end_tag, start = frames.pop()
+                    if end_tag is _AUTO_ESCAPE_END:
+                        escaping -= 1
+                        if not escaping:
+                            cached = str
+                    if captures:
+                        tape.append(end_tag)
+                    yield end_tag
+                    if start >= 0:
+                        captures -= 1
+                        captured.append(
+                            (node, start, len(tape), captures, bool(escaping))
+                        )
+                        if not captures:
+                            _cache_captured(captured, tape)
+                            captured.clear()
+                            tape.clear()
+                    if profile is not None:
+                        profile.exit(False)
+        finally:
+            _render_stats.hits += hits
+            _render_stats.misses += misses
+
+    def _iter_children(self) -> Iterator[Any]:
+        """Returns an iterator over the children to render."""
+
+        return iter(self._children)
+
+    def _iter_escaped_children(self) -> Iterator[Any]:
+        """Returns an iterator over the children to render below an AutoEscape element,
+        whose text children, other than Markup, are escaped by the renderer."""
+
+        return self._iter_children()
+
+    def _iter_minified_children(self, escape: bool) -> Iterator[Any]:
+        """Returns an iterator over the children to render in minified markup; escape is
+        True below an AutoEscape element."""
+
+        return self._iter_escaped_children() if escape else self._iter_children()
+
+    def _iter_minified(self, escape: bool = False) -> Iterator[str]:
+        """Generates the minified markup of the tree rooted at self, which omits the end
+        tags that HTML allows to omit given the following sibling and the parent, and the
+        quotes of attribute values that need none.  Cached markup is neither used nor
+        filled, as it is not minified; escape and async children are handled as by
+        _iter_segments."""
+
+        profiler = _profiler
+        if profiler is None:
+            return self._walk_minified(escape, None)
+        profile = profiler._start()  # pylint: disable=protected-access
+        return profile.count(self._walk_minified(escape, profile))
+
+    def _walk_minified(  # pylint: disable=too-many-branches
+        self, escape: bool, profile: Optional[Any]
+    ) -> Iterator[str]:
+        """Implements _iter_minified, as _walk_segments does _iter_segments."""
+
+        # pylint: disable=protected-access
+        stack = [iter((self,))]
+        # (element, end tag) for open elements.
+        frames = []
+        escaping = int(escape)
+        # the end tag of the element last closed, if it may be omitted depending on what
+        # follows, with its _OPTIONAL_END_TAGS rule.
+        held = None
+        while stack:
+            for node in stack[-1]:
+                if held is not None:
+                    tag = getattr(node, "tag", None)
+                    if not (
+                        isinstance(node, _Element)
+                        and tag is not None
+                        and (held[1] is None or tag in held[1])
+                    ):
+                        yield held[0]
+                    held = None
+                if not isinstance(node, _Element):
+                    if not isinstance(node, str) and _is_async_child(node):
+                        raise TypeError("element has async children; use render_async.")
+                    if (
+                        escaping
+                        and frames[-1][0]._escapes_text
+                        and not isinstance(node, Markup)
+                    ):
+                        yield _escape_text(str(node))
+                    else:
+                        yield str(node)
+                    continue
+                if profile is not None:
+                    profile.enter(node)
+                yield node._minified_open_markup()
+                end_tag = node._close_markup()
+                if end_tag is None:
+                    if profile is not None:
+                        profile.exit(False)
+                    continue
+                if end_tag is _AUTO_ESCAPE_END:
+                    escaping += 1
+                stack.append(node._iter_minified_children(escaping > 0))
+                frames.append((node, end_tag))
+                break
+            else:
+                stack.pop()
+                if not frames:
+                    continue
+                node, end_tag = frames.pop()
+                if held is not None:
+                    if not held[2]:
+                        yield held[0]
+                    held = None
+                if end_tag is _AUTO_ESCAPE_END:
+                    escaping -= 1
+                tag = getattr(node, "tag", None)
+                rule = _OPTIONAL_END_TAGS.get(tag)
+                if (
+                    rule is not None
+                    and frames
+                    and getattr(frames[-1][0], "tag", None) in rule[0]
+                ):
+                    held = (end_tag, rule[1], rule[2])
+                elif frames or tag != "html":
+                    # </html> is omitted at the end of the document.
+                    yield end_tag
+                if profile is not None:
+                    profile.exit(False)
+        if held is not None:
+            yield held[0]
+
+    def __str__(self):
+        # join collects the segments of the whole tree into a single buffer, so each
+        # piece of markup is copied once regardless of its depth in the tree.
+        return "".join(self._iter_segments())
+
+    def render(self, *, minify: bool = False) -> str:
+        """Returns the markup of the element, i.e. str(element).  If minify is True, the
+        markup is minified: end tags that HTML allows to omit, e.g. </li> before another
+        li element or </td> at the end of a row, are omitted, as are the quotes of
+        attribute values that need none.  A document parses to the same tree either way,
+        provided elements are nested as HTML allows.  Minified markup is not cached."""
+
+        if minify:
+            return "".join(self._iter_minified())
+        return "".join(self._iter_segments())
+
+    def iter_render(
+        self, chunk_size: int = DEFAULT_CHUNK_SIZE, *, minify: bool = False
+    ) -> Iterator[str]:
+        """Renders the element as a sequence of strings at most chunk_size characters
+        long.  Joined, the chunks are identical to element.render(minify=minify)."""
+
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be positive.")
+
+        pending = []
+        size = 0
+        for segment in self._iter_minified() if minify else self._iter_segments():
+            if not segment:
+                continue
+            pending.append(segment)
+            size += len(segment)
+            if size >= chunk_size:
+                data = "".join(pending)
+                end = size - size % chunk_size
+                for start in range(0, end, chunk_size):
+                    yield data[start : start + chunk_size]
+                pending = [data[end:]] if end < size else []
+                size -= end
+        if pending:
+            yield "".join(pending)
+
+    def write_to(
+        self, fp: IO[str], chunk_size: int = DEFAULT_CHUNK_SIZE, *, minify: bool = False
+    ) -> int:
+        """Writes the rendered element, minified if minify is True, to the text file fp
+        in chunks, and returns the number of characters written."""
+
+        count = 0
+        for chunk in self.iter_render(chunk_size, minify=minify):
+            fp.write(chunk)
+            count += len(chunk)
+        return count
+
+    def _start_async_children(self) -> Dict[int, Any]:
+        """Schedules the async children in the tree rooted at self to run concurrently.
+        Returns a dict mapping the id of each async child to its task, or for an async
+        generator, to an _AsyncStream."""
+
+        # pylint: disable=protected-access
+        started: Dict[int, Any] = {}
+        pending = [self]
+        while pending:
+            node = pending.pop()
+            if node._rendered.__class__ is str or node._close_markup() is None:
+                continue
+            for child in node._children:
+                if isinstance(child, _Element):
+                    pending.append(child)
+                elif (
+                    child.__class__ is not str
+                    and id(child) not in started
+                    and _is_async_child(child)
+                ):
+                    started[id(child)] = _start_async_child(child)
+        return started
+
+    async def render_async(
+        self,
+        send: Callable[[str], Awaitable[Any]],
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ):
+        """Renders the element, passing the markup in document order to the coroutine
+        function send in chunks of about chunk_size characters.
+
+        Children may be awaitables, e.g. coroutines, or async generators.  All of them are
+        started before rendering begins, so they run concurrently; output stops at each one
+        until its value is available, after the markup preceding it has been sent.  The
+        value of an awaitable, and each item of an async generator, is rendered like a
+        child; it may be None, a string, an element, or a list or tuple of these.  As
+        coroutines can be awaited only once, a tree with async children can be rendered
+        only once."""
+
+        started = self._start_async_children()
+        try:
+            await self._render_async(send, chunk_size, started)
+        finally:
+            for task in started.values():
+                if isinstance(task, _AsyncStream):
+                    task = task.task
+                if not task.done():
+                    task.cancel()
+
+    async def _render_async(
+        self,
+        send: Callable[[str], Awaitable[Any]],
+        chunk_size: int,
+        started: Dict[int, Any],
+    ):
+        """Implements render_async; started is the result of _start_async_children."""
+
+        pending = []
+        size = 0
+        for segment in self._iter_segments(async_children=True):
+            if isinstance(segment, str):
+                if segment:
+                    pending.append(segment)
+                    size += len(segment)
+                    if size >= chunk_size:
+                        await send("".join(pending))
+                        pending = []
+                        size = 0
+                continue
+            if pending:
+                await send("".join(pending))
+                pending = []
+                size = 0
+            escape_value = segment.__class__ is _EscapedAsyncChild
+            if escape_value:
+                segment = segment.child
+            waiting = started.get(id(segment))
+            if waiting is None:
+                # an item of a Lazy element, which is not started in advance.
+                waiting = started[id(segment)] = _start_async_child(segment)
+            if isinstance(waiting, _AsyncStream):
+                if waiting.task.done() and waiting.queue.empty():
+                    raise RuntimeError("async generator child already consumed.")
+                while True:
+                    item = await waiting.queue.get()
+                    if item is _END_OF_STREAM:
+                        break
+                    await _render_async_value(item, send, chunk_size, escape_value)
+                await waiting.task
+            else:
+                await _render_async_value(await waiting, send, chunk_size, escape_value)
+        if pending:
+            await send("".join(pending))
+
+    def _output_encoding(self) -> str:
+        """Returns the default encoding of iter_bytes."""
+
+        return "utf-8"
+
+    def iter_bytes(
+        self,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        encoding: Optional[str] = None,
+        *,
+        minify: bool = False,
+    ) -> Iterator[bytes]:
+        """Renders the element as a sequence of byte strings at most chunk_size bytes
+        long, encoded in encoding, by default utf-8 (or the document encoding for Html).
+        Joined, the chunks are identical to
+        element.render(minify=minify).encode(encoding)."""
+
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be positive.")
+
+        encode, flush = _segment_encoder(encoding or self._output_encoding())
+        buffer = bytearray()
+        for segment in self._iter_minified() if minify else self._iter_segments():
+            if not segment:
+                continue
+            buffer += encode(segment)
+            if len(buffer) >= chunk_size:
+                view = memoryview(buffer)
+                end = len(buffer) - len(buffer) % chunk_size
+                for start in range(0, end, chunk_size):
+                    yield bytes(view[start : start + chunk_size])
+                view.release()
+                del buffer[:end]
+        buffer += flush()
+        if buffer:
+            yield bytes(buffer)
+
+    def write_bytes_to(
+        self,
+        fp: IO[bytes],
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        encoding: Optional[str] = None,
+        *,
+        minify: bool = False,
+    ) -> int:
+        """Writes the element encoded as by iter_bytes to the binary file fp, e.g. a file
+        opened in binary mode or socket.makefile("wb"), and returns the number of bytes
+        written."""
+
+        count = 0
+        for chunk in self.iter_bytes(chunk_size, encoding, minify=minify):
+            fp.write(chunk)
+            count += len(chunk)
+        return count
+
+    def byte_length(
+        self, encoding: Optional[str] = None, *, minify: bool = False
+    ) -> int:
+        """Returns the length in bytes of the element encoded as by iter_bytes, e.g. for a
+        Content-Length header, without keeping the encoded markup.  The element is walked
+        as when rendered, reusing the cached markup of its subtrees, and the encoded
+        lengths of long non-ASCII segments are kept by codec with the elements generating
+        them, until they change.
+
+        The element is rendered, and its markup cached by the walk, as by a second
+        render, so that render_into or iter_bytes then reuses it rather than rendering it
+        again.  Like any render, the walk consumes the iterables of Lazy elements and the
+        rows of tables made by Table.from_rows, which can therefore not be measured and
+        then rendered."""
+
+        encoding = encoding or self._output_encoding()
+        if not minify and self._rendered is None:
+            self._rendered = _SEEN
+        if not _is_stateless_codec(encoding):
+            encode, flush = _segment_encoder(encoding)
+            segments = self._iter_minified() if minify else self._iter_segments()
+            return sum(len(encode(x)) for x in segments) + len(flush())
+
+        # stateless codecs encode ASCII characters as single bytes, and segments
+        # independently.
+        name = codecs.lookup(encoding).name
+        owners = _SegmentOwners()
+        length = 0
+        for segment in owners.iter_segments(self, minify):
+            if segment.isascii():
+                length += len(segment)
+            elif len(segment) < _BYTE_LENGTH_MIN_SEGMENT:
+                length += len(segment.encode(encoding))
+            else:
+                size = owners.get(segment, name)
+                if size is None:
+                    size = len(segment.encode(encoding))
+                    owners.keep(segment, name, size)
+                length += size
+        return length
+
+    def render_into(
+        self, buffer: Any, encoding: Optional[str] = None, *, minify: bool = False
+    ) -> int:
+        """Writes the element encoded as by iter_bytes to the start of buffer, a writable
+        bytes-like object such as a bytearray of byte_length(encoding) bytes, and returns
+        the number of bytes written.  Raises ValueError if buffer is too small; it is
+        never resized."""
+
+        encode, flush = _segment_encoder(encoding or self._output_encoding())
+        segments = self._iter_minified() if minify else self._iter_segments()
+        with memoryview(buffer) as view:
+            target = view.cast("B") if view.format != "B" else view
+            size = len(target)
+            position = 0
+            for segment in chain(segments, (None,)):
+                data = flush() if segment is None else encode(segment)
+                end = position + len(data)
+                if end > size:
+                    raise ValueError(
+                        "buffer is too small, %d bytes needed at least." % end
+                    )
+                target[position:end] = data
+                position = end
+        return position
+
     def children(self, tag: Optional[str] = None):
         """Returns a list of all children in the order added.
         If tag is not None, then the list is filtered by tag."""
 
+        self._unshare()
         return [
             x for x in self._children if tag is None or getattr(x, "tag", None) == tag
         ]
@@ -191,63 +1629,510 @@ class _Element:
     def append(self, child: "_Element"):
         """Appends child element."""
         assert isinstance(child, _Element)
-        self._children.append(child)
+        self._own_children().append(child)
+        self._invalidate()
 
     def insert(self, offset: int, child: "_Element"):
         """Inserts child element at offset."""
 
         assert isinstance(child, _Element)
-        self._children.insert(offset, child)
+        self._own_children().insert(offset, child)
+        self._invalidate()
 
     def remove(self, child: "_Element"):
         """Removes child element from children, if present."""
 
-        self._children = [x for x in self._children if x != child]
+        self._unshare()
+        if self._children.__class__ is _FrozenChildren:
+            raise TypeError("interned elements cannot be changed.")
+        children = [x for x in self._children if x != child]
+        if len(children) != len(self._children):
+            if self._children.__class__ is _CopiedChildren:
+                children = _CopiedChildren(children)
+            self._children = children or _NO_CHILDREN
+            self._invalidate()
+
+    def _own_children(self) -> list:
+        """Returns the list of children, replacing the shared empty placeholder with a new
+        list, or children shared by clone with copies, if necessary.  Raises TypeError
+        if self is interned."""
+
+        self._unshare()
+        if self._children.__class__ is _FrozenChildren:
+            raise TypeError("interned elements cannot be changed.")
+        if self._children is _NO_CHILDREN:
+            self._children = []
+        return self._children
+
+    def _walk_tracked(
+        self,
+    ) -> Iterator[Tuple["_Element", Optional["_Element"]]]:
+        """Generates (element, parent) for the elements of the tree rooted at self in
+        document order, and arranges for changes to them to invalidate the index of
+        self."""
+
+        # pylint: disable=protected-access
+        self._track(None)
+        if self._rendered is None:
+            self._rendered = _TRACKED
+        stack = [(self, None)]
+        while stack:
+            node, parent = stack.pop()
+            if parent is not None:
+                node._track(parent)
+                if node._rendered is None:
+                    node._rendered = _TRACKED
+            yield node, parent
+            stack.extend(
+                (child, node)
+                for child in reversed(node._children)
+                if isinstance(child, _Element)
+            )
+
+    def _tree_index(self) -> _TreeIndex:
+        """Returns the index of the tree rooted at self.  The index is built when first
+        needed, and discarded when the tree changes."""
+
+        # the index refers to self, and is kept on self rather than in a dict by element
+        # so that the tree can be collected with it.
+        index = getattr(self, "_index", None)
+        if index is None:
+            index = self._index = _TreeIndex(self)
+        return index
 
     def find_by_id(self, value: Any) -> Optional["_Element"]:
         """Finds the element in the tree having attribute id="value", if present.
         Some so-called "full stack developers" think it's okay to have multiple elements
-        with the same id value. This method does not support that."""
+        with the same id value. This method raises DuplicateIdError for such a value.
 
-        if self.attributes.get("id") == value:  # pylint: disable=no-else-return
-            return self
+        Lookups use an index of the tree, built by the first call and kept until the tree
+        is changed with append, insert, remove, or through an attributes dict."""
+
+        if self._children.__class__ in _CLONED_CHILDREN:
+            # a copy made by clone is searched without walking the subtrees it shares.
+            paths = self._find_cloned(value)
+            found = []
         else:
-            for child in self._children:
-                element = child.find_by_id(value)
-                if element:
-                    break
-            else:
-                element = None
-            return element
+            try:
+                index = self._tree_index()
+                element = index.ids.get(value)
+            except TypeError:
+                return None
+            if element is None:
+                return None
+            found = element if isinstance(element, list) else [element]
+            paths = [index.path(x) for x in found] if index.shares else []
+        if paths:
+            copies: Dict[int, Any] = {}
+            found = [_unshared(x, copies) for x in paths]
+        if len(found) > 1:
+            raise DuplicateIdError(
+                "%d elements have id %r." % (len(found), value), found
+            )
+        return found[0] if found else None
+
+    def _find_cloned(self, value: Any) -> List[List["_Element"]]:
+        """Returns the paths from self, an element copied by clone, down to the elements
+        having attribute id="value".  Elements copied by clone are searched directly, and
+        the other subtrees through their index, which is kept across copies."""
+
+        # pylint: disable=protected-access
+        paths = []
+        pending = [[self]]
+        while pending:
+            path = pending.pop()
+            node = path[-1]
+            attributes = node._attributes
+            if attributes and "id" in attributes and attributes["id"] == value:
+                paths.append(path)
+            for child in reversed(node._children):
+                if not isinstance(child, _Element):
+                    continue
+                if child._children.__class__ in _CLONED_CHILDREN:
+                    pending.append(path + [child])
+                    continue
+                index = child._tree_index()
+                try:
+                    element = index.ids.get(value)
+                except TypeError:
+                    return []
+                if element is not None:
+                    for found in element if isinstance(element, list) else [element]:
+                        paths.append(path + index.path(found))
+        return paths
+
+    def select(self, selector: str) -> List["_Element"]:
+        """Returns the elements in the tree below self matching the CSS selector, in
+        document order.  See pythtml.query for the selectors supported.
+
+        Selectors are compiled once, and matched using an index of the tree built by the
+        first call, and kept until the tree is changed."""
+
+        from .query import compile_selector  # pylint: disable=import-outside-toplevel
+
+        index = self._tree_index()
+        elements = compile_selector(selector).select(index)
+        if index.shares:
+            copies: Dict[int, Any] = {}
+            elements = [_unshared(index.path(x), copies) for x in elements]
+        return elements
+
+    def select_one(self, selector: str) -> Optional["_Element"]:
+        """Returns the first element in the tree below self matching the CSS selector, or
+        None."""
+
+        from .query import compile_selector  # pylint: disable=import-outside-toplevel
+
+        index = self._tree_index()
+        element = compile_selector(selector).select_one(index)
+        if element is not None and index.shares:
+            element = _unshared(index.path(element), {})
+        return element
+
+    def duplicate_ids(self) -> List[Any]:
+        """Returns the id values shared by more than one element in the tree."""
+
+        return [
+            value
+            for value, element in self._tree_index().ids.items()
+            if isinstance(element, list)
+        ]
 
 
 class _EmptyElement(_Element):
     """Base class for HTML empty elements."""
 
+    __slots__ = ()
+
     is_empty = True
 
     def __init__(self, **attributes: Any):  # pylint: disable=useless-super-delegation
         super(_EmptyElement, self).__init__(**attributes)
 
-    def __str__(self):
-        return "<%s%s%s>" % (
-            self.tag,
-            " " if self.attributes else "",
-            self._generate_attrs(),
-        )
+    def _close_markup(self) -> Optional[str]:
+        return None
 
 
 class Raw(_Element):
     """Pseudo-element representing raw data."""
 
+    __slots__ = ("_data",)
+
     def __init__(self, data: str, *, escape_data: bool = False):
         """Set escape_data to True to escape some reserved HTML characters in data."""
 
         super().__init__()
-        self.data = escape(str(data), quote=False) if escape_data else str(data)
+        self._data = _escape_text(str(data)) if escape_data else str(data)
+
+    @property
+    def data(self) -> str:
+        """Gets/sets the raw data."""
+
+        return self._data
+
+    @data.setter
+    def data(self, value: str):
+        if self._children.__class__ is _FrozenChildren:
+            raise TypeError("interned elements cannot be changed.")
+        self._data = value
+        self._invalidate()
 
     def __str__(self):
-        return self.data
+        return self._data
+
+    def _open_markup(self) -> str:
+        return self._data
+
+    _minified_open_markup = _open_markup
+
+    def _close_markup(self) -> Optional[str]:
+        return None
+
+
+class _SlotMarkup(str):
+    """The markup of a Slot.  It is an ordinary format field, e.g. {name}, so that the
+    rendered string can still be used with str.format; pythtml.template.compile recognizes
+    instances of this class as slot references."""
+
+    slot: "Slot"
+
+
+class Slot(_Element):
+    """Pseudo-element marking the place of a value supplied when a compiled template is
+    rendered.  See pythtml.template.compile."""
+
+    __slots__ = ("_name", "escape_data", "_markup")
+
+    def __init__(self, name: str, *, escape_data: bool = False):
+        """Set escape_data to True to escape some reserved HTML characters in the values
+        supplied for this slot."""
+
+        super().__init__()
+        self.name = name
+        self.escape_data = escape_data
+
+    @property
+    def name(self) -> str:
+        """Gets/sets the name of the slot, an identifier."""
+
+        return self._name
+
+    @name.setter
+    def name(self, value: str):
+        if not value.isidentifier():
+            raise ValueError("slot name must be an identifier.")
+        if self._children.__class__ is _FrozenChildren:
+            raise TypeError("interned elements cannot be changed.")
+        self._name = value
+        self._markup = _SlotMarkup("{%s}" % value)
+        self._markup.slot = self
+        self._invalidate()
+
+    def _open_markup(self) -> str:
+        return self._markup
+
+    _minified_open_markup = _open_markup
+
+    def _close_markup(self) -> Optional[str]:
+        return None
+
+
+class Lazy(_Element):
+    """Pseudo-element whose children are the items of an iterable, consumed only when
+    the element is rendered, e.g. Tbody(Lazy(Tr(Td(x) for x in row) for row in cursor)).
+    Items are rendered like children; None is skipped.
+
+    The iterable is single-use: rendering a Lazy element a second time raises
+    RuntimeError.  Its items are not children of any element, so children() returns the
+    Lazy element itself, and find_by_id does not look for them.  The markup of a Lazy
+    element, and of the elements containing it, is never cached."""
+
+    __slots__ = ("_iterator",)
+
+    _cacheable = False
+
+    def __init__(self, iterable: Iterable[Any]):
+        super().__init__()
+        self._iterator: Optional[Iterator[Any]] = iter(iterable)
+
+    def _open_markup(self) -> str:
+        return ""
+
+    _minified_open_markup = _open_markup
+
+    def _close_markup(self) -> Optional[str]:
+        return ""
+
+    def _take_iterator(self) -> Iterator[Any]:
+        """Returns the iterator, which can be taken once."""
+
+        iterator = self._iterator
+        if iterator is None:
+            raise RuntimeError("the children of a Lazy element can be rendered once.")
+        self._iterator = None
+        return iterator
+
+    def _iter_children(self) -> Iterator[Any]:
+        return (child for child in self._take_iterator() if child is not None)
+
+
+class _TableRows(Lazy):
+    """Pseudo-element rendering rows of values as tr elements with a precompiled
+    template, without creating elements for rows or cells; see Table.from_rows."""
+
+    __slots__ = ("_count", "_row_attrs", "_formatters")
+
+    def __init__(
+        self,
+        rows: Iterable[Sequence[Any]],
+        count: Optional[int],
+        row_attrs: Union[
+            None, Dict[str, Any], Callable[[Sequence[Any]], Dict[str, Any]]
+        ],
+        cell_formatters: Union[
+            None,
+            Sequence[Optional[Callable[[Any], Any]]],
+            Dict[Any, Callable[[Any], Any]],
+        ],
+        columns: Optional[Sequence[Any]],
+    ):
+        super().__init__(rows)
+        self._count = count
+        self._row_attrs = row_attrs
+        self._formatters = cell_formatters
+        if isinstance(cell_formatters, dict) and columns is not None:
+            names = {name: offset for offset, name in enumerate(columns)}
+            self._formatters = {
+                names.get(key, key): formatter
+                for key, formatter in cell_formatters.items()
+            }
+
+    def _row_attribute_string(
+        self, attributes: Dict[str, Any], minify: bool = False
+    ) -> str:
+        """Returns the attribute string, with a leading space, for keyword-style
+        attributes, e.g. {"class_": "odd"}; see _attribute_string."""
+
+        attributes = {
+            _attr_names.get(k) or self._cache_attr_name(k): v
+            for k, v in attributes.items()
+            if v not in (None, False)
+        }
+        return " " + _attribute_string(attributes, minify) if attributes else ""
+
+    def _iter_children(self) -> Iterator[Any]:
+        return self._iter_rows(self._take_iterator(), False)
+
+    def _iter_escaped_children(self) -> Iterator[Any]:
+        return self._iter_rows(self._take_iterator(), True)
+
+    def _iter_minified_children(self, escape: bool) -> Iterator[Any]:
+        return self._iter_rows(self._take_iterator(), escape, True)
+
+    def _iter_rows(  # pylint: disable=too-many-locals,too-many-branches
+        self, rows: Iterator[Sequence[Any]], escape: bool, minify: bool = False
+    ) -> Iterator[str]:
+        """Generates the markup of each row; cell values are escaped if escape is True.
+        Elements returned by formatters are rendered as markup.  If minify is True, the
+        end tags of rows and cells are omitted, as rows are followed only by rows or the
+        end of the tbody element, and attribute values are quoted only where
+        necessary."""
+
+        count = self._count
+        if count is None:
+            try:
+                first = next(rows)
+            except StopIteration:
+                return
+            count = len(first)
+            rows = chain((first,), rows)
+        row_attrs = self._row_attrs
+        cells_template = ("<td>%s" if minify else "<td>%s</td>") * count
+        row_end = "" if minify else "</tr>"
+        if callable(row_attrs):
+            template = "<tr%s>" + cells_template + row_end
+        else:
+            attrs = self._row_attribute_string(row_attrs, minify) if row_attrs else ""
+            template = "<tr%s>" % attrs.replace("%", "%%") + cells_template + row_end
+        formatters: List[Optional[Callable[[Any], Any]]] = [None] * count
+        if isinstance(self._formatters, dict):
+            for offset, formatter in self._formatters.items():
+                formatters[offset] = formatter
+        elif self._formatters is not None:
+            formatters[: len(self._formatters)] = self._formatters
+        plain = not escape and not any(formatters)
+        markup_class = Markup if escape else str
+
+        for number, row in enumerate(rows):
+            if len(row) != count:
+                raise ValueError(
+                    "row %d has %d values; expected %d." % (number, len(row), count)
+                )
+            if plain:
+                cells = ["" if value is None else value for value in row]
+            else:
+                cells = []
+                for value, formatter in zip(row, formatters):
+                    if formatter is not None:
+                        value = formatter(value)
+                    cells.append("" if value is None else _render_value(value, escape))
+            if callable(row_attrs):
+                cells.insert(
+                    0, self._row_attribute_string(row_attrs(row) or {}, minify)
+                )
+            yield markup_class(template % tuple(cells))
+
+
+class _AutoEscapeEnd(str):
+    """The class of _AUTO_ESCAPE_END."""
+
+    __slots__ = ()
+
+
+# The end markup of AutoEscape elements; the renderer recognizes it by identity.
+_AUTO_ESCAPE_END = _AutoEscapeEnd()
+
+
+class AutoEscape(_Element):
+    """Pseudo-element whose text children, and those of its descendants, are escaped
+    when rendered, e.g. str(AutoEscape(Html(head, body))).  Escaping replaces &, < and >;
+    text without them is rendered as is.  Markup children (see escape_text) and Raw
+    elements are not escaped, nor are the children of script and style elements.
+    AutoEscape adds no markup of its own."""
+
+    __slots__ = ()
+
+    def _open_markup(self) -> str:
+        return ""
+
+    _minified_open_markup = _open_markup
+
+    def _close_markup(self) -> Optional[str]:
+        return _AUTO_ESCAPE_END
+
+    def _output_encoding(self) -> str:
+        if len(self._children) == 1 and isinstance(self._children[0], _Element):
+            return self._children[0]._output_encoding()
+        return super()._output_encoding()
+
+
+class Cached(_Element):
+    """Pseudo-element whose markup is kept in a cache backend under key, e.g.
+    Cached("sidebar", build_sidebar, ttl=60).  When rendered, it inserts the markup stored
+    under key, or if there is none, calls builder() and stores and inserts the rendered
+    value, an element or text.  Markup rendered below an AutoEscape element is stored
+    separately.
+
+    ttl is the time to live of stored markup in seconds; None means until evicted.
+    backend is a pythtml.cache.CacheBackend, by default pythtml.cache.default_backend.
+    Keys must identify the fragment across processes sharing a backend.  The markup of
+    the elements containing a Cached element is not cached in the tree, so that ttl is
+    honored."""
+
+    __slots__ = ("key", "builder", "ttl", "backend")
+
+    _cacheable = False
+
+    def __init__(
+        self,
+        key: str,
+        builder: Callable[[], Any],
+        *,
+        ttl: Optional[float] = None,
+        backend: Optional[_cache.CacheBackend] = None,
+    ):
+        if ttl is not None and ttl <= 0:
+            raise ValueError("ttl must be positive.")
+        super().__init__()
+        self.key = key
+        self.builder = builder
+        self.ttl = ttl
+        self.backend = backend
+
+    def _open_markup(self) -> str:
+        return ""
+
+    _minified_open_markup = _open_markup
+
+    def _close_markup(self) -> Optional[str]:
+        return ""
+
+    def _markup(self, escape: bool) -> str:
+        """Returns the stored markup, building and storing it if necessary."""
+
+        backend = self.backend if self.backend is not None else _cache.default_backend
+        key = self.key + "\0escaped" if escape else self.key
+        markup = backend.get(key)
+        if markup is None:
+            markup = _render_value(self.builder(), escape)
+            backend.set(key, markup, self.ttl)
+        return markup
+
+    def _iter_children(self) -> Iterator[Any]:
+        return iter((self._markup(False),))
+
+    def _iter_escaped_children(self) -> Iterator[Any]:
+        return iter((Markup(self._markup(True)),))
 
 
 # HTML element subclasses.
@@ -256,294 +2141,392 @@ class Raw(_Element):
 class A(_Element):  # pylint: disable=invalid-name
     """Represents an HTML a element."""
 
+    __slots__ = ()
+
     tag = "a"
 
 
 class Abbr(_Element):
     """Represents an HTML abbr element."""
 
+    __slots__ = ()
+
     tag = "abbr"
 
 
 class Acronym(_Element):
     """Represents an HTML acronym element."""
 
+    __slots__ = ()
+
     tag = "acronym"
 
 
 class Address(_Element):
     """Represents an HTML address element."""
 
+    __slots__ = ()
+
     tag = "address"
 
 
 class Area(_EmptyElement):
     """Represents an HTML area element."""
 
+    __slots__ = ()
+
     tag = "area"
 
 
 class Article(_Element):
     """Represents an HTML article element."""
 
+    __slots__ = ()
+
     tag = "article"
 
 
 class Audio(_Element):
     """Represents an HTML audio element."""
 
+    __slots__ = ()
+
     tag = "audio"
 
 
 class B(_Element):  # pylint: disable=invalid-name
     """Represents an HTML b element."""
 
+    __slots__ = ()
+
     tag = "b"
 
 
 class Base(_Element):
     """Represents an HTML base element."""
 
+    __slots__ = ()
+
     tag = "base"
 
 
 class Bdi(_Element):
     """Represents an HTML bdi element."""
 
+    __slots__ = ()
+
     tag = "bdi"
 
 
 class Bdo(_Element):
     """Represents an HTML bdo element."""
 
+    __slots__ = ()
+
     tag = "bdo"
 
 
 class Big(_Element):
     """Represents an HTML big element."""
 
+    __slots__ = ()
+
     tag = "big"
 
 
 class Blockquote(_Element):
     """Represents an HTML blockquote element."""
 
+    __slots__ = ()
+
     tag = "blockquote"
 
 
 class Body(_Element):
     """Represents an HTML body element."""
 
+    __slots__ = ()
+
     tag = "body"
 
 
 class Br(_Element):
     """Represents an HTML br element."""
 
+    __slots__ = ()
+
     tag = "br"
 
 
 class Button(_Element):
     """Represents an HTML button element."""
 
+    __slots__ = ()
+
     tag = "button"
 
 
 class Canvas(_Element):
     """Represents an HTML canvas element."""
 
+    __slots__ = ()
+
     tag = "canvas"
 
 
 class Caption(_Element):
     """Represents an HTML caption element."""
 
+    __slots__ = ()
+
     tag = "caption"
 
 
 class Cite(_Element):
     """Represents an HTML cite element."""
 
+    __slots__ = ()
+
     tag = "cite"
 
 
 class Code(_Element):
     """Represents an HTML code element."""
 
+    __slots__ = ()
+
     tag = "code"
 
 
 class Col(_EmptyElement):
     """Represents an HTML col element."""
 
+    __slots__ = ()
+
     tag = "col"
 
 
 class Colgroup(_Element):
     """Represents an HTML colgroup element."""
 
+    __slots__ = ()
+
     tag = "colgroup"
 
 
 class Data(_Element):
     """Represents an HTML data element."""
 
+    __slots__ = ()
+
     tag = "data"
 
 
 class Datalist(_Element):
     """Represents an HTML datalist element."""
 
+    __slots__ = ()
+
     tag = "datalist"
 
 
 class Dd(_Element):
     """Represents an HTML dd element."""
 
+    __slots__ = ()
+
     tag = "dd"
 
 
 class Del(_Element):
     """Represents an HTML del element."""
 
+    __slots__ = ()
+
     tag = "del"
 
 
 class Details(_Element):
     """Represents an HTML details element."""
 
+    __slots__ = ()
+
     tag = "details"
 
 
 class Dfn(_Element):
     """Represents an HTML dfn element."""
 
+    __slots__ = ()
+
     tag = "dfn"
 
 
 class Dialog(_Element):
     """Represents an HTML dialog element."""
 
+    __slots__ = ()
+
     tag = "dialog"
 
 
 class Div(_Element):
     """Represents an HTML div element."""
 
+    __slots__ = ()
+
     tag = "div"
 
 
 class Dl(_Element):
     """Represents an HTML dl element."""
 
+    __slots__ = ()
+
     tag = "dl"
 
 
 class Dt(_Element):
     """Represents an HTML dt element."""
 
+    __slots__ = ()
+
     tag = "dt"
 
 
 class Em(_Element):
     """Represents an HTML em element."""
 
+    __slots__ = ()
+
     tag = "em"
 
 
 class Embed(_EmptyElement):
     """Represents an HTML embed element."""
 
+    __slots__ = ()
+
     tag = "embed"
 
 
 class Fieldset(_Element):
     """Represents an HTML fieldset element."""
 
+    __slots__ = ()
+
     tag = "fieldset"
 
 
 class Footer(_Element):
     """Represents an HTML footer element."""
 
+    __slots__ = ()
+
     tag = "footer"
 
 
 class Form(_Element):
     """Represents an HTML form element."""
 
+    __slots__ = ()
+
     tag = "form"
 
 
 class Frame(_EmptyElement):
     """Represents an HTML frame element."""
 
+    __slots__ = ()
+
     tag = "frame"
 
 
 class Frameset(_Element):
     """Represents an HTML frameset element."""
 
+    __slots__ = ()
+
     tag = "frameset"
 
 
 class H1(_Element):
     """Represents an HTML h1 element."""
 
+    __slots__ = ()
+
     tag = "h1"
 
 
 class H2(_Element):
     """Represents an HTML h2 element."""
 
+    __slots__ = ()
+
     tag = "h2"
 
 
 class H3(_Element):
     """Represents an HTML h3 element."""
 
+    __slots__ = ()
+
     tag = "h3"
 
 
 class H4(_Element):
     """Represents an HTML h4 element."""
 
+    __slots__ = ()
+
     tag = "h4"
 
 
 class H5(_Element):
     """Represents an HTML h5 element."""
 
+    __slots__ = ()
+
     tag = "h5"
 
 
 class H6(_Element):
     """Represents an HTML h6 element."""
 
+    __slots__ = ()
+
     tag = "h6"
 
 
 class Head(_Element):
     """Represents an HTML head element."""
 
+    __slots__ = ()
+
     tag = "head"
 
 
 class Header(_Element):
     """Represents an HTML header element."""
 
+    __slots__ = ()
+
     tag = "header"
 
 
 class Hr(_Element):
     """Represents an HTML hr element."""
 
+    __slots__ = ()
+
     tag = "hr"
 
 
 class Html(_Element):
     """Represents an HTML html element."""
 
+    __slots__ = ("_head", "_body", "_charset")
+
     tag = "html"
 
     def __init__(
@@ -557,15 +2540,66 @@ class Html(_Element):
         self.body = body
 
         super(Html, self).__init__(head, body, **attributes)
+        self._charset = None
         self.encoding = encoding
 
+    @property
+    def head(self) -> Head:
+        """Gets/sets the head element."""
+        self._unshare()
+        return self._head
+
+    @head.setter
+    def head(self, value: Head):
+        self._head = value
+
+    @property
+    def body(self) -> Body:
+        """Gets/sets the body element."""
+        self._unshare()
+        return self._body
+
+    @body.setter
+    def body(self, value: Body):
+        self._body = value
+
+    def clone(self) -> "Html":
+        copy = super().clone()
+        # the charset meta element found by _charset_meta is shared with self.
+        copy._charset = None  # pylint: disable=protected-access
+        return copy  # type: ignore
+
+    def _replace_children(self, children: Sequence[Any]):
+        replaced = {id(x): y for x, y in zip(self._children, children)}
+        self._head = replaced.get(id(self._head), self._head)
+        self._body = replaced.get(id(self._body), self._body)
+        super()._replace_children(children)
+
     def _charset_meta(self):
         """Returns meta element with charset attribute, if present, or None."""
-        head = self.head
+
+        # the encoding setter inserts the meta element first in head, where it usually
+        # stays.
+        charset = self._charset
+        # read without copying head if it is shared by clone.
+        head = self._head
+        if (
+            charset is not None
+            and head._children  # pylint: disable=protected-access
+            and head._children[0] is charset  # pylint: disable=protected-access
+            and "charset" in charset._attributes  # pylint: disable=protected-access
+        ):
+            return charset
         meta_elements = head.children(tag="meta")
-        charset_elements = [x for x in meta_elements if "charset" in x.attributes]
+        charset_elements = [
+            x
+            for x in meta_elements
+            if x._attributes  # pylint: disable=protected-access
+            and "charset" in x._attributes  # pylint: disable=protected-access
+        ]
         # there really should be at most one.
-        return charset_elements[0] if charset_elements else None
+        self._charset = charset_elements[0] if charset_elements else None
+        return self._charset
 
     @property
     def encoding(self):
@@ -578,351 +2612,522 @@ class Html(_Element):
 
     @encoding.setter
     def encoding(self, value: str):
+        if self._children.__class__ in _CLONED_CHILDREN:
+            # the charset meta element must be a copy too.
+            self.head._unshare()  # pylint: disable=protected-access
+            self._charset = None
         charset_meta = self._charset_meta()
         if charset_meta:
             charset_meta.attributes["charset"] = value
         else:
             self.head.insert(0, Meta(charset=value))
 
+    def _output_encoding(self) -> str:
+        return self.encoding
+
     def __bytes__(self):
-        return self.__str__().encode(self.encoding)
+        return b"".join(self.iter_bytes(chunk_size=2**20))
 
 
 class I(_Element):  # pylint: disable=invalid-name
     """Represents an HTML i element."""
 
+    __slots__ = ()
+
     tag = "i"
 
 
 class Iframe(_Element):
     """Represents an HTML iframe element."""
 
+    __slots__ = ()
+
     tag = "iframe"
 
 
 class Img(_EmptyElement):
     """Represents an HTML img element."""
 
+    __slots__ = ()
+
     tag = "img"
 
 
 class Input(_EmptyElement):
     """Represents an HTML input element."""
 
+    __slots__ = ()
+
     tag = "input"
 
 
 class Ins(_Element):
     """Represents an HTML ins element."""
 
+    __slots__ = ()
+
     tag = "ins"
 
 
 class Keygen(_Element):
     """Represents an HTML keygen element."""
 
+    __slots__ = ()
+
     tag = "keygen"
 
 
 class Kbd(_Element):
     """Represents an HTML kbd element."""
 
+    __slots__ = ()
+
     tag = "kbd"
 
 
 class Label(_Element):
     """Represents an HTML label element."""
 
+    __slots__ = ()
+
     tag = "label"
 
 
 class Legend(_Element):
     """Represents an HTML legend element."""
 
+    __slots__ = ()
+
     tag = "legend"
 
 
 class Li(_Element):
     """Represents an HTML li element."""
 
+    __slots__ = ()
+
     tag = "li"
 
 
 class Link(_EmptyElement):
     """Represents an HTML link element."""
 
+    __slots__ = ()
+
     tag = "link"
 
 
 class Meta(_EmptyElement):
     """Represents an HTML meta element."""
 
+    __slots__ = ()
+
     tag = "meta"
 
 
 class Meter(_EmptyElement):
     """Represents an HTML meter element."""
 
+    __slots__ = ()
+
     tag = "meter"
 
 
 class Map(_Element):
     """Represents an HTML map element."""
 
+    __slots__ = ()
+
     tag = "map"
 
 
 class Noframes(_Element):
     """Represents an HTML noframes element."""
 
+    __slots__ = ()
+
     tag = "noframes"
 
 
 class Noscript(_Element):
     """Represents an HTML noscript element."""
 
+    __slots__ = ()
+
     tag = "noscript"
 
 
 class Object(_Element):
     """Represents an HTML object element."""
 
+    __slots__ = ()
+
     tag = "object"
 
 
 class Ol(_Element):
     """Represents an HTML ol element."""
 
+    __slots__ = ()
+
     tag = "ol"
 
 
 class Optgroup(_Element):
     """Represents an HTML optgroup element."""
 
+    __slots__ = ()
+
     tag = "optgroup"
 
 
 class Option(_Element):
     """Represents an HTML option element."""
 
+    __slots__ = ()
+
     tag = "option"
 
 
 class Output(_Element):
     """Represents an HTML output element."""
 
+    __slots__ = ()
+
     tag = "output"
 
 
 class P(_Element):  # pylint: disable=invalid-name
     """Represents an HTML p element."""
 
+    __slots__ = ()
+
     tag = "p"
 
 
 class Param(_EmptyElement):
     """Represents an HTML param element."""
 
+    __slots__ = ()
+
     tag = "param"
 
 
 class Pre(_Element):
     """Represents an HTML pre element."""
 
+    __slots__ = ()
+
     tag = "pre"
 
 
 class Progress(_Element):
     """Represents an HTML progress element."""
 
+    __slots__ = ()
+
     tag = "progress"
 
 
 class Rp(_Element):
     """Represents an HTML rp element."""
 
+    __slots__ = ()
+
     tag = "rp"
 
 
 class Rt(_Element):
     """Represents an HTML rt element."""
 
+    __slots__ = ()
+
     tag = "rt"
 
 
 class Ruby(_Element):
     """Represents an HTML ruby element."""
 
+    __slots__ = ()
+
     tag = "ruby"
 
 
 class Q(_Element):  # pylint: disable=invalid-name
     """Represents an HTML q element."""
 
+    __slots__ = ()
+
     tag = "q"
 
 
 class Samp(_Element):
     """Represents an HTML samp element."""
 
+    __slots__ = ()
+
     tag = "samp"
 
 
 class Script(_Element):
     """Represents an HTML script element."""
 
+    __slots__ = ()
+
     tag = "script"
 
+    # raw text element, whose content is not parsed for character references.
+    _escapes_text = False
+
 
 class Select(_Element):
     """Represents an HTML select element."""
 
+    __slots__ = ()
+
     tag = "select"
 
 
 class Small(_Element):
     """Represents an HTML small element."""
 
+    __slots__ = ()
+
     tag = "small"
 
 
 class Source(_EmptyElement):
     """Represents an HTML source element."""
 
+    __slots__ = ()
+
     tag = "source"
 
 
 class Span(_Element):
     """Represents an HTML span element."""
 
+    __slots__ = ()
+
     tag = "span"
 
 
 class Strong(_Element):
     """Represents an HTML strong element."""
 
+    __slots__ = ()
+
     tag = "strong"
 
 
 class Style(_Element):
     """Represents an HTML style element."""
 
+    __slots__ = ()
+
     tag = "style"
 
+    # raw text element, whose content is not parsed for character references.
+    _escapes_text = False
+
 
 class Sub(_Element):
     """Represents an HTML sub element."""
 
+    __slots__ = ()
+
     tag = "sub"
 
 
 class Summary(_Element):
     """Represents an HTML summary element."""
 
+    __slots__ = ()
+
     tag = "summary"
 
 
 class Sup(_Element):
     """Represents an HTML sup element."""
 
+    __slots__ = ()
+
     tag = "sup"
 
 
 class Table(_Element):
     """Represents an HTML table element."""
 
+    __slots__ = ()
+
     tag = "table"
 
+    @classmethod
+    def from_rows(
+        cls,
+        rows: Iterable[Sequence[Any]],
+        columns: Optional[Sequence[Any]] = None,
+        row_attrs: Union[
+            None, Dict[str, Any], Callable[[Sequence[Any]], Dict[str, Any]]
+        ] = None,
+        cell_formatters: Union[
+            None,
+            Sequence[Optional[Callable[[Any], Any]]],
+            Dict[Any, Callable[[Any], Any]],
+        ] = None,
+        **attributes: Any,
+    ) -> "Table":
+        """Returns a table whose body renders rows, an iterable of sequences of values,
+        e.g. a DB-API cursor or a csv reader, when the table is rendered.  No elements
+        are created for rows or cells, and rows are consumed as the output is generated,
+        so like Lazy, the table can be rendered once.
+
+        columns, if given, are the header cells, and fix the number of values in each
+        row; otherwise the first row does.  row_attrs is a dict of keyword-style
+        attributes of every tr element, e.g. {"class_": "row"}, or a function of a row
+        returning such a dict.  cell_formatters maps column offsets, or columns, to
+        functions of a value returning the content of its cell; it may also be a
+        sequence of such functions or None, by column offset.  None values, and None
+        returned by formatters, render as empty cells; elements returned by formatters
+        are rendered as markup.  Values are escaped below an AutoEscape element.
+        Raises ValueError at rendering time for a row of the wrong length."""
+
+        head = Thead(Tr(*(Th(x) for x in columns))) if columns is not None else None
+        count = len(columns) if columns is not None else None
+        body = Tbody(_TableRows(rows, count, row_attrs, cell_formatters, columns))
+        return cls(head, body, **attributes)
+
 
 class Tbody(_Element):
     """Represents an HTML tbody element."""
 
+    __slots__ = ()
+
     tag = "tbody"
 
 
 class Td(_Element):
     """Represents an HTML td element."""
 
+    __slots__ = ()
+
     tag = "td"
 
 
 class Textarea(_Element):
     """Represents an HTML textarea element."""
 
+    __slots__ = ()
+
     tag = "textarea"
 
 
 class Tfoot(_Element):
     """Represents an HTML tfoot element."""
 
+    __slots__ = ()
+
     tag = "tfoot"
 
 
 class Th(_Element):
     """Represents an HTML th element."""
 
+    __slots__ = ()
+
     tag = "th"
 
 
 class Thead(_Element):
     """Represents an HTML thead element."""
 
+    __slots__ = ()
+
     tag = "thead"
 
 
 class Time(_Element):
     """Represents an HTML time element."""
 
+    __slots__ = ()
+
     tag = "time"
 
 
 class Title(_Element):
     """Represents an HTML title element."""
 
+    __slots__ = ()
+
     tag = "title"
 
 
 class Tr(_Element):
     """Represents an HTML tr element."""
 
+    __slots__ = ()
+
     tag = "tr"
 
 
 class Track(_EmptyElement):
     """Represents an HTML track element."""
 
+    __slots__ = ()
+
     tag = "track"
 
 
 class Tt(_Element):
     """Represents an HTML tt element."""
 
+    __slots__ = ()
+
     tag = "tt"
 
 
 class Ul(_Element):
     """Represents an HTML ul element."""
 
+    __slots__ = ()
+
     tag = "ul"
 
 
 class Var(_Element):
     """Represents an HTML var element."""
 
+    __slots__ = ()
+
     tag = "var"
 
 
 class Video(_Element):
     """Represents an HTML video element."""
 
+    __slots__ = ()
+
     tag = "video"
 
 
 class Wbr(_EmptyElement):
     """Represents an HTML wbr element."""
 
+    __slots__ = ()
+
     tag = "wbr"
 
 
 # Command used to generate __all__.
 # print([subcls.__name__ for subcls in chain(filterfalse(lambda x: x == _EmptyElement, _Element.__subclasses__()), _EmptyElement.__subclasses__())])
+
+
+# The clone and intern machinery uses the element classes above, so it is imported last.
+from .sharing import (  # pylint: disable=wrong-import-position,cyclic-import
+    _CLONED_CHILDREN,
+    _NO_SHARED_CHILDREN,
+    _CopiedChildren,
+    _FrozenChildren,
+    _SharedChildren,
+    _unshared,
+)
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+
+"""Rendering of large documents on several cores.
+
+render_parallel splits long lists of siblings, e.g. the rows of a table body, into
+chunks, renders the chunks in other processes, and joins the results in document order.
+
+Chunks are rendered by a concurrent.futures executor, typically a ProcessPoolExecutor
+created once and reused across calls; they are serialized with pythtml.serialize.dumps,
+or pickled if they hold elements it does not support.  This usually costs more than
+rendering them, so it pays off only with many workers:
+
+    pool = ProcessPoolExecutor(8)
+    ...
+    html = render_parallel(doc, pool)
+
+With fork=True, chunks are instead rendered by a pool of worker processes forked for the
+call, which inherit the tree, so only the location of each chunk is sent to them.
+Forking copies the locks of the other threads of the process as they are, so a lock held
+by another thread at that time, e.g. by logging or a database driver, stays held in the
+workers, which can deadlock; forking is only safe in processes running no other threads,
+such as batch jobs, and not in threaded servers.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from typing import Any, List, Optional, Tuple, Union
+
+from .elements import _AUTO_ESCAPE_END, Div, Markup, _Element, _escape_text
+from .serialize import dumps, loads
+
+__all__ = ["DEFAULT_MIN_SUBTREE_SIZE", "render_parallel"]
+
+# default minimum number of nodes in a chunk rendered by a worker.
+DEFAULT_MIN_SUBTREE_SIZE = 20000
+
+# the tree inherited by forked workers; set in each worker by _share.
+_shared_root: Optional[_Element] = None
+
+
+def _render_node(node: Any, escape: bool, escape_text: bool) -> str:
+    """Renders an element, escaping the text in it if escape is True (i.e. below an
+    AutoEscape element), or a text child, escaping it if escape_text is True."""
+
+    # pylint: disable=protected-access
+    if isinstance(node, _Element):
+        return "".join(node._iter_segments(escape=True)) if escape else str(node)
+    if escape_text and not isinstance(node, Markup):
+        return _escape_text(str(node))
+    return node if node.__class__ is str else str(node)
+
+
+def _render_children(
+    children: List[Any], escape: bool = False, escape_text: bool = False
+) -> str:
+    """Renders a list of children; see _render_node."""
+
+    return "".join([_render_node(child, escape, escape_text) for child in children])
+
+
+def _render_serialized(data: bytes, escape: bool, escape_text: bool) -> str:
+    """Renders the children of the element serialized as data; see _render_node."""
+
+    return _render_children(
+        loads(data)._children, escape, escape_text  # pylint: disable=protected-access
+    )
+
+
+def _resolve(element: _Element, path: Tuple[int, ...]) -> _Element:
+    """Returns the element at path below element."""
+
+    for offset in path:
+        element = element._children[offset]  # pylint: disable=protected-access
+    return element
+
+
+def _share(element: _Element):
+    """Sets the tree rendered by a forked worker, inherited rather than pickled."""
+
+    global _shared_root  # pylint: disable=global-statement
+    _shared_root = element
+
+
+def _render_shared(
+    path: Tuple[int, ...], start: int, stop: int, escape: bool, escape_text: bool
+) -> str:
+    """Renders children[start:stop] of the element of _shared_root at path, where path
+    lists child offsets from the root."""
+
+    node = _resolve(_shared_root, path)  # type: ignore
+    return _render_children(
+        node._children[start:stop],  # pylint: disable=protected-access
+        escape,
+        escape_text,
+    )
+
+
+def _subtree_size(node: Any, limit: int) -> int:
+    """Returns the number of nodes in the tree rooted at node, or a number at least limit
+    if that number is at least limit."""
+
+    # pylint: disable=protected-access
+    size = 0
+    pending = [node]
+    while pending and size < limit:
+        node = pending.pop()
+        size += 1
+        if isinstance(node, _Element) and node._rendered.__class__ is not str:
+            pending.extend(node._children)
+    return size
+
+
+def _estimate_children_size(children: List[Any], limit: int) -> int:
+    """Estimates the number of nodes in the trees rooted at children from a sample."""
+
+    sample = {0, len(children) // 2, len(children) - 1}
+    sizes = [_subtree_size(children[x], limit) for x in sample]
+    return sum(sizes) * len(children) // len(sizes)
+
+
+def _plan(
+    element: _Element, min_subtree_size: int, max_chunks: int
+) -> List[Union[str, Tuple[Tuple[int, ...], int, int, bool, bool]]]:
+    """Returns the parts of the markup of element in document order: strings rendered
+    here, and (path, start, stop, escape, escape_text) for chunks of children to render
+    in workers; see _render_node."""
+
+    # pylint: disable=protected-access
+    parts: List[Union[str, Tuple[Tuple[int, ...], int, int, bool, bool]]] = []
+    # entries are (path, node, escape, escape_text) to plan, or end tags.
+    pending: List[Any] = [((), element, False, False)]
+    while pending:
+        entry = pending.pop()
+        if isinstance(entry, str):
+            parts.append(entry)
+            continue
+        path, node, escape, escape_text = entry
+        if (
+            not isinstance(node, _Element)
+            or node._rendered.__class__ is str
+            or node._close_markup() is None
+            or _subtree_size(node, 2 * min_subtree_size) < 2 * min_subtree_size
+        ):
+            parts.append(_render_node(node, escape, escape_text))
+            continue
+        parts.append(node._open_markup())
+        children = node._children
+        end_tag = node._close_markup()
+        escape = escape or end_tag is _AUTO_ESCAPE_END
+        escape_text = escape and node._escapes_text
+        estimate = (
+            _estimate_children_size(children, min_subtree_size) if children else 0
+        )
+        if len(children) > 1 and estimate >= 2 * min_subtree_size:
+            count = min(len(children), max_chunks, estimate // min_subtree_size)
+            bounds = [len(children) * x // count for x in range(count + 1)]
+            parts.extend(
+                (path, start, stop, escape, escape_text)
+                for start, stop in zip(bounds, bounds[1:])
+            )
+            parts.append(end_tag)  # type: ignore
+        else:
+            pending.append(end_tag)
+            pending.extend(
+                (path + (offset,), child, escape, escape_text)
+                for offset, child in reversed(list(enumerate(children)))
+            )
+    return parts
+
+
+def render_parallel(
+    element: _Element,
+    executor: Optional[Executor] = None,
+    min_subtree_size: int = DEFAULT_MIN_SUBTREE_SIZE,
+    workers: Optional[int] = None,
+    *,
+    fork: bool = False,
+) -> str:
+    """Renders element, rendering chunks of long sibling lists in other processes.  The
+    result is identical to str(element).
+
+    Subtrees with fewer than 2 * min_subtree_size nodes are rendered in this process, as
+    is the whole tree if it is that small.  Chunks have about min_subtree_size nodes or
+    more, and there are at most 4 * workers (by default the number of CPUs) of them.
+
+    Chunks are serialized, or pickled, and submitted to executor.  If fork is True
+    instead, they are rendered by worker processes forked for this call, or in this
+    process if workers is less than 2 or fork is not available; forking is unsafe in
+    processes running other threads, see the module documentation.  Raises ValueError
+    if executor is None and fork is False, or if both are given."""
+
+    # pylint: disable=protected-access
+    if (executor is None) == (not fork):
+        raise ValueError("render_parallel needs either an executor or fork=True.")
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if fork and (workers < 2 or "fork" not in multiprocessing.get_all_start_methods()):
+        return str(element)
+
+    parts = _plan(element, min_subtree_size, 4 * workers)
+    chunks = [x for x in parts if not isinstance(x, str)]
+    if not chunks:
+        return "".join(parts)  # type: ignore
+
+    if executor is not None:
+        futures = {}
+        for path, start, stop, escape, escape_text in chunks:
+            children = _resolve(element, path)._children[start:stop]
+            try:
+                # the div only holds the chunk; its own markup is not rendered.
+                data = dumps(Div(*children))
+            except ValueError:
+                future = executor.submit(
+                    _render_children, children, escape, escape_text
+                )
+            else:
+                future = executor.submit(_render_serialized, data, escape, escape_text)
+            futures[path, start, stop, escape, escape_text] = future
+        return _join(parts, futures)
+
+    # forked workers inherit the arguments of their initializer, so concurrent calls
+    # need not share a tree.
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(chunks)),
+        mp_context=multiprocessing.get_context("fork"),
+        initializer=_share,
+        initargs=(element,),
+    ) as pool:
+        futures = {chunk: pool.submit(_render_shared, *chunk) for chunk in chunks}
+        return _join(parts, futures)
+
+
+def _join(parts: List[Any], futures: dict) -> str:
+    """Joins parts, replacing chunks with the results of their futures."""
+
+    results: List[str] = []
+    for part in parts:
+        if isinstance(part, str):
+            results.append(part)
+        else:
+            future: Future = futures[part]
+            results.append(future.result())
+    return "".join(results)
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+
+"""Profiling of rendering.
+
+While a RenderProfiler is active, every render in the process (str, iter_render,
+iter_bytes, render_async, etc.) reports each element rendered to it.  The profiler
+records, by element class or by label, the number of calls and of render cache hits, the
+cumulative and self time, and the number of characters emitted.
+
+    with RenderProfiler() as profiler:
+        profiler.label(sidebar, "sidebar")
+        html = str(document)
+    print(profiler.format_report())
+
+The elements below a labelled element are recorded under their own class names or labels;
+the label covers the time and characters not attributed to them.  Times include the time
+spent by the consumer of the output between segments, e.g. writing them to a file.
+
+When no profiler is active, rendering pays for a few comparisons with None per element.
+"""
+
+import time
+from typing import IO, Any, Dict, List, NamedTuple, Optional, Tuple
+
+from . import elements
+
+__all__ = ["ProfileEntry", "RenderProfiler"]
+
+
+class ProfileEntry(NamedTuple):
+    """Statistics of the elements of a class or label, returned by
+    RenderProfiler.report.  total_time and characters are not counted twice for nested
+    elements with the same name."""
+
+    name: str
+    calls: int
+    hits: int
+    total_time: float
+    self_time: float
+    characters: int
+
+
+class _Profile:
+    """The state of one profiled render.  Each render has its own stack, so renders may
+    be nested (e.g. an element rendered by the __str__ method of a child) or interleaved
+    (render_async)."""
+
+    __slots__ = ("profiler", "stack", "active", "emitted")
+
+    def __init__(self, profiler: "RenderProfiler"):
+        self.profiler = profiler
+        # [name, stack path, start time, time in children, emitted at start].
+        self.stack: List[list] = []
+        # number of open elements by name.
+        self.active: Dict[str, int] = {}
+        self.emitted = 0
+
+    def count(self, segments):
+        """Generates segments, counting the characters emitted."""
+
+        for segment in segments:
+            if isinstance(segment, str):
+                self.emitted += len(segment)
+            yield segment
+
+    def enter(self, node: Any):
+        """Records the start of the rendering of node."""
+
+        name = self.profiler._labels.get(node)  # pylint: disable=protected-access
+        if name is None:
+            name = node.__class__.__name__
+        path = (self.stack[-1][1] + (name,)) if self.stack else (name,)
+        self.active[name] = self.active.get(name, 0) + 1
+        self.stack.append([name, path, time.perf_counter(), 0.0, self.emitted])
+
+    def exit(self, hit: bool):
+        """Records the end of the rendering of the innermost open element; hit is True
+        if its markup was taken from the render cache."""
+
+        name, path, start, children_time, emitted = self.stack.pop()
+        elapsed = time.perf_counter() - start
+        if self.stack:
+            self.stack[-1][3] += elapsed
+        self.active[name] -= 1
+        outermost = not self.active[name]
+        self.profiler._record(  # pylint: disable=protected-access
+            name,
+            path,
+            hit,
+            elapsed if outermost else 0.0,
+            elapsed - children_time,
+            self.emitted - emitted if outermost else 0,
+        )
+
+
+class RenderProfiler:
+    """Records the elements rendered while active, i.e. between start and stop, or in a
+    with statement.  Profilers may be nested; the innermost active profiler receives the
+    reports, and the outer one resumes when it stops.  A profiler applies to renders in
+    all threads."""
+
+    def __init__(self):
+        self._labels: Dict[Any, str] = {}
+        # [calls, hits, total time, self time, characters] by name.
+        self._stats: Dict[str, list] = {}
+        # self time by stack of names.
+        self._stacks: Dict[Tuple[str, ...], float] = {}
+        self._previous: List[Optional[Any]] = []
+
+    def __enter__(self) -> "RenderProfiler":
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        """Makes the profiler active."""
+
+        self._previous.append(elements._profiler)  # pylint: disable=protected-access
+        elements._profiler = self  # pylint: disable=protected-access
+
+    def stop(self):
+        """Restores the profiler that was active when start was called."""
+
+        if elements._profiler is not self:  # pylint: disable=protected-access
+            raise RuntimeError("profiler is not active.")
+        elements._profiler = self._previous.pop()  # pylint: disable=protected-access
+
+    def label(self, element: Any, name: str):
+        """Records element, and the descendants not otherwise labelled, under name
+        instead of the class name of element.  The profiler keeps a reference to
+        element."""
+
+        self._labels[element] = name
+
+    def clear(self):
+        """Discards the statistics recorded so far; labels are kept."""
+
+        self._stats.clear()
+        self._stacks.clear()
+
+    def _start(self) -> _Profile:
+        """Returns the state of a new profiled render."""
+
+        return _Profile(self)
+
+    def _record(
+        self,
+        name: str,
+        path: Tuple[str, ...],
+        hit: bool,
+        total_time: float,
+        self_time: float,
+        characters: int,
+    ):
+        """Adds the rendering of an element named name, at path in the tree, to the
+        statistics of name and of path; called by _Profile.exit as each profiled element
+        is closed.  total_time and characters are 0 for an element rendered inside one
+        with the same name, which already counts them."""
+
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = [0, 0, 0.0, 0.0, 0]
+        stats[0] += 1
+        stats[1] += hit
+        stats[2] += total_time
+        stats[3] += self_time
+        stats[4] += characters
+        self._stacks[path] = self._stacks.get(path, 0.0) + self_time
+
+    def report(self) -> List[ProfileEntry]:
+        """Returns the statistics recorded, by decreasing self time."""
+
+        entries = [ProfileEntry(name, *stats) for name, stats in self._stats.items()]
+        entries.sort(key=lambda x: x.self_time, reverse=True)
+        return entries
+
+    def format_report(self, limit: Optional[int] = None) -> str:
+        """Returns report as a table, limited to limit lines if it is not None."""
+
+        lines = [
+            "%-24s %10s %10s %12s %12s %12s"
+            % ("name", "calls", "hits", "total ms", "self ms", "characters")
+        ]
+        for entry in self.report()[:limit]:
+            lines.append(
+                "%-24s %10d %10d %12.3f %12.3f %12d"
+                % (
+                    entry.name,
+                    entry.calls,
+                    entry.hits,
+                    entry.total_time * 1000,
+                    entry.self_time * 1000,
+                    entry.characters,
+                )
+            )
+        return "\n".join(lines)
+
+    def folded(self) -> List[str]:
+        """Returns the self time of each stack of names in microseconds, in the folded
+        format read by flamegraph.pl and speedscope, e.g. "Html;Body;Table 1250"."""
+
+        return [
+            "%s %d" % (";".join(path), round(self_time * 1e6))
+            for path, self_time in self._stacks.items()
+        ]
+
+    def write_folded(self, fp: IO[str]):
+        """Writes folded to the text file fp, one stack per line."""
+
+        for line in self.folded():
+            fp.write(line + "\n")
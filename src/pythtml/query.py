@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+
+"""CSS selectors for element trees; see _Element.select and _Element.select_one.
+
+The following selectors are supported, and may be grouped with commas.
+
+    *               any element
+    tag             elements with the tag
+    #id             elements with the id
+    .class          elements with the class
+    [attr]          elements having the attribute
+    [attr=value]    attribute equal to value
+    [attr~=value]   attribute a whitespace-separated list containing value
+    [attr|=value]   attribute equal to value, or beginning with value followed by -
+    [attr^=value]   attribute beginning with value
+    [attr$=value]   attribute ending with value
+    [attr*=value]   attribute containing value
+    A B             B descendant of A
+    A > B           B child of A
+
+Attribute values may be quoted.  Boolean attributes have the value "".
+"""
+
+import re
+from functools import lru_cache
+from typing import Any, Callable, List, NamedTuple, Optional, Tuple
+
+__all__ = ["Selector", "compile_selector"]
+
+
+_TOKENS = re.compile(
+    r"""
+    \s*(?P<combinator>[>,])\s*
+    | (?P<descendant>\s+)
+    | (?P<tag>\*|[-\w]+)
+    | \#(?P<id>[-\w]+)
+    | \.(?P<class>[-\w]+)
+    | \[\s*(?P<attr>[-\w:]+)\s*
+        (?:(?P<op>[~|^$*]?=)\s*
+            (?:"(?P<dquoted>[^"]*)"|'(?P<squoted>[^']*)'|(?P<bare>[-\w]+))\s*
+        )?\]
+    """,
+    re.VERBOSE,
+)
+
+_ATTRIBUTE_TESTS = {
+    None: lambda actual, value: True,
+    "=": lambda actual, value: actual == value,
+    "~=": lambda actual, value: value in actual.split(),
+    "|=": lambda actual, value: actual == value or actual.startswith(value + "-"),
+    "^=": lambda actual, value: bool(value) and actual.startswith(value),
+    "$=": lambda actual, value: bool(value) and actual.endswith(value),
+    "*=": lambda actual, value: bool(value) and value in actual,
+}
+
+
+class _Compound(NamedTuple):
+    """A sequence of simple selectors without combinators, e.g. div.note[title]."""
+
+    tag: Optional[str]
+    id: Optional[str]
+    classes: Tuple[str, ...]
+    attributes: Tuple[Tuple[str, Callable[[str, str], bool], str], ...]
+
+    def matches(self, element: Any) -> bool:
+        """Returns True if element matches all simple selectors."""
+
+        # pylint: disable=protected-access
+        if self.tag is not None and getattr(element, "tag", None) != self.tag:
+            return False
+        attributes = element._attributes or {}
+        if self.id is not None and str(attributes.get("id")) != self.id:
+            return False
+        if self.classes:
+            if "class" not in attributes:
+                return False
+            names = str(attributes["class"]).split()
+            if any(name not in names for name in self.classes):
+                return False
+        for name, test, value in self.attributes:
+            if name not in attributes:
+                return False
+            actual = attributes[name]
+            if not test("" if actual is True else str(actual), value):
+                return False
+        return True
+
+
+class Selector:
+    """A compiled selector group.  Each selector is stored as a list of compounds from
+    right to left, each paired with the combinator joining it to the next compound on
+    its left (">" or " "), or None for the leftmost compound."""
+
+    __slots__ = ("text", "_selectors")
+
+    def __init__(self, text: str, selectors: List[List[Tuple[_Compound, Any]]]):
+        self.text = text
+        self._selectors = selectors
+
+    def __repr__(self):
+        return "Selector(%r)" % self.text
+
+    @staticmethod
+    def _candidates(index: Any, compound: _Compound) -> List[Any]:
+        """Returns the elements that may match compound, using the narrowest index."""
+
+        if compound.id is not None:
+            return index.text_ids.get(compound.id, [])
+        if compound.classes:
+            return index.classes.get(compound.classes[0], [])
+        if compound.tag is not None:
+            return index.tags.get(compound.tag, [])
+        return index.elements
+
+    @staticmethod
+    def _matches_left(
+        element: Any, steps: List[Tuple[_Compound, Any]], position: int, index: Any
+    ) -> bool:
+        """Returns True if the ancestors of element match steps[position:], where
+        steps[position - 1] was matched by element."""
+
+        if position == len(steps):
+            return True
+        compound = steps[position][0]
+        combinator = steps[position - 1][1]
+        parent = index.parents.get(element)
+        while parent is not None:
+            if compound.matches(parent) and Selector._matches_left(
+                parent, steps, position + 1, index
+            ):
+                return True
+            if combinator == ">":
+                return False
+            parent = index.parents.get(parent)
+        return False
+
+    def _iter_matches(self, steps: List[Tuple[_Compound, Any]], index: Any):
+        """Generates the elements matching a selector in document order."""
+
+        rightmost = steps[0][0]
+        for element in self._candidates(index, rightmost):
+            if (
+                element is not index.root
+                and rightmost.matches(element)
+                and self._matches_left(element, steps, 1, index)
+            ):
+                yield element
+
+    def select(self, index: Any) -> List[Any]:
+        """Returns the elements of the indexed tree, other than its root, that match the
+        selector group, in document order."""
+
+        if len(self._selectors) == 1:
+            return list(self._iter_matches(self._selectors[0], index))
+        found = {}
+        for steps in self._selectors:
+            found.update(dict.fromkeys(self._iter_matches(steps, index)))
+        order = index.order
+        return sorted(found, key=order.__getitem__)
+
+    def select_one(self, index: Any) -> Optional[Any]:
+        """Returns the first element that select would return, or None."""
+
+        if len(self._selectors) == 1:
+            return next(self._iter_matches(self._selectors[0], index), None)
+        found = [
+            element
+            for element in (
+                next(self._iter_matches(steps, index), None)
+                for steps in self._selectors
+            )
+            if element is not None
+        ]
+        return min(found, key=index.order.__getitem__) if found else None
+
+
+@lru_cache(maxsize=256)
+def compile_selector(text: str) -> Selector:
+    """Compiles a group of selectors.  Raises ValueError for invalid or unsupported
+    selectors.  Compiled selectors are cached."""
+
+    selectors: List[List[Tuple[_Compound, Any]]] = []
+    compounds: List[Tuple[_Compound, Any]] = []
+    parts: dict = {}
+    combinator = None
+    position = 0
+    text = text.strip()
+
+    def end_compound():
+        if not parts:
+            raise ValueError("invalid selector %r." % text)
+        compounds.append(
+            (
+                _Compound(
+                    parts.get("tag"),
+                    parts.get("id"),
+                    tuple(parts.get("classes", ())),
+                    tuple(parts.get("attributes", ())),
+                ),
+                combinator,
+            )
+        )
+        parts.clear()
+
+    while position < len(text):
+        match = _TOKENS.match(text, position)
+        if match is None or match.end() == position:
+            raise ValueError("invalid selector %r at offset %d." % (text, position))
+        position = match.end()
+        kind = match.lastgroup
+        if kind in ("combinator", "descendant"):
+            end_compound()
+            if match.group("combinator") == ",":
+                selectors.append(compounds[::-1])
+                compounds = []
+                combinator = None
+            else:
+                combinator = match.group("combinator") or " "
+        elif match.group("tag") is not None:
+            if parts:
+                raise ValueError("invalid selector %r." % text)
+            if match.group("tag") != "*":
+                parts["tag"] = match.group("tag").lower()
+            else:
+                parts["any"] = True
+        elif match.group("id") is not None:
+            parts["id"] = match.group("id")
+        elif match.group("class") is not None:
+            parts.setdefault("classes", []).append(match.group("class"))
+        else:
+            value = next(
+                (x for x in match.group("dquoted", "squoted", "bare") if x is not None),
+                "",
+            )
+            parts.setdefault("attributes", []).append(
+                (match.group("attr"), _ATTRIBUTE_TESTS[match.group("op")], value)
+            )
+    end_compound()
+    selectors.append(compounds[::-1])
+    return Selector(text, selectors)
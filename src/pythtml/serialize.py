@@ -0,0 +1,393 @@
+# -*- coding: utf-8 -*-
+
+"""Compact binary serialization of element trees.
+
+dumps returns the tree of an element as bytes, and loads rebuilds it.  The format suits
+trees kept in a cache, or sent to other processes, e.g. worker processes.  loads is
+faster than unpickling the same tree, three times or so for trees with repeated
+attributes, e.g. tables, and the data is usually smaller.
+
+    data = dumps(sidebar)
+    sidebar = loads(data)
+
+Element classes are stored as their offsets in pythtml.elements.__all__, so data can be
+loaded only by the version of pythtml that wrote it; loads raises ValueError otherwise.
+Attribute names and values and text are stored once each in a table of values, and
+referred to by their offsets in the table; so are the distinct sets of attributes, e.g.
+class="cell", which loads creates once and copies.
+
+Children that are str, Markup, int or float, and attribute values that are str, bool, int
+or float, are restored as they were; other values are stored as their str, which renders
+the same.  The cached markup of elements is not stored, and an element that appears twice
+in a tree is loaded as two copies.  Lazy and Cached elements, async children, and elements
+of classes not in pythtml.elements.__all__, cannot be serialized.
+"""
+
+import gc
+import struct
+import sys
+import zlib
+from array import array
+from itertools import accumulate
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import elements
+from .elements import (
+    _NO_CHILDREN,
+    Html,
+    Cached,
+    Lazy,
+    Markup,
+    Raw,
+    Slot,
+    _AttributeDict,
+    _Element,
+    _attribute_key,
+    _is_async_child,
+)
+
+__all__ = ["dumps", "loads"]
+
+_MAGIC = b"PYHT"
+_VERSION = 2
+
+# magic, version, checksum of the class table, number of values in the table, number of
+# value conversions, number of attribute sets, number of attributes in them, number of
+# ops, length of the text of the table in bytes.  The header is followed by the lengths
+# of the values in characters, the conversions, the number of attributes of each
+# attribute set, the offsets of the name and value of each attribute, the ops (all arrays
+# of little-endian 32 bit integers), and the text, encoded in utf-8.  Attribute sets are
+# numbered from 1; 0 means no attributes.
+_HEADER = struct.Struct("<4sBIIIIIII")
+
+# Ops, in document order: a value offset (>= 0) is a child taken from the table; _END
+# ends the children of the innermost element; ops below _END start an element, encoding
+# its class code and attribute set.  They are followed by the attribute set number if it
+# is at least _LONG_ATTRIBUTE_SET, which the op then holds instead, the extra ops of Raw,
+# Slot and Html elements, the children, and _END.
+_END = -1
+
+# the largest attribute set number that an op starting an element can hold, with class
+# code 255, is 2 ** 23 - 2.
+_LONG_ATTRIBUTE_SET = (1 << 23) - 2
+
+# kinds of the values of the table that are not str, with their conversions from str.
+_MARKUP, _INT, _FLOAT = range(3)
+_CONVERTERS = (Markup, int, float)
+_KINDS = {Markup: _MARKUP, int: _INT, float: _FLOAT}
+
+# attribute values True and False are the offsets -1 and -2, i.e. the last values of the
+# table once loads has appended them.
+_TRUE = -1
+_FALSE = -2
+
+# (classes by code, codes by class, checksum), computed on first use.
+_class_table: Optional[Tuple[List[Any], Dict[type, int], int]] = None
+
+
+def _classes() -> Tuple[List[Any], Dict[type, int], int]:
+    """Returns the classes that can be serialized by code, with None for the others,
+    their codes, and the checksum of the class table."""
+
+    global _class_table  # pylint: disable=global-statement
+    if _class_table is None:
+        classes = [getattr(elements, name) for name in elements.__all__]
+        classes = [None if issubclass(x, (Lazy, Cached)) else x for x in classes]
+        codes = {cls: code for code, cls in enumerate(classes) if cls is not None}
+        checksum = zlib.crc32(" ".join(elements.__all__).encode("ascii"))
+        _class_table = (classes, codes, checksum)
+    return _class_table
+
+
+def _to_little_endian(values: array) -> bytes:
+    """Returns the items of values as little-endian bytes, swapping them in place on
+    big-endian platforms."""
+
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_little_endian(typecode: str, data: memoryview) -> array:
+    """Returns an array of typecode items read from data, stored little-endian."""
+
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def dumps(element: _Element) -> bytes:  # pylint: disable=too-many-branches
+    """Returns the tree of element as bytes, which loads turns back into a tree."""
+
+    # pylint: disable=protected-access
+    if not isinstance(element, _Element):
+        raise TypeError("element must be an element.")
+    _, codes, checksum = _classes()
+    table: List[str] = []
+    # offsets of str values, and of other values by class and text, as e.g. 1 == 1.0.
+    offsets: Dict[str, int] = {}
+    other_offsets: Dict[Tuple[type, str], int] = {}
+    conversions: List[int] = []
+    # number of attributes of each attribute set, offsets of their names and values, and
+    # attribute set numbers by elements._attribute_key.
+    attribute_counts: List[int] = []
+    attribute_offsets: List[int] = []
+    attribute_set_numbers: Dict[Tuple[Any, ...], int] = {}
+    ops: List[int] = []
+
+    def offset(value: Any) -> int:
+        """Returns the offset of value in table, adding it if necessary."""
+
+        cls = value.__class__
+        kind = _KINDS.get(cls)
+        if kind is None:
+            value = value if cls is str else str(value)
+            result = offsets.get(value)
+            if result is None:
+                result = offsets[value] = len(table)
+                table.append(value)
+            return result
+        text = str(value) if kind else str.__str__(value)
+        result = other_offsets.get((cls, text))
+        if result is None:
+            result = other_offsets[cls, text] = len(table)
+            table.append(text)
+            conversions.extend((result, kind))
+        return result
+
+    pending: List[Any] = [element]
+    while pending:
+        node = pending.pop()
+        if node.__class__ is str:
+            index = offsets.get(node)
+            ops.append(offset(node) if index is None else index)
+        elif node is _END:
+            ops.append(_END)
+        elif isinstance(node, _Element):
+            cls = node.__class__
+            code = codes.get(cls)
+            if code is None:
+                raise ValueError("%s elements cannot be serialized." % cls.__name__)
+            attributes = node._attributes
+            if attributes:
+                key = _attribute_key(attributes)
+                attribute_set = attribute_set_numbers.get(key)
+                if attribute_set is None:
+                    attribute_counts.append(len(attributes))
+                    for name, value in attributes.items():
+                        attribute_offsets.append(offset(name))
+                        if value is True or value is False:
+                            attribute_offsets.append(_TRUE if value else _FALSE)
+                        else:
+                            attribute_offsets.append(offset(value))
+                    attribute_set = attribute_set_numbers[key] = len(attribute_counts)
+            else:
+                attribute_set = 0
+            if attribute_set < _LONG_ATTRIBUTE_SET:
+                ops.append(_END - 1 - (code | attribute_set << 8))
+            else:
+                ops.extend(
+                    (_END - 1 - (code | _LONG_ATTRIBUTE_SET << 8), attribute_set)
+                )
+            if cls is Raw:
+                ops.append(offset(node.data))
+            elif cls is Slot:
+                ops.extend((offset(node.name), int(bool(node.escape_data))))
+            elif cls is Html:
+                ops.extend(_html_offsets(node))
+            pending.append(_END)
+            pending.extend(reversed(node._children))
+        elif _is_async_child(node):
+            raise ValueError("async children cannot be serialized.")
+        else:
+            ops.append(offset(node))
+
+    text = "".join(table).encode("utf-8", "surrogatepass")
+    return b"".join(
+        (
+            _HEADER.pack(
+                _MAGIC,
+                _VERSION,
+                checksum,
+                len(table),
+                len(conversions) // 2,
+                len(attribute_counts),
+                len(attribute_offsets) // 2,
+                len(ops),
+                len(text),
+            ),
+            _to_little_endian(array("I", map(len, table))),
+            _to_little_endian(array("i", conversions)),
+            _to_little_endian(array("I", attribute_counts)),
+            _to_little_endian(array("i", attribute_offsets)),
+            _to_little_endian(array("i", ops)),
+            text,
+        )
+    )
+
+
+def _html_offsets(html: Html) -> Tuple[int, int]:
+    """Returns the offsets of the head and body of html among its children."""
+
+    # pylint: disable=protected-access
+    children = html._children
+    try:
+        head = next(i for i, x in enumerate(children) if x is html._head)
+        body = next(i for i, x in enumerate(children) if x is html._body)
+    except StopIteration:
+        raise ValueError(
+            "html elements whose head or body was removed cannot be serialized."
+        ) from None
+    return head, body
+
+
+def loads(data: bytes) -> _Element:
+    """Returns the element whose tree was serialized as data by dumps."""
+
+    view = memoryview(data)
+    if len(view) < _HEADER.size:
+        raise ValueError("data is not serialized pythtml elements.")
+    (
+        magic,
+        version,
+        checksum,
+        count,
+        conversion_count,
+        attribute_set_count,
+        attribute_count,
+        op_count,
+        text_length,
+    ) = _HEADER.unpack_from(view)
+    if magic != _MAGIC:
+        raise ValueError("data is not serialized pythtml elements.")
+    classes, _, expected_checksum = _classes()
+    if version != _VERSION or checksum != expected_checksum:
+        raise ValueError("data was serialized by a different version of pythtml.")
+    start = _HEADER.size
+    bounds = list(
+        accumulate(
+            (
+                start,
+                4 * count,
+                8 * conversion_count,
+                4 * attribute_set_count,
+                8 * attribute_count,
+                4 * op_count,
+                text_length,
+            )
+        )
+    )
+    if bounds[-1] != len(view):
+        raise ValueError("data is truncated or corrupt.")
+
+    lengths = _from_little_endian("I", view[bounds[0] : bounds[1]])
+    conversions = _from_little_endian("i", view[bounds[1] : bounds[2]])
+    attribute_counts = _from_little_endian("I", view[bounds[2] : bounds[3]])
+    attribute_offsets = _from_little_endian("i", view[bounds[3] : bounds[4]])
+    ops = _from_little_endian("i", view[bounds[4] : bounds[5]])
+    text = str(view[bounds[5] :], "utf-8", "surrogatepass")
+    ends = list(accumulate(lengths))
+    table: List[Any] = [text[a:b] for a, b in zip([0] + ends, ends)]
+    try:
+        for index, kind in zip(conversions[::2], conversions[1::2]):
+            table[index] = _CONVERTERS[kind](table[index])
+        table.extend((False, True))
+        # the collections triggered by the allocation of many elements would find no
+        # garbage, and could take longer than building the tree.
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            attribute_dicts = _attribute_dicts(
+                attribute_counts, attribute_offsets, table
+            )
+            return _build(ops, attribute_dicts, table, classes)
+        finally:
+            if enabled:
+                gc.enable()
+    except (IndexError, StopIteration, TypeError, ValueError) as exc:
+        raise ValueError("data is truncated or corrupt.") from exc
+
+
+def _attribute_dicts(counts: array, offsets: array, table: List[Any]) -> List[Any]:
+    """Returns the attribute dicts by attribute set number."""
+
+    values = list(map(table.__getitem__, offsets))
+    names = values[::2]
+    values = values[1::2]
+    dicts: List[Any] = [None]
+    start = 0
+    for count in counts:
+        stop = start + count
+        dicts.append(_AttributeDict(zip(names[start:stop], values[start:stop])))
+        start = stop
+    if start != len(names):
+        raise ValueError("attribute counts do not match attributes.")
+    return dicts
+
+
+def _build(
+    ops: array,
+    attribute_dicts: List[Any],
+    table: List[Any],
+    classes: List[Any],
+) -> _Element:
+    """Returns the element described by ops."""
+
+    # pylint: disable=protected-access
+    new = object.__new__
+    special = (Raw, Slot, Html)
+    htmls = []
+    # attribute sets are numbered in the order of their first use; the first element
+    # using one takes its dict, and the others copies.
+    last_attribute_set = 0
+    children: List[Any] = []
+    root = children
+    # (element, children of its parent) for the open elements.
+    stack: List[Tuple[_Element, List[Any]]] = []
+    ops_iterator = iter(ops)
+    for op in ops_iterator:
+        if op >= 0:
+            children.append(table[op])
+        elif op == _END:
+            element, parent = stack.pop()
+            element._children = children or _NO_CHILDREN
+            children = parent
+        else:
+            header = _END - 1 - op
+            cls = classes[header & 255]
+            attribute_set = header >> 8
+            if attribute_set == _LONG_ATTRIBUTE_SET:
+                attribute_set = next(ops_iterator)
+            element = new(cls)
+            if cls in special:
+                if cls is Raw:
+                    element._data = table[next(ops_iterator)]
+                elif cls is Slot:
+                    Slot.__init__(
+                        element,
+                        table[next(ops_iterator)],
+                        escape_data=bool(next(ops_iterator)),
+                    )
+                else:
+                    element._charset = None
+                    htmls.append((element, next(ops_iterator), next(ops_iterator)))
+            if attribute_set > last_attribute_set:
+                last_attribute_set = attribute_set
+                element._attributes = attribute_dicts[attribute_set]
+            elif attribute_set:
+                element._attributes = _AttributeDict(attribute_dicts[attribute_set])
+            else:
+                element._attributes = None
+            element._rendered = None
+            element._parents = None
+            children.append(element)
+            stack.append((element, children))
+            children = []
+    if stack or len(root) != 1:
+        raise ValueError("data is truncated or corrupt.")
+    for html, head, body in htmls:
+        html.head = html._children[head]
+        html.body = html._children[body]
+    return root[0]
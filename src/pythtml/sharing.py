@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+"""Sharing of subtrees between trees.
+
+_Element.clone copies a tree lazily: the copy shares the children and attribute dicts of
+the original, as _SharedChildren, until they are changed, when they are copied as
+_CopiedChildren.  intern replaces the subtrees of a tree with single instances of the
+subtrees of the same structure, whose children are _FrozenChildren and whose attribute
+dicts are _FrozenAttributeDict, so that they cannot be changed.
+"""
+
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from weakref import WeakValueDictionary
+
+from .elements import (
+    _NO_CHILDREN,
+    Markup,
+    _attribute_key,
+    _AttributeDict,
+    _Element,
+    _extra_slots,
+    _is_async_child,
+    _slot_names,
+)
+
+__all__ = ["intern"]
+
+
+class _SharedChildren(tuple):
+    """Children of an element copied by clone, whose element children and attribute dict
+    are shared with the element it was copied from until it is changed."""
+
+    __slots__ = ()
+
+
+class _CopiedChildren(list):
+    """Children of an element copied by clone once it has its own copies of them."""
+
+    __slots__ = ()
+
+
+class _FrozenChildren(tuple):
+    """Children of an element interned by intern, which cannot be changed."""
+
+    __slots__ = ()
+
+
+_NO_SHARED_CHILDREN = _SharedChildren()
+_NO_FROZEN_CHILDREN = _FrozenChildren()
+
+# classes of the children of the elements of trees copied by clone.
+_CLONED_CHILDREN = (_SharedChildren, _CopiedChildren)
+
+
+def _unshared(path: List[_Element], copies: Dict[int, Any]) -> _Element:
+    """Returns the last element of path, a list of elements from the root of a tree down
+    to it, once the elements of path that share their children with the elements they
+    were copied from by clone have their own copies.  copies maps the ids of the children
+    replaced so far by copies to their copies; elements of path already replaced are
+    looked up there."""
+
+    # pylint: disable=protected-access
+    node = path[0]
+    for element in path[1:]:
+        children = node._children
+        if children.__class__ is _SharedChildren:
+            node._unshare()
+            copies.update(zip(map(id, children), node._children))
+        node = copies.get(id(element), element)
+    return node
+
+
+class _FrozenAttributeDict(_AttributeDict):
+    """Attribute dict of an element interned by intern, which cannot be changed."""
+
+    __slots__ = ()
+
+    def _frozen(self, *args, **kwargs):
+        raise TypeError("the attributes of interned elements cannot be changed.")
+
+    __setitem__ = __delitem__ = __ior__ = _frozen
+    clear = pop = popitem = setdefault = update = _frozen  # type: ignore
+
+
+_NO_FROZEN_ATTRIBUTES = _FrozenAttributeDict()
+
+# Interned elements by structure; see intern.  Entries are dropped with the last tree
+# using them.
+_interned: "WeakValueDictionary[tuple, _Element]" = WeakValueDictionary()
+
+# classes of text children keyed by value rather than by their str.
+_STR_CLASSES = (str, Markup)
+
+
+def _intern_key(element: _Element, children: List[Any]) -> Optional[tuple]:
+    """Returns the structure of element with children, its interned children, as a
+    hashable key, or None if element cannot be interned."""
+
+    # pylint: disable=protected-access
+    cls = element.__class__
+    if not cls._cacheable:
+        return None
+    names = _slot_names.get(cls)
+    if names is None:
+        names = _extra_slots(cls)
+    extra = tuple(getattr(element, x, None) for x in names) if names else ()
+    if extra and any(isinstance(x, _Element) for x in extra):
+        # e.g. Html, whose head and body are kept apart.
+        return None
+    child_keys = []
+    for child in children:
+        if isinstance(child, _Element):
+            if child._children.__class__ is not _FrozenChildren:
+                # the child could not be interned.
+                return None
+            child_keys.append(child)
+        elif child.__class__ in _STR_CLASSES:
+            child_keys.append((child.__class__, child))
+        elif _is_async_child(child):
+            return None
+        else:
+            # values are rendered as their str, e.g. 0.0 and -0.0 differ.
+            child_keys.append((child.__class__, str(child)))
+    attributes = element._attributes
+    attribute_keys = _attribute_key(attributes) if attributes else ()
+    key = (cls, attribute_keys, extra, tuple(child_keys))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def _intern_element(element: _Element, children: List[Any]) -> _Element:
+    """Returns the interned element with the structure of element with children, its
+    interned children, interning element if there is none.  Elements that cannot be
+    interned are returned with their children replaced by children."""
+
+    # pylint: disable=protected-access
+    key = _intern_key(element, children)
+    if key is not None:
+        found = _interned.get(key)
+        if found is not None:
+            return found
+    old_children = element._children
+    if children != (
+        old_children if isinstance(old_children, list) else list(old_children)
+    ):
+        element._invalidate()
+        element._replace_children(children or _NO_CHILDREN)
+    if key is not None:
+        element._children = _FrozenChildren(children) or _NO_FROZEN_CHILDREN
+        element._attributes = (
+            _FrozenAttributeDict(element._attributes)
+            if element._attributes
+            else _NO_FROZEN_ATTRIBUTES
+        )
+        _interned[key] = element
+    return element
+
+
+def intern(element: _Element) -> _Element:  # pylint: disable=redefined-builtin
+    """Returns element with each of its subtrees replaced by a single, frozen instance of
+    the subtrees of the same structure, e.g. to keep repetitive documents compact.
+    Subtrees are frozen in place, and shared with the trees previously interned.  The
+    markup of an interned subtree is rendered once per render, and then reused.
+
+    Interned elements and their attribute dicts raise TypeError when changed; copy them
+    with clone to change them.  Subtrees containing Lazy or Cached elements, async
+    children, html elements, or unhashable values are not interned, but the subtrees
+    they contain are."""
+
+    # pylint: disable=protected-access
+    element._unshare()
+    # (element, its interned children so far, its remaining children)
+    stack: List[Tuple[_Element, List[Any], Iterator[Any]]] = [
+        (element, [], iter(element._children))
+    ]
+    while True:
+        node, children, pending = stack[-1]
+        for child in pending:
+            if isinstance(child, _Element):
+                children_class = child._children.__class__
+                if children_class is not _FrozenChildren:
+                    if children_class is _SharedChildren:
+                        child._unshare()
+                    stack.append((child, [], iter(child._children)))
+                    break
+            children.append(child)
+        else:
+            stack.pop()
+            node = _intern_element(node, children)
+            if not stack:
+                return node
+            stack[-1][1].append(node)
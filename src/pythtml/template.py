@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+"""Precompiled templates.
+
+compile flattens an element tree once into a list of static strings and Slot references.
+Rendering the compiled template then only fills in the slots and joins the list.
+
+    >>> from pythtml import *
+    >>> from pythtml.template import compile
+    >>> template = compile(P('You are logged in as ', Slot('username', escape_data=True), '.'))
+    >>> print(template.render(username='poindexter'))
+    <p>You are logged in as poindexter.</p>
+"""
+
+from typing import Any, List, Tuple
+
+from .elements import (
+    _AUTO_ESCAPE_END,
+    Markup,
+    _Element,
+    _escape_text,
+    _SegmentOwners,
+    _SlotMarkup,
+)
+
+__all__ = ["Template", "compile"]
+
+
+class Template:
+    """An element tree flattened into static segments and slots."""
+
+    __slots__ = ("_segments", "_slots")
+
+    def __init__(self, segments: List[str], slots: List[Tuple[int, str, bool, bool]]):
+        """segments contains the static markup, with a placeholder at the offset of each
+        slot; slots contains (offset, name, escape_data, escape) for each slot, where
+        escape_data is True if text values are escaped, and escape is True if the slot is
+        below an AutoEscape element."""
+
+        self._segments = segments
+        self._slots = slots
+
+    @property
+    def slot_names(self) -> List[str]:
+        """Returns the names of the slots in document order, without duplicates."""
+
+        return list(dict.fromkeys(name for _, name, _, _ in self._slots))
+
+    def render(self, **context: Any) -> str:
+        """Renders the template, substituting the values in context for slots.  Element
+        and Markup values are inserted as markup; other values are converted with str,
+        and escaped if the slot was created with escape_data=True, or is below an
+        AutoEscape element, as text children would be.  Element values below an
+        AutoEscape element are rendered as its children would be.  Raises KeyError if a
+        slot has no value in context."""
+
+        # pylint: disable=protected-access
+        parts = self._segments[:]
+        for offset, name, escape_data, escape in self._slots:
+            value = context[name]
+            if isinstance(value, _Element):
+                parts[offset] = "".join(value._iter_segments(escape=escape))
+            elif escape_data and not isinstance(value, Markup):
+                parts[offset] = _escape_text(str(value))
+            else:
+                parts[offset] = str(value)
+        return "".join(parts)
+
+    def __str__(self):
+        return "".join(self._segments)
+
+
+def compile(element: _Element) -> Template:  # pylint: disable=redefined-builtin
+    """Compiles element into a Template.  Adjacent static markup is merged, so a
+    template has one static segment between consecutive slots."""
+
+    # pylint: disable=protected-access
+    segments: List[str] = []
+    slots: List[Tuple[int, str, bool, bool]] = []
+    static: List[str] = []
+    # the open elements, the last one being the slot, tell how its values are escaped;
+    # cached markup does not preserve slots.
+    owners = _SegmentOwners()
+    for segment in owners.iter_segments(element, False, memoize=False):
+        if isinstance(segment, _SlotMarkup):
+            if static:
+                segments.append("".join(static))
+                static = []
+            escape = any(x._close_markup() is _AUTO_ESCAPE_END for x in owners.nodes)
+            escape_data = segment.slot.escape_data or (
+                escape and owners.nodes[-2]._escapes_text
+            )
+            slots.append((len(segments), segment.slot.name, escape_data, escape))
+            segments.append(str.__str__(segment))
+        else:
+            static.append(segment)
+    if static:
+        segments.append("".join(static))
+    return Template(segments, slots)
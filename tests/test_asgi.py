@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+
+import asyncio
+
+from pythtml import *
+from pythtml.asgi import send_response
+
+
+def _send_response(element, **kwargs):
+    messages = []
+    async def send(message):
+        messages.append(message)
+    asyncio.run(send_response(send, element, **kwargs))
+    return messages
+
+def test_send_response():
+    async def content():
+        return P('испытание')
+    html = Html(Head(), Body(content()), encoding='koi8-r')
+    messages = _send_response(html, chunk_size=16)
+    assert messages[0] == {
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-type', b'text/html; charset=koi8-r')],
+        }
+    assert all(message['type'] == 'http.response.body' for message in messages[1:])
+    assert [message['more_body'] for message in messages[1:]] == [True] * (len(messages) - 2) + [False]
+    body = b''.join(message['body'] for message in messages[1:])
+    assert body == str(Html(Head(), Body(P('испытание')), encoding='koi8-r')).encode('koi8-r')
+
+def test_send_response_headers():
+    messages = _send_response(Div(), status=404, headers=[(b'Content-Type', b'text/plain')])
+    assert messages[0]['status'] == 404
+    assert messages[0]['headers'] == [(b'Content-Type', b'text/plain')]
+    assert b''.join(message['body'] for message in messages[1:]) == b'<div></div>'
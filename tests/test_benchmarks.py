@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+
+
+import importlib.util
+import json
+from pathlib import Path
+
+import pytest
+
+
+def _load():
+    path = Path(__file__).parent.parent / 'benchmarks' / 'run.py'
+    spec = importlib.util.spec_from_file_location('benchmarks_run', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def test_benchmarks_run():
+    run = _load()
+    results = run.run(None, [8], 1)
+    assert {x['scenario'] for x in results['results']} == {x.name for x in run.SCENARIOS}
+    assert all(x['best_seconds'] >= 0 for x in results['results'])
+    assert len(run.compare(results, results)) == len(run.SCENARIOS)
+    assert len(run.report(results)) == len(run.SCENARIOS) + 1
+
+def test_benchmarks_unknown_scenario():
+    with pytest.raises(ValueError):
+        _load().run(['nonesuch'], [8], 1)
+
+def test_benchmarks_main(tmp_path, capsys):
+    output = tmp_path / 'results.json'
+    _load().main(['--scenario', 'table-render', '--sizes', '4', '--repeat', '1', '--output', str(output)])
+    assert json.loads(output.read_text())['results'][0]['scenario'] == 'table-render'
+    assert 'table-render' in capsys.readouterr().out
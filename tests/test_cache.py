@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+
+import multiprocessing
+import time
+
+import pytest
+
+from pythtml import *
+from pythtml.cache import FileCache, LRUCache
+
+
+@pytest.fixture(params=['lru', 'file'])
+def backend(request, tmp_path):
+    return LRUCache() if request.param == 'lru' else FileCache(str(tmp_path / 'cache'))
+
+def test_backend_get_set(backend):
+    assert backend.get('x') is None
+    backend.set('x', '<p>é\r\n</p>')
+    assert backend.get('x') == '<p>é\r\n</p>'
+    backend.set('x', '<p>y</p>')
+    assert backend.get('x') == '<p>y</p>'
+    backend.delete('x')
+    backend.delete('x')
+    assert backend.get('x') is None
+
+def test_backend_ttl(backend, monkeypatch):
+    backend.set('x', 'markup', ttl=10)
+    backend.set('y', 'markup')
+    assert backend.get('x') == 'markup'
+    now = time.time() + 11
+    monotonic = time.monotonic() + 11
+    monkeypatch.setattr(time, 'time', lambda: now)
+    monkeypatch.setattr(time, 'monotonic', lambda: monotonic)
+    assert backend.get('x') is None
+    assert backend.get('y') == 'markup'
+
+def test_backend_clear(backend):
+    backend.set('x', 'a')
+    backend.set('y', 'b')
+    backend.clear()
+    assert backend.get('x') is None
+    assert backend.get('y') is None
+
+def test_lru_max_entries():
+    backend = LRUCache(max_entries=2)
+    backend.set('a', '1')
+    backend.set('b', '2')
+    backend.get('a')
+    backend.set('c', '3')
+    assert len(backend) == 2
+    assert backend.get('b') is None
+    assert backend.get('a') == '1'
+
+def test_lru_max_size():
+    backend = LRUCache(max_size=10)
+    backend.set('a', '12345')
+    backend.set('b', '12345')
+    backend.set('c', '123')
+    assert backend.get('a') is None
+    assert backend.size == 8
+    backend.set('d', '12345678901')
+    assert backend.get('d') is None
+    assert backend.size == 8
+    with pytest.raises(ValueError):
+        LRUCache(max_entries=0)
+
+def _set_in_other_process(directory):
+    FileCache(directory).set('shared', '<nav></nav>')
+
+def test_file_cache_shared(tmp_path):
+    directory = str(tmp_path)
+    process = multiprocessing.Process(target=_set_in_other_process, args=(directory,))
+    process.start()
+    process.join()
+    assert FileCache(directory).get('shared') == '<nav></nav>'
+    assert [x.suffix for x in tmp_path.iterdir()] == ['.html']
+
+def test_cached(backend):
+    calls = []
+    def build():
+        calls.append(None)
+        return Ul(Li('a & b'))
+    def page():
+        return Body(Cached('menu', build, backend=backend), P('text'))
+    assert str(page()) == '<body><ul><li>a & b</li></ul><p>text</p></body>'
+    assert str(page()) == '<body><ul><li>a & b</li></ul><p>text</p></body>'
+    assert len(calls) == 1
+    assert str(AutoEscape(page())) == '<body><ul><li>a &amp; b</li></ul><p>text</p></body>'
+    assert str(AutoEscape(page())) == '<body><ul><li>a &amp; b</li></ul><p>text</p></body>'
+    assert len(calls) == 2
+
+def test_cached_ttl(monkeypatch):
+    backend = LRUCache()
+    values = iter(['first', 'second'])
+    element = Div(Cached('x', lambda: next(values), ttl=5, backend=backend))
+    assert str(element) == '<div>first</div>'
+    assert str(element) == '<div>first</div>'
+    assert str(element) == '<div>first</div>'
+    monotonic = time.monotonic() + 6
+    monkeypatch.setattr(time, 'monotonic', lambda: monotonic)
+    assert str(element) == '<div>second</div>'
+    with pytest.raises(ValueError):
+        Cached('x', str, ttl=0)
+
+def test_cached_default_backend(monkeypatch):
+    from pythtml import cache
+    backend = LRUCache()
+    monkeypatch.setattr(cache, 'default_backend', backend)
+    assert str(Cached('x', lambda: B('bold'))) == '<b>bold</b>'
+    assert backend.get('x') == '<b>bold</b>'
+
+def test_cached_slots():
+    assert not hasattr(Cached('x', str), '__dict__')
+
+def test_incomplete_backend():
+    from pythtml.cache import CacheBackend
+
+    class Incomplete(CacheBackend):
+        def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        Incomplete()
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+
+import gzip
+import io
+import zlib
+
+import pytest
+
+from pythtml import *
+from pythtml.compress import PRECOMPRESSED_MIN_LENGTH, iter_compressed, write_compressed_to
+
+
+def _document(encoding='utf-8', text='é'):
+    return Html(
+        Head(Title('report'), Link(rel='stylesheet', href='style.css')),
+        Body(
+            Raw('<div>%s</div>' % ('static %s ' % text * PRECOMPRESSED_MIN_LENGTH)),
+            *(P('paragraph %d %s' % (i, text), class_='p') for i in range(500))),
+        encoding=encoding)
+
+@pytest.mark.parametrize('coding, decompress', [('gzip', gzip.decompress), ('deflate', zlib.decompress)])
+@pytest.mark.parametrize('level', [-1, 0, 1, 5, 6, 9])
+def test_iter_compressed(coding, decompress, level):
+    doc = _document()
+    data = b''.join(iter_compressed(doc, coding=coding, level=level))
+    assert decompress(data) == bytes(doc)
+
+@pytest.mark.parametrize('encoding, text', [
+    ('iso-8859-1', 'é'),
+    ('shift_jis', '日本語'),
+    ('utf-16', 'é 日本語'),
+    ])
+def test_iter_compressed_encoding(encoding, text):
+    doc = _document(encoding, text)
+    assert gzip.decompress(b''.join(iter_compressed(doc))) == bytes(doc)
+    assert gzip.decompress(b''.join(iter_compressed(doc, encoding='utf-8'))) == str(doc).encode('utf-8')
+
+def test_iter_compressed_minify():
+    doc = _document()
+    data = b''.join(iter_compressed(doc, minify=True))
+    assert gzip.decompress(data) == doc.render(minify=True).encode('utf-8')
+
+def test_iter_compressed_flush_after_head():
+    blocks = list(iter_compressed(_document()))
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    assert decompressor.decompress(blocks[0]).endswith(b'href="style.css"></head>')
+
+def test_iter_compressed_flush_after():
+    doc = Div(*(P(i) for i in range(100)), Br(), P('end'))
+    blocks = list(iter_compressed(doc, flush_after=['<br>']))
+    assert len(blocks) == 2
+    assert zlib.decompressobj(31).decompress(blocks[0]).endswith(b'<p>99</p><br>')
+    assert len(list(iter_compressed(doc, flush_after=()))) == 1
+
+def test_iter_compressed_chunk_size():
+    doc = Div(*(P('%d' % i * 10) for i in range(5000)))
+    blocks = list(iter_compressed(doc, chunk_size=1000, level=0, flush_after=()))
+    assert all(len(x) >= 1000 for x in blocks[:-1])
+    assert len(blocks) > 1
+    assert gzip.decompress(b''.join(blocks)) == str(doc).encode('utf-8')
+
+def _precompressed():
+    """Returns the number of segments kept compressed."""
+
+    from pythtml.elements import _segment_values
+    return sum(1 for x in _segment_values.values() for key in x if key[0] == 'deflate')
+
+def test_iter_compressed_precompressed():
+    import gc
+    doc = _document()
+    first = b''.join(iter_compressed(doc))
+    assert _precompressed() == 1
+    # the cached markup of the whole document is compressed on its own from now on.
+    str(doc)
+    str(doc)
+    second = b''.join(iter_compressed(doc))
+    third = b''.join(iter_compressed(doc))
+    assert _precompressed() == 2
+    assert second == third
+    assert gzip.decompress(first) == gzip.decompress(second) == bytes(doc)
+    # the compressed data is dropped when the elements change, or with them.
+    doc.body.append(P('end'))
+    assert _precompressed() == 1
+    del doc
+    gc.collect()
+    assert _precompressed() == 0
+
+def test_iter_compressed_stateful_codec_not_precompressed():
+    doc = _document('utf-16')
+    assert gzip.decompress(b''.join(iter_compressed(doc))) == bytes(doc)
+    assert _precompressed() == 0
+
+@pytest.mark.parametrize('options', [
+    {'chunk_size': 0},
+    {'coding': 'br'},
+    {'level': 10},
+    ])
+def test_iter_compressed_invalid(options):
+    with pytest.raises(ValueError):
+        list(iter_compressed(Div(), **options))
+
+def test_write_compressed_to():
+    doc = _document()
+    fp = io.BytesIO()
+    assert write_compressed_to(doc, fp, coding='deflate') == len(fp.getvalue())
+    assert zlib.decompress(fp.getvalue()) == bytes(doc)
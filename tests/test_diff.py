@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+
+import random
+
+import pytest
+
+from pythtml import *
+from pythtml.diff import Patch, diff
+from pythtml.elements import _Element
+
+
+def _apply(tree, patches, key='id'):
+    """Applies patches to tree, using the nodes they carry, and returns the tree.  Checks
+    that the target of each patch is on its path."""
+
+    for patch in patches:
+        depth = len(patch.path) - len(patch.target_path)
+        assert patch.path[depth:] == patch.target_path
+        target = tree
+        for x in patch.path[:depth]:
+            target = target.children()[x]
+        assert (patch.target is None and depth == 0) or target.attributes.get(key) == patch.target
+        *parent_path, offset = patch.path or (None,)
+        parent = tree
+        for x in parent_path:
+            parent = parent.children()[x]
+        if patch.op == 'replace':
+            if not patch.path:
+                tree = patch.node
+            else:
+                children = parent.children()
+                children[offset] = patch.node
+                parent._children = children
+        elif patch.op == 'insert':
+            parent._own_children().insert(offset, patch.node)
+        elif patch.op == 'remove':
+            parent._children = parent.children()[:offset] + parent.children()[offset + 1:]
+        else:
+            element = parent.children()[offset] if patch.path else tree
+            if patch.op == 'set_attribute':
+                element.attributes[patch.name] = True if patch.value == '' else patch.value
+            else:
+                del element.attributes[patch.name]
+    return tree
+
+def _rows(values, **attributes):
+    return Table(
+        Tbody(*(Tr(Td(key), Td(value), id='row-%s' % key) for key, value in values)),
+        **attributes)
+
+def _canonical(node):
+    """Returns node as nested tuples, ignoring the order of attributes, as the DOM does."""
+
+    if not isinstance(node, _Element):
+        return str(node)
+    attributes = sorted((k, '' if v is True else str(v)) for k, v in node.attributes.items())
+    return (node.__class__, attributes, [_canonical(x) for x in node.children()])
+
+def _check(make_old, new, key='id'):
+    patches = diff(make_old(), new, key)
+    assert _canonical(_apply(make_old(), patches, key)) == _canonical(new)
+    return patches
+
+def test_diff_same():
+    assert diff(_rows([(1, 'a')]), _rows([(1, 'a')])) == []
+    doc = _rows([(1, 'a')])
+    assert diff(doc, doc) == []
+
+def test_diff_text():
+    patches = _check(lambda: _rows([(1, 'a'), (2, 'b')]), _rows([(1, 'a'), (2, 'c')]))
+    assert patches == [Patch('replace', (0, 1, 1, 0), 'c', node='c', target='row-2', target_path=(1, 0))]
+
+def test_diff_targets():
+    old = lambda: Div(AutoEscape(Ul(Li('a', id='a'), Li('b', id='b'), P(Span('x')), id='list')), id='root')
+    new = Div(AutoEscape(Ul(Li('a', class_='on', id='a'), P(Span('y')), Li('c', id='c'), id='list')), id='root')
+    patches = _check(old, new)
+    assert [(x.op, x.path, x.target, x.target_path) for x in patches] == [
+        ('remove', (0, 0, 1), 'b', ()),
+        ('insert', (0, 0, 2), 'list', (2,)),
+        ('set_attribute', (0, 0, 0), 'a', ()),
+        ('replace', (0, 0, 1, 0, 0), 'list', (1, 0, 0)),
+        ]
+    patches = diff(Div(P('a')), Div(P('b')))
+    assert [(x.target, x.target_path) for x in patches] == [(None, (0, 0))]
+
+def test_diff_attributes():
+    old = lambda: Div(P('a', class_='x', title='t'), id='d')
+    new = Div(P('a', class_='y', hidden=True), id='d')
+    patches = _check(old, new)
+    assert [x[:5] for x in patches] == [
+        ('set_attribute', (0,), None, 'class', 'y'),
+        ('set_attribute', (0,), None, 'hidden', ''),
+        ('remove_attribute', (0,), None, 'title', None),
+        ]
+
+def test_diff_equal_attribute_values():
+    from decimal import Decimal
+    patches = _check(lambda: Div(P(title=Decimal('1.0'))), Div(P(title=Decimal('1.00'))))
+    assert [x[:5] for x in patches] == [('set_attribute', (0,), None, 'title', '1.00')]
+
+def test_diff_insert_keyed():
+    patches = _check(lambda: _rows([(1, 'a'), (3, 'c')]), _rows([(0, 'z'), (1, 'a'), (2, 'b'), (3, 'c')]))
+    assert [(x.op, x.path) for x in patches] == [('insert', (0, 0)), ('insert', (0, 2))]
+    assert patches[1].html == '<tr id="row-2"><td>2</td><td>b</td></tr>'
+
+def test_diff_remove_keyed():
+    patches = _check(lambda: _rows([(1, 'a'), (2, 'b'), (3, 'c')]), _rows([(1, 'a'), (3, 'c')]))
+    assert [(x.op, x.path) for x in patches] == [('remove', (0, 1))]
+
+def test_diff_move_keyed():
+    patches = _check(lambda: _rows([(1, 'a'), (2, 'b'), (3, 'c'), (4, 'd')]), _rows([(4, 'd'), (1, 'a'), (2, 'b'), (3, 'c')]))
+    assert [(x.op, x.path) for x in patches] == [('remove', (0, 3)), ('insert', (0, 0))]
+
+def test_diff_other_key():
+    old = lambda: Ul(*(Li(x, data_key=x) for x in 'abc'))
+    new = Ul(*(Li(x, data_key=x) for x in 'bc'))
+    patches = _check(old, new, key='data-key')
+    assert [(x.op, x.path) for x in patches] == [('remove', (0,))]
+
+def test_diff_unkeyed_by_position():
+    patches = _check(lambda: Ul(Li('a'), Li('b')), Ul(Li('a'), Li('c'), Li('d')))
+    assert [(x.op, x.path) for x in patches] == [('insert', (2,)), ('replace', (1, 0))]
+
+def test_diff_replace_element():
+    patches = _check(lambda: Div(P('a'), 'text'), Div(Span('a'), Em('b')))
+    assert [(x.op, x.path, x.html) for x in patches] == [
+        ('replace', (0,), '<span>a</span>'), ('replace', (1,), '<em>b</em>')]
+
+def test_diff_replace_root():
+    patches = _check(lambda: Div('a'), P('a'))
+    assert [(x.op, x.path) for x in patches] == [('replace', ())]
+
+def test_diff_pseudo_elements():
+    assert diff(Div(Raw('<b>')), Div(Raw('<b>'))) == []
+    assert [x.html for x in diff(Div(Raw('<b>')), Div(Raw('<i>')))] == ['<i>']
+    assert [x.op for x in diff(Div(Lazy(['a'])), Div(Lazy(['a'])))] == ['replace']
+
+def test_diff_auto_escape():
+    old = lambda: AutoEscape(Div(P('a'), Script('x')))
+    new = AutoEscape(Div(P('a < b'), Script('1 < 2'), P('&')))
+    patches = _check(old, new)
+    assert [x.html for x in patches] == ['<p>&amp;</p>', 'a &lt; b', '1 < 2']
+
+def test_diff_cached_markup():
+    old, new = _rows([(1, 'a')]), _rows([(1, 'a')])
+    for x in (old, new):
+        str(x)
+        str(x)
+    assert diff(old, new) == []
+
+def _random_tree(rng, depth=0):
+    children = []
+    for _ in range(rng.randrange(0, 5 if depth < 3 else 1)):
+        if rng.random() < 0.3:
+            children.append(rng.choice(['a', 'b', 'c']))
+        else:
+            children.append(_random_tree(rng, depth + 1))
+    attributes = {}
+    if rng.random() < 0.5:
+        attributes['id'] = rng.choice('uvwxyz')
+    if rng.random() < 0.3:
+        attributes['class_'] = rng.choice(['p', 'q'])
+    return rng.choice([Div, Span, P])(*children, **attributes)
+
+@pytest.mark.parametrize('seed', range(200))
+def test_diff_random(seed):
+    rng = random.Random(seed)
+    _random_tree(rng)
+    new = _random_tree(rng)
+    patches = _check(lambda: _random_tree(random.Random(seed)), new)
+    assert all(isinstance(x, Patch) for x in patches)
@@ -116,3 +116,956 @@ def test_demangle_data_attr():
     ])
 def test_attribute_quoted(input, expected):
     assert str(input) == expected
+
+def _sample_doc():
+    return Html(
+        Head(Title('pythtml'), Script(Raw('var x = 1 < 2;'))),
+        Body(
+            H1('pythtml', id='title'),
+            Ul(*(Li('item %d' % i, class_='row') for i in range(100))),
+            Img(src='a.png', alt='A'),
+            P('испытание', Br()),
+            ),
+        )
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 8192])
+def test_iter_render(chunk_size):
+    doc = _sample_doc()
+    chunks = list(doc.iter_render(chunk_size=chunk_size))
+    assert ''.join(chunks) == str(doc)
+    assert all(0 < len(chunk) <= chunk_size for chunk in chunks)
+    assert all(len(chunk) == chunk_size for chunk in chunks[:-1])
+
+@pytest.mark.parametrize("element", [Img(src='a.png'), Raw('<b>raw</b>'), P()])
+def test_iter_render_leaf(element):
+    assert ''.join(element.iter_render()) == str(element)
+
+def test_iter_render_bad_chunk_size():
+    with pytest.raises(ValueError):
+        list(P().iter_render(chunk_size=0))
+
+def test_write_to():
+    import io
+    doc = _sample_doc()
+    fp = io.StringIO()
+    count = doc.write_to(fp, chunk_size=100)
+    assert fp.getvalue() == str(doc)
+    assert count == len(str(doc))
+
+def test_deep_tree_str():
+    import sys
+    depth = sys.getrecursionlimit() * 5
+    element = root = Div()
+    for _ in range(depth):
+        child = Div()
+        element.append(child)
+        element = child
+    element.append(Raw('leaf'))
+    assert str(root) == '<div>' * (depth + 1) + 'leaf' + '</div>' * (depth + 1)
+
+def test_str_matches_nested_render():
+    doc = _sample_doc()
+    expected = ('<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>pythtml</title>'
+        '<script>var x = 1 < 2;</script></head><body><h1 id="title">pythtml</h1><ul>'
+        + ''.join('<li class="row">item %d</li>' % i for i in range(100))
+        + '</ul><img src="a.png" alt="A"><p>испытание<br></br></p></body></html>')
+    assert str(doc) == expected
+
+@pytest.mark.parametrize("name", [name for name in __import__('pythtml').elements.__all__ if name not in ('Html', 'Raw', 'Slot', 'Lazy', 'Cached')])
+def test_element_slots(name):
+    import pythtml
+    element = getattr(pythtml, name)()
+    assert not hasattr(element, '__dict__')
+
+def test_attributes_lazy():
+    element = Td()
+    assert element.attributes == {}
+    element.attributes['id'] = 'foo'
+    assert str(element) == '<td id="foo"></td>'
+
+def test_attributes_set():
+    element = Td(id='foo')
+    element.attributes = {'class': 'bar'}
+    assert str(element) == '<td class="bar"></td>'
+
+def test_append_to_childless():
+    element = Ul()
+    element.append(Li('a'))
+    element.insert(0, Li('b'))
+    element.remove(element.children()[0])
+    assert str(element) == '<ul><li>a</li></ul>'
+
+def _render_twice(element):
+    str(element)
+    return str(element)
+
+def test_render_cache_hit():
+    from pythtml.elements import render_cache_clear, render_cache_info
+    nav = Ul(*(Li(A('link %d' % i, href='/%d' % i)) for i in range(3)))
+    expected = _render_twice(nav)
+    render_cache_clear()
+    assert str(Div(nav)) == '<div>%s</div>' % expected
+    info = render_cache_info()
+    assert info.hits == 1
+    assert info.misses == 1
+
+def _item(doc):
+    return doc.children()[0].children()[0]
+
+def _img(doc):
+    return doc.children()[0].children()[1].children()[0]
+
+@pytest.mark.parametrize("mutate", [
+    lambda doc: _item(doc).append(B('new')),
+    lambda doc: _item(doc).insert(0, B('new')),
+    lambda doc: _item(doc).remove(_item(doc).children()[0]),
+    lambda doc: _item(doc).attributes.update(class_='x'),
+    lambda doc: _item(doc).attributes.__setitem__('class', 'x'),
+    lambda doc: _item(doc).attributes.pop('id'),
+    lambda doc: setattr(_item(doc), 'attributes', {'class': 'x'}),
+    lambda doc: _img(doc).attributes.__setitem__('alt', 'x'),
+    ])
+def test_render_cache_invalidate(mutate):
+    def build():
+        return Div(Ul(Li(Span('a'), id='item'), Li(Img(src='b.png'))), P('c'))
+    doc = build()
+    _render_twice(doc)
+    _render_twice(doc)
+    mutate(doc)
+    expected = build()
+    mutate(expected)
+    assert str(doc) == str(expected)
+
+def test_render_cache_pseudo_elements():
+    raw = Raw('<b>a</b>')
+    slot = Slot('x')
+    doc = Div(raw, slot)
+    _render_twice(doc)
+    _render_twice(doc)
+    raw.data = '<i>b</i>'
+    assert str(doc) == '<div><i>b</i>{x}</div>'
+    _render_twice(doc)
+    slot.name = 'y'
+    assert str(doc) == '<div><i>b</i>{y}</div>'
+    with pytest.raises(ValueError):
+        slot.name = 'not a name'
+    assert str(doc) == '<div><i>b</i>{y}</div>'
+
+def test_render_cache_shared_subtree():
+    header = Header(H1('title'))
+    pages = [Div(header, P('page %d' % i)) for i in range(3)]
+    for page in pages:
+        _render_twice(page)
+    header.children()[0].append(Raw(' changed'))
+    for i, page in enumerate(pages):
+        assert str(page) == '<div><header><h1>title changed</h1></header><p>page %d</p></div>' % i
+
+def test_render_cache_partial_rerender():
+    from pythtml.elements import render_cache_clear, render_cache_info
+    rows = [Tr(Td(str(i))) for i in range(10)]
+    table = Table(*rows)
+    _render_twice(table)
+    rows[5].append(Td('x'))
+    render_cache_clear()
+    str(table)
+    # table and row 5 are rendered again, with the cells of row 5, which are not cached
+    # as their markup is more than half that of the row; the other rows are hits.
+    assert render_cache_info() == (9, 4)
+
+def test_render_cache_deep_tree():
+    import time
+    import tracemalloc
+    def build():
+        root = node = Div()
+        for i in range(4000):
+            child = Div('text %d' % i)
+            node.append(child)
+            node = child
+        return root
+    root = build()
+    start = time.perf_counter()
+    expected = str(root)
+    first = time.perf_counter() - start
+    start = time.perf_counter()
+    assert str(root) == expected
+    assert time.perf_counter() - start < 10 * first + 0.1
+    root = build()
+    assert str(root) == expected
+    tracemalloc.start()
+    try:
+        assert str(root) == expected
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # the markup cached is not copied for each element containing it, which would take
+    # about 2000 times the length of the markup.
+    assert peak < 100 * len(expected)
+    assert retained < 100 * len(expected)
+    cached = 0
+    node = root
+    while isinstance(node, Div):
+        if isinstance(node._rendered, str):
+            cached += len(node._rendered)
+        node = node.children()[-1]
+    assert len(expected) <= cached < 2 * len(expected)
+    assert str(root) == expected
+
+def test_render_cache_encoding():
+    html = Html(Head(), Body())
+    _render_twice(html)
+    html.encoding = 'iso-8859-1'
+    assert str(html) == '<!DOCTYPE html>\n<html><head><meta charset="iso-8859-1"></head><body></body></html>'
+
+def test_pickle_cached():
+    import pickle
+    doc = Div(P('a', class_='b'), Img(src='c'))
+    expected = _render_twice(doc)
+    _render_twice(doc)
+    copy = pickle.loads(pickle.dumps(doc))
+    assert str(copy) == expected
+    copy.children()[0].attributes['class'] = 'd'
+    assert str(copy) == '<div><p class="d">a</p><img src="c"></div>'
+
+@pytest.mark.parametrize("value", [
+    '', 'plain', "it's", '"quoted"', '\'both\' "quotes"', 'a & b', '<tag>', 'line\nbreak', 'tab\there', 'cr\r', 'испытание',
+    ])
+def test_quote_attr_value(value):
+    from xml.sax.saxutils import quoteattr
+    from pythtml.elements import _quote_attr_value
+    assert _quote_attr_value(value) == quoteattr(value)
+
+def test_attribute_string_cache_types():
+    assert str(Input(value=1)) == '<input value="1">'
+    assert str(Input(value=True)) == '<input value>'
+    assert str(Input(value=1.0)) == '<input value="1.0">'
+
+def test_attribute_string_cache_equal_values():
+    from decimal import Decimal
+    assert str(Input(value=Decimal('1.0'))) == '<input value="1.0">'
+    assert str(Input(value=Decimal('1.00'))) == '<input value="1.00">'
+    assert str(Input(value=Decimal('1.0'))) == '<input value="1.0">'
+
+def test_attribute_unhashable_value():
+    assert str(Div(data_list=[1, 2])) == '<div data-list="[1, 2]"></div>'
+
+@pytest.mark.parametrize("encoding, text", [
+    ('utf-8', 'испытание'),
+    ('iso-8859-1', 'Málaga'),
+    ('shift_jis', '日本語のテキスト ~\\'),
+    ('iso-2022-jp', '日本語 text 日本語'),
+    ('utf-16', 'текст'),
+    ])
+@pytest.mark.parametrize("chunk_size", [1, 5, 8192])
+def test_html_iter_bytes(encoding, text, chunk_size):
+    html = Html(Head(Title(text)), Body(*(P(text, ' ', i) for i in range(50))), encoding=encoding)
+    expected = str(html).encode(encoding)
+    chunks = list(html.iter_bytes(chunk_size=chunk_size))
+    assert b''.join(chunks) == expected
+    assert all(len(chunk) == chunk_size for chunk in chunks[:-1])
+    assert bytes(html) == expected
+
+def test_element_iter_bytes_encoding():
+    assert b''.join(P('Málaga').iter_bytes()) == '<p>Málaga</p>'.encode('utf-8')
+    assert b''.join(P('Málaga').iter_bytes(encoding='cp1252')) == '<p>Málaga</p>'.encode('cp1252')
+
+def test_write_bytes_to():
+    import io
+    html = Html(Head(), Body(P('испытание')), encoding='koi8-r')
+    fp = io.BytesIO()
+    assert html.write_bytes_to(fp, chunk_size=16) == len(fp.getvalue())
+    assert fp.getvalue() == str(html).encode('koi8-r')
+
+def test_html_charset_meta_moved():
+    head = Head()
+    html = Html(head, Body())
+    meta = head.children()[0]
+    head.remove(meta)
+    head.append(Title('x'))
+    head.append(meta)
+    html.encoding = 'iso-8859-1'
+    assert html.encoding == 'iso-8859-1'
+    assert str(head) == '<head><title>x</title><meta charset="iso-8859-1"></head>'
+
+def _render_async(element, chunk_size=8192):
+    import asyncio
+    chunks = []
+    async def send(chunk):
+        chunks.append(chunk)
+    asyncio.run(element.render_async(send, chunk_size))
+    return chunks
+
+def test_render_async_sync_tree():
+    doc = _sample_doc()
+    assert ''.join(_render_async(doc, chunk_size=100)) == str(doc)
+
+def test_render_async_children():
+    import asyncio
+    async def value(x, delay):
+        await asyncio.sleep(delay)
+        return x
+    async def items():
+        for i in range(3):
+            await asyncio.sleep(0)
+            yield Li(i)
+    doc = Div(
+        P(value('slow', 0.02)),
+        P(value(B('element'), 0)),
+        Ul(items()),
+        value([Span('a'), 'b', None], 0),
+        asyncio.sleep(0),
+        )
+    assert ''.join(_render_async(doc)) == '<div><p>slow</p><p><b>element</b></p><ul><li>0</li><li>1</li><li>2</li></ul><span>a</span>b</div>'
+
+def test_render_async_concurrent():
+    import asyncio
+    import time
+    async def value(x):
+        await asyncio.sleep(0.1)
+        return x
+    doc = Ul(*(Li(value(i)) for i in range(10)))
+    start = time.monotonic()
+    assert ''.join(_render_async(doc)) == '<ul>%s</ul>' % ''.join('<li>%d</li>' % i for i in range(10))
+    assert time.monotonic() - start < 0.5
+
+def test_render_async_order():
+    import asyncio
+    sent = []
+    async def value():
+        assert sent == ['<div><p>before</p>']
+        return 'after'
+    async def run():
+        async def send(chunk):
+            sent.append(chunk)
+        await Div(P('before'), value()).render_async(send)
+    asyncio.run(run())
+    assert sent == ['<div><p>before</p>', 'after', '</div>']
+
+def test_render_async_nested():
+    import asyncio
+    async def inner():
+        return 'inner'
+    async def outer():
+        return Span(inner())
+    assert ''.join(_render_async(Div(outer()))) == '<div><span>inner</span></div>'
+
+def test_render_async_awaitables():
+    import types
+    class Value:
+        def __await__(self):
+            return iter(())
+    @types.coroutine
+    def legacy():
+        yield from ()
+        return 'legacy'
+    assert ''.join(_render_async(Div(Value(), legacy()))) == '<div>legacy</div>'
+    with pytest.raises(TypeError):
+        str(Div(Value()))
+
+def test_render_async_error_cancels():
+    import asyncio
+    cancelled = []
+    async def fail():
+        raise ValueError()
+    async def slow():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+    with pytest.raises(ValueError):
+        _render_async(Div(fail(), slow()))
+    assert cancelled == [True]
+
+def test_str_async_child():
+    import asyncio
+    coroutine = asyncio.sleep(0)
+    with pytest.raises(TypeError):
+        str(Div(coroutine))
+    coroutine.close()
+
+def test_lazy():
+    rows = [['a', 1], ['b', 2]]
+    consumed = []
+    def generate():
+        for row in rows:
+            consumed.append(row)
+            yield Tr(*(Td(x) for x in row))
+        yield None
+    tbody = Tbody(Tr(Th('name'), Th('value')), Lazy(generate()))
+    assert consumed == []
+    assert str(tbody) == '<tbody><tr><th>name</th><th>value</th></tr><tr><td>a</td><td>1</td></tr><tr><td>b</td><td>2</td></tr></tbody>'
+    assert consumed == rows
+
+def test_lazy_streaming():
+    def generate():
+        for i in range(1000):
+            yield Li(i)
+    chunks = Ul(Lazy(generate())).iter_render(chunk_size=64)
+    assert next(chunks) == ('<ul>' + ''.join('<li>%d</li>' % i for i in range(10)))[:64]
+
+def test_lazy_single_use():
+    element = Ul(Lazy(Li(x) for x in 'ab'))
+    assert str(element) == '<ul><li>a</li><li>b</li></ul>'
+    with pytest.raises(RuntimeError):
+        str(element)
+
+def test_lazy_children_find_by_id():
+    lazy = Lazy(Li(x, id=x) for x in 'ab')
+    element = Ul(lazy, id='list')
+    assert element.children() == [lazy]
+    assert element.find_by_id('a') is None
+    assert element.find_by_id('list') is element
+
+def test_lazy_not_cached():
+    header = Header(H1('title'))
+    _render_twice(header)
+    _render_twice(header)
+    doc = Div(header, Lazy(iter([P('x')])))
+    str(doc)
+    doc2 = Div(header, Lazy(iter([P('y')])))
+    assert str(doc2) == '<div><header><h1>title</h1></header><p>y</p></div>'
+
+def test_lazy_async_items():
+    async def value(x):
+        return x
+    element = Ul(Lazy(Li(value(x)) for x in 'ab'))
+    assert ''.join(_render_async(element)) == '<ul><li>a</li><li>b</li></ul>'
+
+def test_auto_escape():
+    element = AutoEscape(Div('Tom & Jerry', P('1 < 2', 3), 'plain'))
+    assert str(element) == '<div>Tom &amp; Jerry<p>1 &lt; 23</p>plain</div>'
+
+def test_auto_escape_exempt():
+    from pythtml import Markup, escape_text
+    element = AutoEscape(Div(Markup('<b>bold</b>'), Raw('<i>x</i>'), escape_text('a & b'), Script('1 < 2 && 3'), Style('a > b {}')))
+    assert str(element) == '<div><b>bold</b><i>x</i>a &amp; b<script>1 < 2 && 3</script><style>a > b {}</style></div>'
+
+def test_escape_text():
+    from pythtml import Markup, escape_text
+    assert escape_text('<a href="x">&</a>') == '&lt;a href="x"&gt;&amp;&lt;/a&gt;'
+    assert isinstance(escape_text('x'), Markup)
+    assert escape_text(escape_text('&')) == '&amp;'
+    assert escape_text(3) == '3'
+    assert str(Raw('a < b & c', escape_data=True)) == 'a &lt; b &amp; c'
+
+def test_auto_escape_cache():
+    paragraph = P('a < b')
+    div = Div(paragraph)
+    for _ in range(3):
+        assert str(div) == '<div><p>a < b</p></div>'
+        assert str(AutoEscape(div)) == '<div><p>a &lt; b</p></div>'
+    escaped = AutoEscape(div)
+    _render_twice(escaped)
+    assert str(escaped) == '<div><p>a &lt; b</p></div>'
+    assert str(Article(escaped)) == '<article><div><p>a &lt; b</p></div></article>'
+    paragraph.append(Raw('!'))
+    assert str(escaped) == '<div><p>a &lt; b!</p></div>'
+
+def test_auto_escape_nested_element():
+    element = Div('<', AutoEscape(Span('<')), '<')
+    assert str(element) == '<div><<span>&lt;</span><</div>'
+    assert str(element) == str(element)
+
+def test_auto_escape_html_bytes():
+    html = Html(Head(), Body('café & co'), encoding='latin-1')
+    assert bytes(html).decode('latin-1') == str(html)
+    assert b''.join(AutoEscape(html).iter_bytes()) == str(AutoEscape(html)).encode('latin-1')
+
+def test_auto_escape_render_async():
+    from pythtml import Markup
+    async def value():
+        return ['a < b', P('&'), Markup('<br>')]
+    element = AutoEscape(Div(value(), '<'))
+    assert ''.join(_render_async(element)) == '<div>a &lt; b<p>&amp;</p><br>&lt;</div>'
+
+def test_table_from_rows():
+    rows = [(1, 'a', None), (2, 'b', 3.5)]
+    table = Table.from_rows(iter(rows), columns=['n', 's', 'x'], id='t')
+    expected = Table(
+        Thead(Tr(Th('n'), Th('s'), Th('x'))),
+        Tbody(*(Tr(*(Td('' if v is None else v) for v in row)) for row in rows)),
+        id='t')
+    assert str(table) == str(expected)
+    with pytest.raises(RuntimeError):
+        str(table)
+
+def test_table_from_rows_no_columns():
+    import csv
+    import io
+    table = Table.from_rows(csv.reader(io.StringIO('a,b\n1,2\n')))
+    assert str(table) == '<table><tbody><tr><td>a</td><td>b</td></tr><tr><td>1</td><td>2</td></tr></tbody></table>'
+    assert str(Table.from_rows([])) == '<table><tbody></tbody></table>'
+
+def test_table_from_rows_row_attrs():
+    table = Table.from_rows([(1,), (2,)], row_attrs={'class_': '100%', 'hidden': True})
+    assert str(table) == '<table><tbody><tr class="100%" hidden><td>1</td></tr><tr class="100%" hidden><td>2</td></tr></tbody></table>'
+    table = Table.from_rows([(1,), (2,)], row_attrs=lambda row: {'class_': 'odd' if row[0] % 2 else None, 'data_n': row[0]})
+    assert str(table) == '<table><tbody><tr class="odd" data-n="1"><td>1</td></tr><tr data-n="2"><td>2</td></tr></tbody></table>'
+
+def test_table_from_rows_cell_formatters():
+    rows = [(1, 0.5), (2, None)]
+    by_name = Table.from_rows(rows, columns=['n', 'share'], cell_formatters={'share': lambda x: x and B('%d%%' % (x * 100))})
+    assert str(by_name) == '<table><thead><tr><th>n</th><th>share</th></tr></thead><tbody><tr><td>1</td><td><b>50%</b></td></tr><tr><td>2</td><td></td></tr></tbody></table>'
+    by_offset = Table.from_rows(rows, cell_formatters={0: lambda x: x * 10})
+    assert '<td>10</td><td>0.5</td>' in str(by_offset)
+    as_list = Table.from_rows(rows, cell_formatters=[None, str])
+    assert '<td>2</td><td>None</td>' in str(as_list)
+
+def test_table_from_rows_wrong_length():
+    table = Table.from_rows([(1, 2), (3,)])
+    with pytest.raises(ValueError):
+        str(table)
+
+def test_table_from_rows_auto_escape():
+    from pythtml import Markup
+    table = Table.from_rows([('a < b', Markup('<i>i</i>'), 'x')], cell_formatters={2: lambda x: Span('&')})
+    assert str(AutoEscape(table)) == '<table><tbody><tr><td>a &lt; b</td><td><i>i</i></td><td><span>&amp;</span></td></tr></tbody></table>'
+    assert str(Table.from_rows([('<',)])) == '<table><tbody><tr><td><</td></tr></tbody></table>'
+
+def test_table_from_rows_streaming():
+    consumed = []
+    def rows():
+        for i in range(1000):
+            consumed.append(i)
+            yield (i,)
+    chunks = Table.from_rows(rows()).iter_render(chunk_size=64)
+    next(chunks)
+    assert len(consumed) < 10
+
+def test_find_by_id_text_children():
+    element = Div('text', P('more text', 1, Span(id='foo')))
+    assert element.find_by_id('foo') is element.children()[1].children()[2]
+
+def test_find_by_id_self():
+    element = Div(id='foo')
+    assert element.find_by_id('foo') is element
+
+def test_find_by_id_duplicate():
+    from pythtml import DuplicateIdError
+    element = Div(P(id='foo'), P(id='foo'), P(id='bar'))
+    with pytest.raises(DuplicateIdError):
+        element.find_by_id('foo')
+    assert element.find_by_id('bar') is element.children()[2]
+    assert element.duplicate_ids() == ['foo']
+
+def test_find_by_id_index_reused():
+    element = Div(*(P(id='p%d' % i) for i in range(100)))
+    assert element.find_by_id('p1') is element.children()[1]
+    index = element._index
+    assert element.find_by_id('p99') is element.children()[99]
+    assert element._index is index
+
+def test_find_by_id_index_collected():
+    import gc
+    import weakref
+    element = Div(P(id='p'), id='root')
+    assert element.find_by_id('root') is element
+    assert element.find_by_id('p') is element.children()[0]
+    element_ref = weakref.ref(element)
+    del element
+    gc.collect()
+    assert element_ref() is None
+
+@pytest.mark.parametrize("mutate, old_found, new_found", [
+    (lambda inner, p: inner.append(Span(id='new')), True, True),
+    (lambda inner, p: inner.insert(0, Span(id='new')), True, True),
+    (lambda inner, p: p.attributes.__setitem__('id', 'new'), False, True),
+    (lambda inner, p: inner.remove(p), False, False),
+    (lambda inner, p: p.attributes.pop('id'), False, False),
+    ])
+def test_find_by_id_after_change(mutate, old_found, new_found):
+    p = P(id='old')
+    inner = Div(p)
+    element = Div(Div(inner))
+    assert element.find_by_id('old') is p
+    assert element.find_by_id('new') is None
+    mutate(inner, p)
+    assert (element.find_by_id('old') is p) == old_found
+    assert (element.find_by_id('new') is not None) == new_found
+
+def test_find_by_id_after_render_cache():
+    p = P(id='old')
+    element = Div(Div(p))
+    _render_twice(element)
+    _render_twice(element)
+    assert element.find_by_id('old') is p
+    p.attributes['id'] = 'new'
+    assert element.find_by_id('new') is p
+    assert str(element) == '<div><div><p id="new"></p></div></div>'
+
+def test_find_by_id_deep():
+    import sys
+    element = root = Div()
+    for _ in range(sys.getrecursionlimit() * 2):
+        child = Div()
+        element.append(child)
+        element = child
+    element.append(P(id='leaf'))
+    assert root.find_by_id('leaf') is element.children()[0]
+
+def test_minify_optional_end_tags():
+    element = Div(Ul(Li('a'), Li('b')), P('c'), P('d'), Dl(Dt('e'), Dd('f'), Dt('g')))
+    assert element.render(minify=True) == \
+        '<div><ul><li>a<li>b</ul><p>c<p>d<dl><dt>e<dd>f<dt>g</dt></dl></div>'
+
+def test_minify_table():
+    element = Table(Thead(Tr(Th('a'), Th('b'))), Tbody(Tr(Td(1), Td(2)), Tr(Td(3), Td(4))))
+    assert element.render(minify=True) == \
+        '<table><thead><tr><th>a<th>b<tbody><tr><td>1<td>2<tr><td>3<td>4</table>'
+
+def test_minify_select():
+    element = Select(
+        Optgroup(Option('a'), Option('b'), label='x'),
+        Optgroup(Option('c', selected=True), label='y'),
+        Option('d'))
+    assert element.render(minify=True) == \
+        '<select><optgroup label=x><option>a<option>b<optgroup label=y><option selected>c' \
+        '</optgroup><option>d</select>'
+
+def test_minify_document():
+    doc = Html(Head(Title('t')), Body(P('a')), lang='en')
+    assert doc.render(minify=True) == \
+        '<!DOCTYPE html>\n<html lang=en><head><meta charset=utf-8><title>t</title><body><p>a'
+
+@pytest.mark.parametrize("element, expected", [
+    # followed by text, or by a pseudo-element.
+    (Ul(Li('a'), ' ', Li('b')), '<ul><li>a</li> <li>b</ul>'),
+    (Ul(Li('a'), Raw('<!-- c -->'), Li('b')), '<ul><li>a</li><!-- c --><li>b</ul>'),
+    # followed by an element that does not close it.
+    (Div(P('a'), Span('b')), '<div><p>a</p><span>b</span></div>'),
+    # parents in which the end tag may not be omitted.
+    (A(P('a')), '<a><p>a</p></a>'),
+    (Div(Li('a'), Li('b')), '<div><li>a</li><li>b</li></div>'),
+    (Ul(Lazy([Li('a'), Li('b')])), '<ul><li>a</li><li>b</li></ul>'),
+    (Li('a'), '<li>a</li>'),
+    ])
+def test_minify_kept_end_tags(element, expected):
+    assert element.render(minify=True) == expected
+
+@pytest.mark.parametrize("value, expected", [
+    ('a', 'a'),
+    ('a/b?c', 'a/b?c'),
+    ('', '""'),
+    ('a b', '"a b"'),
+    ('a=b', '"a=b"'),
+    ("it's", '"it\'s"'),
+    ('a"b', '\'a"b\''),
+    ('a&b', '"a&amp;b"'),
+    ('a`', '"a`"'),
+    (1, '1'),
+    ])
+def test_minify_attribute_quotes(value, expected):
+    assert Div(title=value).render(minify=True) == '<div title=%s></div>' % expected
+
+def test_minify_auto_escape():
+    element = AutoEscape(Ul(Li('a < b'), Li(Script('1 < 2'))))
+    assert element.render(minify=True) == '<ul><li>a &lt; b<li><script>1 < 2</script></ul>'
+
+def test_minify_table_from_rows():
+    table = Table.from_rows([(1, 'a b'), (2, 'c')], columns=['n', 'v'], row_attrs={'class_': 'row'})
+    assert table.render(minify=True) == \
+        '<table><thead><tr><th>n<th>v<tbody><tr class=row><td>1<td>a b<tr class=row><td>2<td>c</table>'
+
+def test_minify_not_cached():
+    element = Ul(Li('a', title='x'), Li('b'))
+    expected = '<ul><li title="x">a</li><li>b</li></ul>'
+    _render_twice(element)
+    assert element.render(minify=True) == '<ul><li title=x>a<li>b</ul>'
+    assert element.render(minify=True) == '<ul><li title=x>a<li>b</ul>'
+    assert str(element) == expected
+    assert element.render() == expected
+
+def test_minify_chunks():
+    import io
+    doc = Html(Head(), Body(Ul(*(Li('item %d é' % i, id=i) for i in range(200)))))
+    expected = doc.render(minify=True)
+    assert len(expected) < len(str(doc))
+    assert ''.join(doc.iter_render(100, minify=True)) == expected
+    assert b''.join(doc.iter_bytes(100, minify=True)) == expected.encode('utf-8')
+    stream = io.StringIO()
+    assert doc.write_to(stream, minify=True) == len(expected)
+    assert stream.getvalue() == expected
+    stream = io.BytesIO()
+    doc.write_bytes_to(stream, encoding='latin-1', minify=True)
+    assert stream.getvalue() == expected.encode('latin-1')
+
+def test_minify_async_child():
+    async def child():
+        return 'a'
+
+    coroutine = child()
+    with pytest.raises(TypeError):
+        Div(coroutine).render(minify=True)
+    coroutine.close()
+
+def _layout():
+    return Html(
+        Head(Title('layout')),
+        Body(
+            Ul(*(Li(A(i, href='/%d' % i)) for i in range(5)), id='nav'),
+            Div(Div(id='main'), class_='content'),
+            P('footer', id='footer'),
+            ),
+        )
+
+def test_clone():
+    layout = _layout()
+    expected = str(layout)
+    page = layout.clone()
+    assert page is not layout
+    assert str(page) == expected
+    page.find_by_id('main').append(P('hello'))
+    assert str(layout) == expected
+    assert str(page) == expected.replace('<div id="main"></div>', '<div id="main"><p>hello</p></div>')
+
+def test_clone_shares_unchanged():
+    layout = _layout()
+    _render_twice(layout)
+    page = layout.clone()
+    page.find_by_id('main').attributes['class'] = 'x'
+    nav, content, _ = layout.body._children
+    page_nav, page_content, _ = page._children[1]._children
+    assert page_nav._children[0] is nav._children[0]
+    assert page_nav._attributes is nav._attributes
+    assert page_content._children[0] is not content._children[0]
+    assert page_content._attributes is not content._attributes
+    assert '<div id="main" class="x">' in str(page)
+    assert '<div id="main">' in str(layout)
+
+def test_clone_attributes():
+    element = Div(P('a', class_='x'), title='t')
+    copy = element.clone()
+    assert copy.attributes == {'title': 't'}
+    copy.attributes['title'] = 'u'
+    copy.children()[0].attributes = {'id': 'p'}
+    assert str(element) == '<div title="t"><p class="x">a</p></div>'
+    assert str(copy) == '<div title="u"><p id="p">a</p></div>'
+
+@pytest.mark.parametrize('mutate', [
+    lambda x: x.append(Span()),
+    lambda x: x.insert(0, Span()),
+    lambda x: x.remove(x.children()[0]),
+    ])
+def test_clone_children(mutate):
+    element = Div(P('a'), P('b'))
+    expected = str(element)
+    copy = element.clone()
+    mutate(copy)
+    assert str(element) == expected
+    assert str(copy) != expected
+
+def test_clone_of_clone():
+    layout = _layout()
+    expected = str(layout)
+    page = layout.clone()
+    page.find_by_id('main').append(P('a'))
+    other = page.clone()
+    other.find_by_id('main').append(P('b'))
+    other.find_by_id('footer').attributes['class'] = 'f'
+    assert str(layout) == expected
+    assert '<div id="main"><p>a</p></div>' in str(page)
+    assert '<p id="footer">' in str(page)
+    assert '<div id="main"><p>a</p><p>b</p></div>' in str(other)
+    assert '<p id="footer" class="f">' in str(other)
+
+def test_clone_select():
+    layout = _layout()
+    expected = str(layout)
+    page = layout.clone()
+    for link in page.select('#nav a'):
+        link.attributes['class'] = 'link'
+    page.select_one('li').append(Span('first'))
+    assert str(layout) == expected
+    assert str(page).count('class="link"') == 5
+    assert '<span>first</span></li>' in str(page)
+
+def test_clone_in_other_tree():
+    element = Div(Span(id='s'))
+    copy = element.clone()
+    root = Div(copy)
+    root.find_by_id('s').attributes['class'] = 'x'
+    root.select_one('span').append(B())
+    assert str(element) == '<div><span id="s"></span></div>'
+    assert str(root) == '<div><div><span id="s" class="x"><b></b></span></div></div>'
+
+def test_clone_find_by_id():
+    layout = _layout()
+    page = layout.clone()
+    assert page.find_by_id('missing') is None
+    assert page.find_by_id(['unhashable']) is None
+    assert page.find_by_id('nav') is not layout.find_by_id('nav')
+    copy = Div(P(id='a'), Div(P(id='a'))).clone()
+    with pytest.raises(DuplicateIdError):
+        copy.find_by_id('a')
+
+def test_clone_html():
+    layout = _layout()
+    page = layout.clone()
+    assert page.encoding == 'utf-8'
+    page.encoding = 'latin-1'
+    page.body.append(P('é'))
+    assert page.head is page.children()[0]
+    assert page.body is page.children()[1]
+    assert layout.encoding == 'utf-8'
+    assert 'é' not in str(layout)
+    assert bytes(page).endswith('<p>\xe9</p></body></html>'.encode('latin-1'))
+    assert b'<meta charset="latin-1">' in bytes(page)
+
+def test_clone_pickle():
+    import pickle
+    page = _layout().clone()
+    page.find_by_id('main').append(P('a'))
+    assert str(pickle.loads(pickle.dumps(page))) == str(page)
+
+def test_intern():
+    element = Table(*(Tr(Td('—'), Td(Br()), Td(i)) for i in range(3)))
+    expected = str(element)
+    interned = intern(element)
+    assert str(interned) == expected
+    rows = interned.children()
+    assert rows[0] is not rows[1]
+    assert rows[0].children()[0] is rows[1].children()[0]
+    assert rows[0].children()[1] is rows[2].children()[1]
+    assert rows[0].children()[2] is not rows[1].children()[2]
+
+def test_intern_shared_across_trees():
+    assert intern(Td(Span(class_='icon'))) is intern(Td(Span(class_='icon')))
+    assert intern(Br()) is intern(Br())
+
+@pytest.mark.parametrize('first, second', [
+    (Td('1'), Td(1)),
+    (Td(1), Td(True)),
+    (Td(0.0), Td(-0.0)),
+    (Td('<b>'), Td(Markup('<b>'))),
+    (Td(title='1'), Td(title=1)),
+    (Td(title='a', id='b'), Td(id='b', title='a')),
+    (Raw('a'), Raw('b')),
+    (Div(), Span()),
+    ])
+def test_intern_different(first, second):
+    assert intern(first) is not intern(second)
+
+@pytest.mark.parametrize('mutate', [
+    lambda x: x.append(Span()),
+    lambda x: x.insert(0, Span()),
+    lambda x: x.remove(x.children()[0]),
+    lambda x: x.attributes.update(title='t'),
+    lambda x: x.attributes.__setitem__('class', 'x'),
+    lambda x: x.attributes.pop('class'),
+    lambda x: setattr(x, 'attributes', {}),
+    ])
+def test_intern_frozen(mutate):
+    element = intern(Div(P('a'), class_='c'))
+    with pytest.raises(TypeError):
+        mutate(element)
+    assert str(element) == '<div class="c"><p>a</p></div>'
+
+@pytest.mark.parametrize('element, mutate', [
+    (Raw('a'), lambda x: setattr(x, 'data', 'b')),
+    (Slot('a'), lambda x: setattr(x, 'name', 'b')),
+    ])
+def test_intern_frozen_pseudo_elements(element, mutate):
+    element = intern(Div(element)).children()[0]
+    with pytest.raises(TypeError):
+        mutate(element)
+
+def test_intern_clone_is_mutable():
+    element = intern(Div(P('a'), id='d'))
+    copy = element.clone()
+    copy.attributes['class'] = 'x'
+    copy.children()[0].append(B('b'))
+    assert str(copy) == '<div id="d" class="x"><p>a<b>b</b></p></div>'
+    assert str(element) == '<div id="d"><p>a</p></div>'
+
+def test_intern_not_internable():
+    lazy = Lazy(['x'])
+    element = intern(Div(lazy, P('a')))
+    assert element.children()[0] is lazy
+    assert element.children()[1] is intern(P('a'))
+    element.append(P('b'))
+    assert str(element) == '<div>x<p>a</p><p>b</p></div>'
+
+def test_intern_html():
+    first = intern(Html(Head(Title('t')), Body(P('a'))))
+    second = intern(Html(Head(Title('t')), Body(P('a'))))
+    assert first is not second
+    assert second.head is first.head
+    assert second.children() == [first.head, first.body]
+    assert second.encoding == 'utf-8'
+
+def test_intern_render_cache():
+    element = intern(Ul(*(Li(Span('item')) for _ in range(100))))
+    render_cache_clear()
+    str(element)
+    # the shared item is rendered twice, then its cached markup is used.
+    assert render_cache_info().hits == 98
+
+@pytest.mark.parametrize("encoding, text", [
+    ('utf-8', 'испытание'),
+    ('iso-8859-1', 'Málaga'),
+    ('shift_jis', '日本語のテキスト ~\\'),
+    ('iso-2022-jp', '日本語 text 日本語'),
+    ('utf-16', 'текст'),
+    ])
+@pytest.mark.parametrize("minify", [False, True])
+def test_byte_length_render_into(encoding, text, minify):
+    def document():
+        return Html(Head(Title(text)), Body(*(P(text * i, id=i) for i in range(40))), encoding=encoding)
+
+    expected = b''.join(document().iter_bytes(minify=minify))
+    doc = document()
+    length = doc.byte_length(minify=minify)
+    assert length == len(expected)
+    buffer = bytearray(length)
+    assert doc.render_into(buffer, minify=minify) == length
+    assert buffer == expected
+    assert doc.byte_length(minify=minify) == length
+
+def test_byte_length_cached():
+    doc = Div(P('испытание' * 100), 'text')
+    _render_twice(doc)
+    assert doc.byte_length() == len(str(doc).encode('utf-8'))
+    assert doc.byte_length('koi8-r') == len(str(doc).encode('koi8-r'))
+    assert doc.byte_length() == len(str(doc).encode('utf-8'))
+
+def test_byte_length_kept_with_element():
+    import gc
+    from pythtml.elements import _segment_values
+    paragraph = P('испытание' * 100)
+    doc = Div(paragraph)
+    _render_twice(doc)
+    assert doc.byte_length() == len(str(doc).encode('utf-8'))
+    assert doc in _segment_values
+    paragraph.append(Raw('é'))
+    assert doc not in _segment_values
+    assert doc.byte_length() == len(str(doc).encode('utf-8'))
+    del doc, paragraph
+    gc.collect()
+    assert not _segment_values
+
+def test_byte_length_renders_once():
+    doc = Div(*(P(i) for i in range(10)))
+    render_cache_clear()
+    buffer = bytearray(doc.byte_length())
+    doc.render_into(buffer)
+    assert bytes(buffer) == str(doc).encode('utf-8')
+    assert render_cache_info().misses == 11
+
+def test_byte_length_unencodable():
+    with pytest.raises(UnicodeEncodeError):
+        Div('日本語').byte_length('ascii')
+
+def test_render_into_larger_buffer():
+    import array
+    buffer = bytearray(b'x' * 20)
+    assert Div('é').render_into(buffer) == 13
+    assert buffer == '<div>é</div>'.encode('utf-8') + b'x' * 7
+    values = array.array('I', [0] * 4)
+    assert P('abcdef').render_into(values) == 13
+    assert values.tobytes()[:13] == b'<p>abcdef</p>'
+
+def test_render_into_small_buffer():
+    with pytest.raises(ValueError):
+        Div('text').render_into(bytearray(10))
+    with pytest.raises(TypeError):
+        Div('text').render_into(b' ' * 100)
@@ -1,4 +1,34 @@
+import subprocess
+import sys
+
+import pytest
+
 import pythtml
 
+# maximum time to import pythtml in a fresh interpreter, in seconds.
+IMPORT_TIME_BUDGET = 0.075
+
+def _run(code):
+    return subprocess.run([sys.executable, '-c', code], check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+
 def test_version():
     assert pythtml.__version__
+
+def test_missing_attribute():
+    with pytest.raises(AttributeError):
+        pythtml.nonesuch
+
+def test_import_time():
+    code = 'import time; start = time.perf_counter(); import pythtml; print(time.perf_counter() - start)'
+    assert min(float(_run(code)) for _ in range(5)) < IMPORT_TIME_BUDGET
+
+def test_import_lazy_modules():
+    modules = _run('import sys, pythtml; print(" ".join(sys.modules))').split()
+    for name in ('asyncio', 'importlib.metadata', 'inspect', 'pythtml.query', 'xml.sax.saxutils'):
+        assert name not in modules
+
+def test_star_import():
+    namespace = {}
+    exec('from pythtml import *', namespace)
+    assert isinstance(namespace['Div'](), pythtml.elements.Div)
+    assert all(name in namespace for name in pythtml.elements.__all__)
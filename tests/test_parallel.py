@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from pythtml import *
+from pythtml import Markup
+from pythtml.parallel import _plan, render_parallel
+
+
+def _table(rows=500):
+    return Html(
+        Head(Title('report')),
+        Body(
+            H1('report'),
+            Table(
+                Thead(Tr(Th('a'), Th('b'))),
+                Tbody(*(Tr(Td(i, class_='n'), Td('row %d' % i), 'text') for i in range(rows))),
+                ),
+            ),
+        )
+
+def test_render_parallel_fork():
+    doc = _table()
+    assert render_parallel(doc, min_subtree_size=100, workers=2, fork=True) == str(doc)
+
+def test_render_parallel_fork_concurrent():
+    docs = [_table(rows=500 + i) for i in range(4)]
+    with ThreadPoolExecutor(4) as executor:
+        results = list(executor.map(lambda x: render_parallel(x, min_subtree_size=100, workers=2, fork=True), docs))
+    assert results == [str(x) for x in docs]
+
+def test_render_parallel_executor():
+    doc = _table()
+    with ThreadPoolExecutor(2) as executor:
+        assert render_parallel(doc, executor=executor, min_subtree_size=100) == str(doc)
+
+def test_render_parallel_small():
+    doc = _table(rows=10)
+    assert _plan(doc, 1000, 8) == [str(doc)]
+    assert render_parallel(doc, min_subtree_size=1000, workers=2, fork=True) == str(doc)
+
+def test_plan_chunks():
+    doc = _table()
+    parts = _plan(doc, 100, 8)
+    chunks = [part for part in parts if not isinstance(part, str)]
+    assert len(chunks) == 8
+    # the chunks cover the rows of the table body, in order.
+    assert chunks[0][1] == 0 and chunks[-1][2] == 500
+    assert all(x[2] == y[1] for x, y in zip(chunks, chunks[1:]))
+
+def test_render_parallel_one_worker():
+    doc = _table()
+    assert render_parallel(doc, min_subtree_size=100, workers=1, fork=True) == str(doc)
+
+def test_render_parallel_needs_executor_or_fork():
+    doc = _table()
+    with pytest.raises(ValueError):
+        render_parallel(doc)
+    with ThreadPoolExecutor(2) as executor:
+        with pytest.raises(ValueError):
+            render_parallel(doc, executor, fork=True)
+
+def test_render_parallel_auto_escape():
+    rows = (Tr(Td('%d < %d' % (i, i + 1)), Td(Markup('<b>&amp;</b>')), Script('1 < 2')) for i in range(500))
+    doc = AutoEscape(Div(Table(Tbody(*rows))))
+    expected = str(doc)
+    assert '<td>1 &lt; 2</td><td><b>&amp;</b></td><script>1 < 2</script>' in expected
+    assert render_parallel(doc, min_subtree_size=100, workers=2, fork=True) == expected
+    with ThreadPoolExecutor(2) as executor:
+        assert render_parallel(doc, executor, min_subtree_size=100, workers=2) == expected
+
+def test_render_parallel_executor_unserializable():
+    class Cell(Td):
+        __slots__ = ()
+
+    doc = Table(Tbody(*(Tr(Cell(i), Td(i)) for i in range(500))))
+    with ThreadPoolExecutor(2) as executor:
+        assert render_parallel(doc, executor, min_subtree_size=100, workers=2) == str(doc)
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+
+import asyncio
+import io
+
+import pytest
+
+from pythtml import *
+from pythtml.profiling import RenderProfiler
+
+
+def _entries(profiler):
+    return {entry.name: entry for entry in profiler.report()}
+
+def test_profiler_report():
+    doc = Div(P('a', Span('b')), P('c'))
+    with RenderProfiler() as profiler:
+        str(doc)
+    entries = _entries(profiler)
+    assert set(entries) == {'Div', 'P', 'Span'}
+    assert entries['P'].calls == 2
+    assert entries['P'].hits == 0
+    assert entries['P'].characters == len(str(P('a', Span('b')))) + len(str(P('c')))
+    assert entries['Div'].characters == len(str(doc))
+    assert entries['Div'].total_time >= entries['Div'].self_time >= 0
+
+def test_profiler_nested_same_class():
+    doc = Div(Div(Div('x')))
+    with RenderProfiler() as profiler:
+        str(doc)
+    entry = _entries(profiler)['Div']
+    assert entry.calls == 3
+    assert entry.characters == len(str(doc))
+
+def test_profiler_hits():
+    doc = Div(P('a'))
+    str(doc)
+    str(doc)
+    with RenderProfiler() as profiler:
+        str(doc)
+    assert _entries(profiler) == {'Div': _entries(profiler)['Div']}
+    assert _entries(profiler)['Div'].hits == 1
+
+def test_profiler_label():
+    sidebar = Div(P('a'))
+    doc = Body(sidebar, Div('b'))
+    with RenderProfiler() as profiler:
+        profiler.label(sidebar, 'sidebar')
+        str(doc)
+    entries = _entries(profiler)
+    assert entries['sidebar'].calls == 1
+    assert entries['sidebar'].characters == len(str(sidebar))
+    assert entries['Div'].calls == 1
+    assert sorted(line.rsplit(' ', 1)[0] for line in profiler.folded()) == [
+        'Body', 'Body;Div', 'Body;sidebar', 'Body;sidebar;P']
+
+def test_profiler_write_folded():
+    with RenderProfiler() as profiler:
+        str(Div(P('a')))
+    fp = io.StringIO()
+    profiler.write_folded(fp)
+    lines = fp.getvalue().splitlines()
+    assert [line.split(' ')[0] for line in lines] == ['Div;P', 'Div']
+    assert all(line.split(' ')[1].isdigit() for line in lines)
+
+def test_profiler_format_report():
+    with RenderProfiler() as profiler:
+        str(Div(P('a')))
+    lines = profiler.format_report().splitlines()
+    assert lines[0].split() == ['name', 'calls', 'hits', 'total', 'ms', 'self', 'ms', 'characters']
+    assert len(lines) == 3
+    assert len(profiler.format_report(limit=1).splitlines()) == 2
+
+def test_profiler_inactive():
+    profiler = RenderProfiler()
+    str(Div(P('a')))
+    with profiler:
+        pass
+    str(Div(P('a')))
+    assert profiler.report() == []
+    with pytest.raises(RuntimeError):
+        profiler.stop()
+
+def test_profiler_nested_profilers():
+    with RenderProfiler() as outer:
+        str(P('a'))
+        with RenderProfiler() as inner:
+            str(Div())
+        str(Span())
+    assert set(_entries(outer)) == {'P', 'Span'}
+    assert set(_entries(inner)) == {'Div'}
+
+def test_profiler_clear():
+    with RenderProfiler() as profiler:
+        str(Div())
+        profiler.clear()
+        str(P())
+    assert set(_entries(profiler)) == {'P'}
+    assert [line.split(' ')[0] for line in profiler.folded()] == ['P']
+
+def test_profiler_iter_render():
+    doc = Div(*(P('paragraph %d' % i) for i in range(20)))
+    expected = str(Div(*(P('paragraph %d' % i) for i in range(20))))
+    with RenderProfiler() as profiler:
+        assert ''.join(doc.iter_render(chunk_size=16)) == expected
+    entries = _entries(profiler)
+    assert entries['P'].calls == 20
+    assert entries['Div'].characters == len(str(doc))
+
+def test_profiler_render_async():
+    async def child():
+        await asyncio.sleep(0)
+        return Span('x')
+    doc = Div(P('a'), child())
+    chunks = []
+    async def send(data):
+        chunks.append(data)
+    with RenderProfiler() as profiler:
+        asyncio.run(doc.render_async(send))
+    entries = _entries(profiler)
+    assert ''.join(chunks) == '<div><p>a</p><span>x</span></div>'
+    assert entries['Span'].calls == 1
+    assert entries['Div'].calls == 1
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+
+import pytest
+import uuid
+
+from pythtml import *
+from pythtml.query import compile_selector
+
+
+def _doc():
+    return Html(
+        Head(Title('test')),
+        Body(
+            Article(
+                H1('title', id='title'),
+                P(Img(src='a.png'), 'text', class_='intro lead'),
+                Div(Img(src='b.png', alt=''), class_='gallery'),
+                ),
+            Img(src='c.png'),
+            A('home', href='/'),
+            A('external', href='http://example.com/x', rel='nofollow noopener'),
+            A('anchor'),
+            Ul(Li('a', lang='en-US'), Li('b', lang='en'), Li('c', lang='fr')),
+            Script(async_=True, src='x.js'),
+            ),
+        )
+
+def _src(elements):
+    return [element.attributes['src'] for element in elements]
+
+@pytest.mark.parametrize("selector, expected", [
+    ('img', ['a.png', 'b.png', 'c.png']),
+    ('IMG', ['a.png', 'b.png', 'c.png']),
+    ('article img', ['a.png', 'b.png']),
+    ('article > img', []),
+    ('article > p > img', ['a.png']),
+    ('body > img', ['c.png']),
+    ('.gallery img', ['b.png']),
+    ('div.gallery > img[alt]', ['b.png']),
+    ('img[src$=".png"]', ['a.png', 'b.png', 'c.png']),
+    ('img[src^=b]', ['b.png']),
+    ("img[src*='c']", ['c.png']),
+    ('body > img, article img', ['a.png', 'b.png', 'c.png']),
+    ('html body article p img', ['a.png']),
+    ])
+def test_select_img(selector, expected):
+    assert _src(_doc().select(selector)) == expected
+
+@pytest.mark.parametrize("selector, expected", [
+    ('a[href]', ['home', 'external']),
+    ('a[href="/"]', ['home']),
+    ('a[rel~=noopener]', ['external']),
+    ('a:not-supported', None),
+    ])
+def test_select_links(selector, expected):
+    if expected is None:
+        with pytest.raises(ValueError):
+            _doc().select(selector)
+    else:
+        assert [element.children()[0] for element in _doc().select(selector)] == expected
+
+def test_select_misc():
+    doc = _doc()
+    assert [li.children()[0] for li in doc.select('li[lang|=en]')] == ['a', 'b']
+    assert doc.select('#title') == [doc.find_by_id('title')]
+    assert doc.select('p.intro.lead')[0].tag == 'p'
+    assert doc.select('p.intro.other') == []
+    assert len(doc.select('script[async]')) == 1
+    assert len(doc.select('script[async=""]')) == 1
+    assert len(doc.select('*')) == 19
+    assert doc.select('html') == []
+
+def test_select_one():
+    doc = _doc()
+    assert doc.select_one('img').attributes['src'] == 'a.png'
+    assert doc.select_one('body > img, .gallery img').attributes['src'] == 'b.png'
+    assert doc.select_one('video') is None
+
+def test_select_after_change():
+    doc = _doc()
+    assert len(doc.select('img')) == 3
+    doc.body.append(Img(src='d.png', class_='new'))
+    assert len(doc.select('img')) == 4
+    doc.select_one('img.new').attributes['class'] = 'newer'
+    assert doc.select('.new') == []
+    assert len(doc.select('.newer')) == 1
+
+def test_select_lazy_loading():
+    doc = _doc()
+    for img in doc.select('article img'):
+        img.attributes['loading'] = 'lazy'
+    assert len(doc.select('img[loading=lazy]')) == 2
+
+@pytest.mark.parametrize("value", [uuid.UUID('a1c19bc5-59b6-4a7c-b5a4-3c6f1b0a2d7e'), 12])
+def test_select_non_str_id(value):
+    doc = Div(P('x', id=value), Span(id=str(value)))
+    expected = doc.children()
+    assert doc.select('#%s' % value) == expected
+    assert doc.select('p#%s' % value) == expected[:1]
+    assert doc.select('[id="%s"]' % value) == expected
+    assert doc.select_one('#%s' % value) is expected[0]
+
+@pytest.mark.parametrize("search", [
+    lambda doc: doc.select('p'),
+    lambda doc: doc.select_one('#title'),
+    lambda doc: doc.duplicate_ids(),
+    ])
+def test_select_index_collected(search):
+    import gc
+    import weakref
+    doc = Div(H1('title', id='title'), P('text'), id='doc')
+    search(doc)
+    doc_ref = weakref.ref(doc)
+    del doc
+    gc.collect()
+    assert doc_ref() is None
+
+@pytest.mark.parametrize("selector", ['', '>', 'a >', 'a,', 'a[', 'a b[c=d'])
+def test_compile_invalid(selector):
+    with pytest.raises(ValueError):
+        compile_selector(selector)
+
+def test_compile_cached():
+    assert compile_selector('a b') is compile_selector('a b')
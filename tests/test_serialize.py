@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+
+import pickle
+import struct
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from pythtml import *
+from pythtml import Markup
+from pythtml import elements
+from pythtml.serialize import dumps, loads
+
+
+def _document():
+    return Html(
+        Head(Title('report & summary')),
+        Body(
+            H1('report', class_='title'),
+            Table(
+                Tbody(*(Tr(Td(i, class_='n'), Td('row %d' % i), 'text') for i in range(20))),
+                ),
+            Input(type='checkbox', checked=True, value=1, step=0.5),
+            P('price: ', 1.5, ' ', Markup('<b>bold</b>'), ' é — 日本語 \U0001f600'),
+            Raw('<!-- raw -->'),
+            Slot('name', escape_data=True),
+            AutoEscape(Div('a < b', Script('if (a < b) {}'))),
+            ),
+        lang='en',
+        )
+
+def test_round_trip():
+    doc = _document()
+    copy = loads(dumps(doc))
+    assert copy is not doc
+    assert str(copy) == str(doc)
+    assert bytes(copy) == bytes(doc)
+
+def test_round_trip_types():
+    copy = loads(dumps(_document()))
+    body = copy.body
+    assert type(body) is Body
+    assert copy.head is copy.children()[0]
+    assert copy.encoding == 'utf-8'
+    paragraph = body.children(tag='p')[0]
+    assert [type(x) for x in paragraph.children()] == [str, float, str, Markup, str]
+    attributes = body.children(tag='input')[0].attributes
+    assert attributes == {'type': 'checkbox', 'checked': True, 'value': 1, 'step': 0.5}
+    assert [type(x) for x in attributes.values()] == [str, bool, int, float]
+    slot = body.children(tag=None)[5]
+    assert slot.name == 'name'
+    assert slot.escape_data
+    assert str(slot) == '{name}'
+
+def test_round_trip_false_attribute():
+    div = Div()
+    div.attributes['hidden'] = False
+    div.attributes['data-n'] = 0
+    copy = loads(dumps(div))
+    assert copy.attributes == {'hidden': False, 'data-n': 0}
+    assert str(copy) == str(div)
+
+def test_round_trip_other_values():
+    class Value:
+        def __str__(self):
+            return 'value'
+
+    div = Div(Value(), title=Value())
+    copy = loads(dumps(div))
+    assert copy.children() == ['value']
+    assert copy.attributes == {'title': 'value'}
+    assert str(copy) == str(div)
+
+def test_round_trip_equal_values():
+    from decimal import Decimal
+    div = Div(Input(value=Decimal('1.0')), Input(value=Decimal('1.00')), 0.0, -0.0)
+    assert str(loads(dumps(div))) == str(div) == '<div><input value="1.0"><input value="1.00">0.0-0.0</div>'
+
+def test_round_trip_many_attribute_sets(monkeypatch):
+    from pythtml import serialize
+    # attribute set numbers from 2 on are stored as ops of their own.
+    monkeypatch.setattr(serialize, '_LONG_ATTRIBUTE_SET', 2)
+    doc = _document()
+    doc.body.append(Raw('<br>'))
+    doc.body.children(tag=None)[-1].attributes['title'] = 'raw'
+    copy = loads(dumps(doc))
+    assert str(copy) == str(doc)
+    assert copy.body.children(tag='input')[0].attributes == {'type': 'checkbox', 'checked': True, 'value': 1, 'step': 0.5}
+
+def test_round_trip_is_independent():
+    doc = _document()
+    str(doc)
+    str(doc)
+    copy = loads(dumps(doc))
+    copy.body.append(P('new'))
+    copy.body.children()[0].attributes['class'] = 'other'
+    assert 'new' not in str(doc)
+    assert '<p>new</p>' in str(copy)
+    assert str(copy) == str(copy)
+    assert '<h1 class="other">' in str(copy)
+
+def test_shared_attributes_are_copied():
+    copy = loads(dumps(Div(P('a', class_='x'), P('b', class_='x'))))
+    first, second = copy.children()
+    assert first.attributes is not second.attributes
+    first.attributes['class'] = 'y'
+    assert second.attributes == {'class': 'x'}
+
+def test_deep_tree():
+    root = element = Div()
+    for _ in range(5000):
+        child = Div()
+        element.append(child)
+        element = child
+    assert str(loads(dumps(root))) == str(root)
+
+def test_smaller_than_pickle():
+    doc = Tbody(*(Tr(Td('%d' % i, class_='cell'), Td('x', class_='cell')) for i in range(1000)))
+    assert len(dumps(doc)) < len(pickle.dumps(doc, protocol=pickle.HIGHEST_PROTOCOL))
+
+def test_in_other_process():
+    doc = _document()
+    with ProcessPoolExecutor(1) as executor:
+        assert executor.submit(_render, dumps(doc)).result() == str(doc)
+
+def _render(data):
+    return str(loads(data))
+
+@pytest.mark.parametrize('element', [
+    Lazy(['a']),
+    Cached('key', lambda: 'a'),
+    Div(Lazy(['a'])),
+    Table.from_rows([('a',)]),
+    ])
+def test_dumps_unsupported(element):
+    with pytest.raises(ValueError):
+        dumps(element)
+
+def test_dumps_unsupported_class():
+    class Custom(Div):
+        __slots__ = ()
+
+    with pytest.raises(ValueError, match='Custom'):
+        dumps(Div(Custom()))
+
+def test_dumps_async_child():
+    async def child():
+        return 'a'
+
+    coroutine = child()
+    with pytest.raises(ValueError):
+        dumps(Div(coroutine))
+    coroutine.close()
+
+def test_dumps_not_element():
+    with pytest.raises(TypeError):
+        dumps('text')
+
+def test_dumps_html_without_body():
+    doc = Html(Head(), Body())
+    doc.remove(doc.body)
+    with pytest.raises(ValueError):
+        dumps(doc)
+
+@pytest.mark.parametrize('data', [
+    b'',
+    b'PYHT',
+    b'XXXX' + dumps(Div())[4:],
+    dumps(Div('a'))[:-1],
+    dumps(Div('a')) + b'\0',
+    ])
+def test_loads_invalid(data):
+    with pytest.raises(ValueError):
+        loads(data)
+
+def test_loads_other_version():
+    data = bytearray(dumps(Div()))
+    struct.pack_into('<I', data, 5, 0)
+    with pytest.raises(ValueError, match='version'):
+        loads(bytes(data))
+
+def test_loads_corrupt_ops():
+    data = bytearray(dumps(Div(P('a'))))
+    # replace the last end op with a child.
+    data[-5:-1] = struct.pack('<i', 0)
+    with pytest.raises(ValueError):
+        loads(bytes(data))
+
+def test_loads_unsupported_class():
+    data = bytearray(dumps(Div()))
+    # the op of the div, with the class code of Lazy.
+    data[-8:-4] = struct.pack('<i', -2 - elements.__all__.index('Lazy'))
+    with pytest.raises(ValueError):
+        loads(bytes(data))
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+
+import pytest
+
+from pythtml import *
+from pythtml.template import compile
+
+
+def test_compile_render():
+    template = compile(P('You are logged in as ', Slot('username'), '.', class_='welcome'))
+    assert template.render(username='poindexter') == '<p class="welcome">You are logged in as poindexter.</p>'
+
+def test_compile_literal_braces():
+    template = compile(Div(Script(Raw('function f() { return {a: 1}; }')), Span(Slot('x'))))
+    assert template.render(x='y') == '<div><script>function f() { return {a: 1}; }</script><span>y</span></div>'
+
+def test_compile_escape():
+    template = compile(Div(Slot('raw'), Slot('text', escape_data=True)))
+    assert template.render(raw='<b>', text='<b> & c') == '<div><b>&lt;b&gt; &amp; c</div>'
+
+def test_compile_escape_markup():
+    from pythtml import Markup
+    template = compile(Div(Slot('text', escape_data=True)))
+    assert template.render(text=Markup('<b>&amp;</b>')) == '<div><b>&amp;</b></div>'
+
+def test_compile_auto_escape():
+    template = compile(AutoEscape(Div('a & b', Slot('x'))))
+    assert template.render(x='<b>') == '<div>a &amp; b&lt;b&gt;</div>'
+
+def test_compile_auto_escape_values():
+    from pythtml import Markup
+    template = compile(Div(AutoEscape(P(Slot('x')), Script(Slot('y'))), Slot('z')))
+    assert template.render(x=Markup('<b>'), y='a < b', z='<i>') == '<div><p><b></p><script>a < b</script><i></div>'
+    assert template.render(x=B('a < b'), y='', z=B('a < b')) == '<div><p><b>a &lt; b</b></p><script></script><b>a < b</b></div>'
+
+def test_compile_element_value():
+    template = compile(Div(Slot('content', escape_data=True)))
+    assert template.render(content=B('bold')) == '<div><b>bold</b></div>'
+
+def test_compile_repeated_slot():
+    template = compile(Div(Slot('x'), Hr(), Slot('y'), Slot('x')))
+    assert template.slot_names == ['x', 'y']
+    assert template.render(x=1, y=2) == '<div>1<hr></hr>21</div>'
+
+def test_compile_missing_value():
+    template = compile(Div(Slot('x')))
+    with pytest.raises(KeyError):
+        template.render()
+
+def test_compile_no_slots():
+    element = Div(P('static'))
+    template = compile(element)
+    assert template.slot_names == []
+    assert template.render() == str(element)
+
+def test_slot_str():
+    assert str(P('Hello ', Slot('name'))).format(name='you') == '<p>Hello you</p>'
+
+def test_slot_bad_name():
+    with pytest.raises(ValueError):
+        Slot('not a name')